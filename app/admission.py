@@ -0,0 +1,93 @@
+import math
+import time
+from dataclasses import dataclass
+from typing import Optional
+
+from app import metrics
+from app.config import settings
+from app.lanes import scheduler as lane_scheduler
+from app.offload import loop_lag_monitor
+
+# Retry-After for overload rejections, which have no refill time to point at.
+OVERLOAD_RETRY_AFTER_SECONDS = 1
+
+
+class TokenBucket:
+    # rate tokens per second up to burst; rate 0 admits everything.
+    def __init__(self, rate: float, burst: float) -> None:
+        self.rate = rate
+        self.burst = max(1.0, burst or rate)
+        self.tokens = self.burst
+        self.updated: Optional[float] = None
+
+    def wait_time(self, now: float) -> float:
+        # Seconds until a token is available (0 when one is), refilling as of now.
+        if not self.rate:
+            return 0.0
+        if self.updated is None or now > self.updated:
+            if self.updated is not None:
+                self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+        return 0.0 if self.tokens >= 1 else (1 - self.tokens) / self.rate
+
+    def take(self) -> None:
+        if self.rate:
+            self.tokens -= 1
+
+
+@dataclass
+class Rejection:
+    status_code: int
+    reason: str
+    retry_after: int
+
+
+class Admission:
+    # Per-worker gate in front of ingest, O(1) per request: overload checks first (in-flight
+    # ingests, event-loop lag, queued outbound sends), then the producer's own bucket and the
+    # global one. Buckets are only charged when the request is admitted.
+    def __init__(self) -> None:
+        self.in_flight = 0
+        self.global_bucket = TokenBucket(settings.ingest_rate_per_second, settings.ingest_burst)
+        # Keys are token sources, so the number of buckets is bounded by INBOUND_TOKENS.
+        self.source_buckets: dict[str, TokenBucket] = {}
+
+    def _source_bucket(self, source: str) -> TokenBucket:
+        bucket = self.source_buckets.get(source)
+        if bucket is None:
+            bucket = self.source_buckets[source] = TokenBucket(
+                settings.ingest_source_rate_per_second, settings.ingest_source_burst
+            )
+        return bucket
+
+    def _overloaded(self) -> Optional[str]:
+        if settings.ingest_max_in_flight and self.in_flight >= settings.ingest_max_in_flight:
+            return "in_flight"
+        if settings.ingest_shed_loop_lag_ms and loop_lag_monitor.last * 1000 >= settings.ingest_shed_loop_lag_ms:
+            return "loop_lag"
+        if settings.ingest_shed_queue_depth and lane_scheduler.queued >= settings.ingest_shed_queue_depth:
+            return "queue_depth"
+        return None
+
+    def try_enter(self, source: str, now: Optional[float] = None) -> Optional[Rejection]:
+        reason = self._overloaded()
+        if reason:
+            return Rejection(503, reason, OVERLOAD_RETRY_AFTER_SECONDS)
+        now = time.monotonic() if now is None else now
+        source_bucket = self._source_bucket(source)
+        for bucket, reason in ((source_bucket, "source_rate"), (self.global_bucket, "global_rate")):
+            wait = bucket.wait_time(now)
+            if wait:
+                return Rejection(429, reason, max(1, math.ceil(wait)))
+        source_bucket.take()
+        self.global_bucket.take()
+        self.in_flight += 1
+        metrics.ingest_in_flight.set(self.in_flight)
+        return None
+
+    def leave(self) -> None:
+        self.in_flight -= 1
+        metrics.ingest_in_flight.set(self.in_flight)
+
+
+admission = Admission()
@@ -9,14 +9,77 @@ class Settings:
     app_port: int = int(os.getenv("APP_PORT", "8000"))
     database_url: str = os.getenv("DATABASE_URL", "sqlite:///./data/app.db")
     inbound_token: str = os.getenv("INBOUND_TOKEN", "change-me-token")
+    # Extra per-producer tokens, "source:token,source:token"; each token's signals carry that
+    # source and only reach rules scoped to it (or unscoped rules).
+    inbound_tokens: str = os.getenv("INBOUND_TOKENS", "")
     admin_username: str = os.getenv("ADMIN_USERNAME", "admin")
     admin_password: str = os.getenv("ADMIN_PASSWORD", "change-me-password")
     fernet_key: str = os.getenv("FERNET_KEY", "")
     log_level: str = os.getenv("LOG_LEVEL", "INFO")
+    sqlite_busy_timeout_ms: int = int(os.getenv("SQLITE_BUSY_TIMEOUT_MS", "5000"))
     session_secret: str = os.getenv("SESSION_SECRET", "change-me-session-secret")
     admin_session_ttl_seconds: int = int(os.getenv("ADMIN_SESSION_TTL_SECONDS", "28800"))
     # WeCom image/file style payloads can be much larger than plain text.
     max_webhook_payload_bytes: int = int(os.getenv("MAX_WEBHOOK_PAYLOAD_BYTES", "5242880"))
+    # Batch ingest applies the per-item limit above plus these whole-request limits.
+    max_webhook_batch_bytes: int = int(os.getenv("MAX_WEBHOOK_BATCH_BYTES", "67108864"))
+    max_webhook_batch_items: int = int(os.getenv("MAX_WEBHOOK_BATCH_ITEMS", "10000"))
+
+    # When set, /metrics requires "Authorization: Bearer <METRICS_TOKEN>". Without it only
+    # loopback clients and logged-in admins may scrape, unless METRICS_PUBLIC=1.
+    metrics_token: str = os.getenv("METRICS_TOKEN", "")
+    metrics_public: bool = os.getenv("METRICS_PUBLIC", "0") == "1"
+    # Fraction of signals that record stage timings; TRACE_EXPORT_PATH appends OTLP/JSON spans.
+    trace_sample_rate: float = float(os.getenv("TRACE_SAMPLE_RATE", "0.01"))
+    trace_export_path: str = os.getenv("TRACE_EXPORT_PATH", "")
+    # Default per-request timeout for WeCom sends; a target line may override it ("<url> <seconds>").
+    outbound_timeout_seconds: float = float(os.getenv("OUTBOUND_TIMEOUT_SECONDS", "5.0"))
+    # Concurrent outbound sends per worker (also the HTTP pool size); the reserved share and
+    # part of each robot's 20/minute quota are kept for rules in the urgent lane.
+    outbound_concurrency: int = int(os.getenv("OUTBOUND_CONCURRENCY", "100"))
+    urgent_reserved_concurrency: int = int(os.getenv("URGENT_RESERVED_CONCURRENCY", "10"))
+    urgent_rate_reserve: int = int(os.getenv("URGENT_RATE_RESERVE", "5"))
+    # Sends per robot per minute across all workers (WeCom's own limit is 20), split evenly by
+    # WEB_CONCURRENCY; 0 turns it off. Over-budget sends wait up to WECOM_RATE_MAX_WAIT_SECONDS.
+    wecom_rate_limit_per_minute: int = int(os.getenv("WECOM_RATE_LIMIT_PER_MINUTE", "0"))
+    wecom_rate_max_wait_seconds: float = float(os.getenv("WECOM_RATE_MAX_WAIT_SECONDS", "30"))
+    # Per-target circuit breaker: open when the failure rate over the last CIRCUIT_WINDOW sends
+    # (at least CIRCUIT_MIN_REQUESTS) reaches CIRCUIT_FAILURE_RATE; probe again after the cooldown.
+    circuit_window: int = int(os.getenv("CIRCUIT_WINDOW", "20"))
+    circuit_min_requests: int = int(os.getenv("CIRCUIT_MIN_REQUESTS", "5"))
+    circuit_failure_rate: float = float(os.getenv("CIRCUIT_FAILURE_RATE", "0.5"))
+    circuit_cooldown_seconds: float = float(os.getenv("CIRCUIT_COOLDOWN_SECONDS", "30"))
+    # Rows per transaction when an online migration backfills a column.
+    migration_batch_size: int = int(os.getenv("MIGRATION_BATCH_SIZE", "1000"))
+    # Live signal stream: events buffered per viewer before a slow one is disconnected, and how
+    # often each worker tails the history tables when WEB_CONCURRENCY > 1.
+    live_buffer_size: int = int(os.getenv("LIVE_BUFFER_SIZE", "256"))
+    live_poll_interval_seconds: float = float(os.getenv("LIVE_POLL_INTERVAL_SECONDS", "1.0"))
+    web_concurrency: int = int(os.getenv("WEB_CONCURRENCY") or "1")
+    # Ingest admission control, per worker. Rates are requests per second (a batch counts once);
+    # 0 disables a limit. Over a rate: 429; over in-flight, loop lag or queued sends: 503.
+    ingest_rate_per_second: float = float(os.getenv("INGEST_RATE_PER_SECOND", "0"))
+    ingest_burst: float = float(os.getenv("INGEST_BURST", "0"))
+    ingest_source_rate_per_second: float = float(os.getenv("INGEST_SOURCE_RATE_PER_SECOND", "0"))
+    ingest_source_burst: float = float(os.getenv("INGEST_SOURCE_BURST", "0"))
+    ingest_max_in_flight: int = int(os.getenv("INGEST_MAX_IN_FLIGHT", "256"))
+    ingest_shed_loop_lag_ms: float = float(os.getenv("INGEST_SHED_LOOP_LAG_MS", "1000"))
+    ingest_shed_queue_depth: int = int(os.getenv("INGEST_SHED_QUEUE_DEPTH", "5000"))
+    # Inbound decode/parse/serialize runs off the event loop for bodies of at least
+    # OFFLOAD_THREAD_MIN_BYTES (thread pool) or OFFLOAD_PROCESS_MIN_BYTES (process pool); 0 disables either.
+    offload_thread_min_bytes: int = int(os.getenv("OFFLOAD_THREAD_MIN_BYTES", "65536"))
+    offload_process_min_bytes: int = int(os.getenv("OFFLOAD_PROCESS_MIN_BYTES", "0"))
+    offload_workers: int = int(os.getenv("OFFLOAD_WORKERS", "2"))
+    delivery_purge_chunk_size: int = int(os.getenv("DELIVERY_PURGE_CHUNK_SIZE", "1000"))
+    # How often each worker folds deliveries routed without a rollup (old workers mid-deploy).
+    rollup_catch_up_interval_seconds: float = float(os.getenv("ROLLUP_CATCH_UP_INTERVAL_SECONDS", "60"))
+    # Rule dry-runs read history in chunks; more than one worker fans chunks out to a process pool.
+    replay_chunk_size: int = int(os.getenv("REPLAY_CHUNK_SIZE", "5000"))
+    replay_workers: int = int(os.getenv("REPLAY_WORKERS", "1"))
+    # The admin page replays inside the request: without a start time it covers the last
+    # REPLAY_UI_DEFAULT_HOURS, and it stops after REPLAY_UI_MAX_SIGNALS (the CLI has no cap).
+    replay_ui_default_hours: int = int(os.getenv("REPLAY_UI_DEFAULT_HOURS", "24"))
+    replay_ui_max_signals: int = int(os.getenv("REPLAY_UI_MAX_SIGNALS", "50000"))
 
 
 settings = Settings()
@@ -1,13 +1,66 @@
-from sqlmodel import Session, SQLModel, create_engine
+import fcntl
+import hashlib
+import logging
+import os
+import tempfile
+from contextlib import contextmanager
+from typing import Iterator
+
+from sqlalchemy import event
+from sqlmodel import Session, create_engine
 
 from app.config import settings
 
+logger = logging.getLogger(__name__)
+
 connect_args = {"check_same_thread": False} if settings.database_url.startswith("sqlite") else {}
 engine = create_engine(settings.database_url, echo=False, connect_args=connect_args)
 
+if settings.database_url.startswith("sqlite"):
+
+    @event.listens_for(engine, "connect")
+    def _configure_sqlite(dbapi_connection, _connection_record) -> None:
+        # WAL lets readers run alongside the single writer; busy_timeout makes writers from
+        # other worker processes wait for the lock instead of failing with "database is locked".
+        cursor = dbapi_connection.cursor()
+        cursor.execute("PRAGMA journal_mode=WAL")
+        cursor.execute(f"PRAGMA busy_timeout={settings.sqlite_busy_timeout_ms}")
+        cursor.close()
+
+
+@contextmanager
+def process_lock(name: str, blocking: bool = True) -> Iterator[bool]:
+    # Host-wide lock shared by every worker process serving the same database.
+    digest = hashlib.sha256(settings.database_url.encode("utf-8")).hexdigest()[:16]
+    path = os.path.join(tempfile.gettempdir(), f"signal-router-{digest}-{name}.lock")
+    with open(path, "a") as handle:
+        try:
+            fcntl.flock(handle, fcntl.LOCK_EX if blocking else fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            yield False
+            return
+        try:
+            yield True
+        finally:
+            fcntl.flock(handle, fcntl.LOCK_UN)
+
 
 def init_db() -> None:
-    SQLModel.metadata.create_all(engine)
+    # Versioned migrations live in app.migrations; startup only applies the offline ones and
+    # costs a single lookup when the schema is already current.
+    from app.migrations import MIGRATIONS, applied_versions, upgrade
+
+    applied = applied_versions(engine)
+    if any(item.version not in applied for item in MIGRATIONS if not item.online):
+        upgrade(include_online=False)
+        applied = applied_versions(engine)
+    online = [item.name for item in MIGRATIONS if item.version not in applied]
+    if online:
+        logger.warning(
+            "%s online migration(s) pending (%s); run: python -m app.migrations upgrade",
+            len(online),
+            ", ".join(online),
+        )
 
 
 def get_session():
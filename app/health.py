@@ -0,0 +1,120 @@
+import time
+from collections import deque
+from typing import Any, Optional
+
+from app import metrics
+from app.config import settings
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+# Weight of the newest sample in the latency moving average.
+LATENCY_EWMA_ALPHA = 0.2
+
+# WeCom errcode for "too many calls": the robot works, this worker is just sending too fast.
+WECOM_RATE_LIMITED_ERRCODE = "45009"
+
+
+class CircuitBreaker:
+    # Failure-rate breaker over the last N sends to one target. While open, sends are skipped
+    # until the cooldown passes; then a single probe decides whether to close or re-open.
+    def __init__(self, target_masked: str) -> None:
+        self.target_masked = target_masked
+        self.state = CLOSED
+        self.outcomes: deque[bool] = deque(maxlen=settings.circuit_window)
+        self.latency_ewma: Optional[float] = None
+        self.opened_at = 0.0
+        self.probe_in_flight = False
+        self.last_error: Optional[str] = None
+
+    def allow(self, now: Optional[float] = None) -> bool:
+        if self.state == CLOSED:
+            return True
+        now = time.monotonic() if now is None else now
+        if self.state == OPEN and now - self.opened_at >= settings.circuit_cooldown_seconds:
+            self.state = HALF_OPEN
+        if self.state == HALF_OPEN and not self.probe_in_flight:
+            self.probe_in_flight = True
+            return True
+        return False
+
+    def record(
+        self,
+        ok: bool,
+        latency: float,
+        error: Optional[str] = None,
+        now: Optional[float] = None,
+        probe: bool = False,
+    ) -> None:
+        # probe: this send was the one allow() let through while half-open. Only its result
+        # decides the half-open state; a send that started before the circuit opened and
+        # finishes late must not close or re-open it.
+        now = time.monotonic() if now is None else now
+        if self.latency_ewma is None:
+            self.latency_ewma = latency
+        else:
+            self.latency_ewma += LATENCY_EWMA_ALPHA * (latency - self.latency_ewma)
+        if not ok:
+            self.last_error = error
+        if self.state == HALF_OPEN:
+            if not probe:
+                return
+            self.probe_in_flight = False
+            if ok:
+                self.outcomes.clear()
+                self._transition(CLOSED, now)
+            else:
+                self._transition(OPEN, now)
+            return
+        self.outcomes.append(ok)
+        if (
+            self.state == CLOSED
+            and len(self.outcomes) >= settings.circuit_min_requests
+            and self.failure_rate() >= settings.circuit_failure_rate
+        ):
+            self._transition(OPEN, now)
+
+    def release(self) -> None:
+        # Frees a half-open probe that ended without an outcome (cancelled, rate limited), so
+        # the next send can probe again.
+        self.probe_in_flight = False
+
+    def failure_rate(self) -> float:
+        if not self.outcomes:
+            return 0.0
+        return self.outcomes.count(False) / len(self.outcomes)
+
+    def _transition(self, state: str, now: float) -> None:
+        self.state = state
+        if state == OPEN:
+            self.opened_at = now
+        metrics.outbound_circuit_open.set(1.0 if state == OPEN else 0.0, self.target_masked)
+
+    def snapshot(self) -> dict[str, Any]:
+        return {
+            "state": self.state,
+            "requests": len(self.outcomes),
+            "failure_rate": round(self.failure_rate() * 100, 1),
+            "latency_ms": round(self.latency_ewma * 1000, 1) if self.latency_ewma is not None else None,
+            "last_error": self.last_error,
+        }
+
+
+class TargetHealth:
+    # Per-process, keyed by the decrypted target URL; each worker learns target health on its own.
+    def __init__(self) -> None:
+        self._breakers: dict[str, CircuitBreaker] = {}
+
+    def breaker(self, target: str, target_masked: str) -> CircuitBreaker:
+        breaker = self._breakers.get(target)
+        if breaker is None:
+            breaker = self._breakers[target] = CircuitBreaker(target_masked)
+        return breaker
+
+    def snapshot(self, target: str) -> Optional[dict[str, Any]]:
+        breaker = self._breakers.get(target)
+        return breaker.snapshot() if breaker else None
+
+
+target_health = TargetHealth()
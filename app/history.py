@@ -0,0 +1,61 @@
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Any, Optional
+
+from sqlmodel import Session, select
+
+from app.models import Signal
+
+# List views never need raw_payload/parsed_fields, which can be megabytes per row.
+SIGNAL_SUMMARY_COLUMNS = (
+    Signal.id,
+    Signal.received_at,
+    Signal.source,
+    Signal.match_count,
+    Signal.delivery_count,
+)
+
+
+@dataclass
+class SignalFilters:
+    source: Optional[str] = None
+    since: Optional[datetime] = None
+    until: Optional[datetime] = None
+    matched: Optional[bool] = None
+    delivered: Optional[bool] = None
+
+
+def query_signal_summaries(
+    session: Session,
+    filters: SignalFilters,
+    before_id: Optional[int],
+    limit: int,
+) -> tuple[list[Any], Optional[int]]:
+    statement = select(*SIGNAL_SUMMARY_COLUMNS)
+    if filters.source:
+        statement = statement.where(Signal.source == filters.source)
+    if filters.since:
+        statement = statement.where(Signal.received_at >= filters.since)
+    if filters.until:
+        statement = statement.where(Signal.received_at < filters.until)
+    if filters.matched is not None:
+        statement = statement.where(Signal.match_count > 0 if filters.matched else Signal.match_count == 0)
+    if filters.delivered is not None:
+        statement = statement.where(Signal.delivery_count > 0 if filters.delivered else Signal.delivery_count == 0)
+    # Keyset pagination: ids grow with received_at, so "id < cursor" replaces OFFSET scans.
+    if before_id is not None:
+        statement = statement.where(Signal.id < before_id)
+
+    rows = session.exec(statement.order_by(Signal.id.desc()).limit(limit + 1)).all()
+    next_before_id = rows[limit - 1].id if len(rows) > limit else None
+    return list(rows[:limit]), next_before_id
+
+
+def signal_summary_to_dict(row: Any) -> dict[str, Any]:
+    return {
+        "id": row.id,
+        "received_at": row.received_at.isoformat(),
+        "source": row.source,
+        "match_count": row.match_count,
+        "delivery_count": row.delivery_count,
+    }
@@ -0,0 +1,164 @@
+import asyncio
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Optional
+
+from app import metrics
+from app.config import settings
+
+# WeCom group robots accept at most 20 messages per minute each.
+WECOM_MESSAGES_PER_MINUTE = 20
+
+URGENT = "urgent"
+NORMAL = "normal"
+BULK = "bulk"
+LANES = (URGENT, NORMAL, BULK)
+# Share of freed slots normal and bulk get while both are queued; urgent always goes first.
+LANE_WEIGHTS = {NORMAL: 3, BULK: 1}
+
+
+def normalize_lane(lane: Optional[str]) -> str:
+    # Rules created before lanes existed have NULL until the backfill migration has run.
+    return lane if lane in LANES else NORMAL
+
+
+class LaneScheduler:
+    # Per-worker admission to outbound sends. At most `slots` sends run at once and the last
+    # `reserved` of them only serve the urgent lane. Queued urgent sends jump ahead of any
+    # queued normal/bulk work; normal and bulk share what is left by smooth weighted
+    # round-robin, so a news burst cannot starve either of the others.
+    def __init__(self, slots: int, reserved: int) -> None:
+        self.slots = max(1, slots)
+        self.reserved = min(max(0, reserved), self.slots - 1)
+        self.in_use = 0
+        self.waiters: dict[str, deque[asyncio.Future]] = {lane: deque() for lane in LANES}
+        self._credits = dict.fromkeys(LANE_WEIGHTS, 0)
+
+    @property
+    def queued(self) -> int:
+        return sum(len(waiters) for waiters in self.waiters.values())
+
+    def _capacity(self, lane: str) -> int:
+        return self.slots if lane == URGENT else self.slots - self.reserved
+
+    def _must_queue(self, lane: str) -> bool:
+        if self.in_use >= self._capacity(lane):
+            return True
+        # Free capacity with non-empty queues only happens for urgent (reserved slots).
+        return any(self.waiters[name] for name in ((URGENT,) if lane == URGENT else LANES))
+
+    def _next_lane(self) -> Optional[str]:
+        if self.waiters[URGENT] and self.in_use < self._capacity(URGENT):
+            return URGENT
+        if self.in_use >= self._capacity(NORMAL):
+            return None
+        candidates = [lane for lane in LANE_WEIGHTS if self.waiters[lane]]
+        if not candidates:
+            return None
+        for lane in candidates:
+            self._credits[lane] += LANE_WEIGHTS[lane]
+        chosen = max(candidates, key=lambda lane: self._credits[lane])
+        self._credits[chosen] -= sum(LANE_WEIGHTS[lane] for lane in candidates)
+        return chosen
+
+    def _wake(self) -> None:
+        while True:
+            lane = self._next_lane()
+            if lane is None:
+                return
+            waiter = self.waiters[lane].popleft()
+            metrics.lane_queue_depth.set(len(self.waiters[lane]), lane)
+            if waiter.done():
+                continue
+            self.in_use += 1
+            waiter.set_result(None)
+
+    def _release(self) -> None:
+        self.in_use -= 1
+        self._wake()
+
+    @asynccontextmanager
+    async def slot(self, lane: str) -> AsyncIterator[None]:
+        started = time.perf_counter()
+        if self._must_queue(lane):
+            waiter = asyncio.get_running_loop().create_future()
+            self.waiters[lane].append(waiter)
+            metrics.lane_queue_depth.set(len(self.waiters[lane]), lane)
+            try:
+                await waiter
+            except asyncio.CancelledError:
+                if waiter.done() and not waiter.cancelled():
+                    # The slot was handed over just as we were cancelled; pass it on.
+                    self._release()
+                elif waiter in self.waiters[lane]:
+                    self.waiters[lane].remove(waiter)
+                    metrics.lane_queue_depth.set(len(self.waiters[lane]), lane)
+                raise
+        else:
+            self.in_use += 1
+        metrics.lane_wait_seconds.observe(time.perf_counter() - started, lane)
+        try:
+            yield
+        finally:
+            self._release()
+
+
+class RateBudget:
+    # Sliding-window send count per target. Normal and bulk sends stop short of the limit by
+    # `reserve`, so a burst of them cannot use up the quota an urgent signal needs; over
+    # budget they wait for the window to free up rather than being dropped.
+    def __init__(self, per_minute: int, reserve: int, window: float = 60.0) -> None:
+        self.per_minute = per_minute
+        self.reserve = min(max(0, reserve), per_minute)
+        self.window = window
+        self._sent: dict[str, deque[float]] = {}
+
+    def wait_time(self, target: str, lane: str, now: float) -> float:
+        # Seconds until this lane may send to the target (0 when it may now).
+        sent = self._sent.setdefault(target, deque())
+        while sent and now - sent[0] >= self.window:
+            sent.popleft()
+        limit = self.per_minute if lane == URGENT else self.per_minute - self.reserve
+        if len(sent) < limit:
+            return 0.0
+        if limit <= 0:
+            return float("inf")
+        return sent[len(sent) - limit] + self.window - now
+
+    def try_acquire(self, target: str, lane: str, now: Optional[float] = None) -> bool:
+        if not self.per_minute:
+            return True
+        now = time.monotonic() if now is None else now
+        if self.wait_time(target, lane, now):
+            return False
+        self._sent[target].append(now)
+        return True
+
+    async def acquire(self, target: str, lane: str, max_wait: float) -> bool:
+        # False only when the send would have to wait longer than max_wait.
+        if not self.per_minute:
+            return True
+        deadline = time.monotonic() + max_wait
+        while True:
+            now = time.monotonic()
+            wait = self.wait_time(target, lane, now)
+            if not wait:
+                self._sent[target].append(now)
+                return True
+            if now + wait > deadline:
+                return False
+            await asyncio.sleep(wait)
+
+
+def worker_rate_budget() -> RateBudget:
+    # WeCom's limit is per robot across every worker, so each worker enforces an equal share.
+    total = settings.wecom_rate_limit_per_minute
+    if not total:
+        return RateBudget(0, 0)
+    share = max(1, total // max(1, settings.web_concurrency))
+    return RateBudget(share, settings.urgent_rate_reserve * share // total)
+
+
+scheduler = LaneScheduler(settings.outbound_concurrency, settings.urgent_reserved_concurrency)
+rate_budget = worker_rate_budget()
@@ -0,0 +1,164 @@
+import asyncio
+import json
+import logging
+from collections import deque
+from typing import Any, Optional
+
+from sqlalchemy import func
+from sqlmodel import Session, select
+
+from app import metrics
+from app.config import settings
+from app.db import engine
+from app.history import SIGNAL_SUMMARY_COLUMNS, signal_summary_to_dict
+from app.models import Delivery, Signal
+
+logger = logging.getLogger(__name__)
+
+# Event keys remembered for de-duplication between local publishes and the history tail.
+RECENT_EVENT_KEYS = 4096
+# Upper bound on rows one tail poll reads, so a burst is spread over several polls.
+TAIL_BATCH_ROWS = 500
+
+
+class Subscriber:
+    def __init__(self, maxsize: int) -> None:
+        # Holds ready-to-send SSE frames, so each event is serialized once for all viewers.
+        self.queue: asyncio.Queue[str] = asyncio.Queue(maxsize=maxsize)
+        self.dropped = False
+
+
+def signal_event(signal: Any) -> dict[str, Any]:
+    return {"type": "signal", **signal_summary_to_dict(signal)}
+
+
+def routed_event(signal_id: int, match_count: int, deliveries: list[dict[str, Any]]) -> dict[str, Any]:
+    return {
+        "type": "routed",
+        "id": signal_id,
+        "match_count": match_count,
+        "delivery_count": len(deliveries),
+        "deliveries": deliveries,
+    }
+
+
+def delivery_summary(rule_id: int, target_masked: str, success: bool, status: Optional[int]) -> dict[str, Any]:
+    return {"rule_id": rule_id, "target": target_masked, "success": success, "status": status}
+
+
+def _latest_ids() -> tuple[int, int]:
+    with Session(engine) as session:
+        signal_id = session.exec(select(func.max(Signal.id))).one()
+        delivery_id = session.exec(select(func.max(Delivery.id))).one()
+    return signal_id or 0, delivery_id or 0
+
+
+def _read_new_rows(signal_cursor: int, delivery_cursor: int) -> tuple[list[dict[str, Any]], int, int]:
+    events: list[dict[str, Any]] = []
+    with Session(engine) as session:
+        signals = session.exec(
+            select(*SIGNAL_SUMMARY_COLUMNS)
+            .where(Signal.id > signal_cursor)
+            .order_by(Signal.id)
+            .limit(TAIL_BATCH_ROWS)
+        ).all()
+        deliveries = session.exec(
+            select(
+                Delivery.id,
+                Delivery.signal_id,
+                Delivery.rule_id,
+                Delivery.target_masked,
+                Delivery.success,
+                Delivery.response_status,
+            )
+            .where(Delivery.id > delivery_cursor)
+            .order_by(Delivery.id)
+            .limit(TAIL_BATCH_ROWS)
+        ).all()
+    for row in signals:
+        events.append(signal_event(row))
+        signal_cursor = row.id
+    if len(deliveries) == TAIL_BATCH_ROWS:
+        # The last signal's deliveries may continue past the limit; read them whole next time.
+        last_signal_id = deliveries[-1].signal_id
+        first_id = next(row.id for row in deliveries if row.signal_id == last_signal_id)
+        if first_id > deliveries[0].id:
+            deliveries = [row for row in deliveries if row.id < first_id]
+    grouped: dict[int, list[Any]] = {}
+    for row in deliveries:
+        grouped.setdefault(row.signal_id, []).append(row)
+        delivery_cursor = row.id
+    for signal_id, rows in grouped.items():
+        events.append(
+            routed_event(
+                signal_id,
+                len({row.rule_id for row in rows}),
+                [delivery_summary(row.rule_id, row.target_masked, row.success, row.response_status) for row in rows],
+            )
+        )
+    return events, signal_cursor, delivery_cursor
+
+
+class Broadcaster:
+    # Fans committed signal summaries out to live admin views in this worker. publish() never
+    # waits: a subscriber whose buffer is full is cut off instead of slowing down ingest.
+    def __init__(self) -> None:
+        self._subscribers: set[Subscriber] = set()
+        self._recent: deque[tuple[str, int]] = deque()
+        self._recent_keys: set[tuple[str, int]] = set()
+        self._tail: Optional[asyncio.Task] = None
+
+    @property
+    def subscriber_count(self) -> int:
+        return len(self._subscribers)
+
+    def subscribe(self) -> Subscriber:
+        subscriber = Subscriber(settings.live_buffer_size)
+        self._subscribers.add(subscriber)
+        metrics.live_subscribers.set(len(self._subscribers))
+        # Each worker only publishes its own commits; with several workers, also tail the
+        # history tables (one poll per worker, however many viewers) to see the others.
+        if settings.web_concurrency > 1 and (self._tail is None or self._tail.done()):
+            self._tail = asyncio.get_running_loop().create_task(self._tail_history())
+        return subscriber
+
+    def unsubscribe(self, subscriber: Subscriber) -> None:
+        self._subscribers.discard(subscriber)
+        metrics.live_subscribers.set(len(self._subscribers))
+
+    def publish(self, event: dict[str, Any]) -> None:
+        if not self._subscribers:
+            return
+        # A local commit and the history tail can report the same signal; send it once.
+        key = (event["type"], event["id"])
+        if key in self._recent_keys:
+            return
+        self._recent.append(key)
+        self._recent_keys.add(key)
+        if len(self._recent) > RECENT_EVENT_KEYS:
+            self._recent_keys.discard(self._recent.popleft())
+        frame = f"event: {event['type']}\ndata: {json.dumps(event, ensure_ascii=False, separators=(',', ':'))}\n\n"
+        for subscriber in list(self._subscribers):
+            try:
+                subscriber.queue.put_nowait(frame)
+            except asyncio.QueueFull:
+                subscriber.dropped = True
+                self.unsubscribe(subscriber)
+                metrics.live_dropped_total.inc()
+
+    async def _tail_history(self) -> None:
+        signal_cursor, delivery_cursor = await asyncio.to_thread(_latest_ids)
+        while self._subscribers:
+            await asyncio.sleep(settings.live_poll_interval_seconds)
+            try:
+                events, signal_cursor, delivery_cursor = await asyncio.to_thread(
+                    _read_new_rows, signal_cursor, delivery_cursor
+                )
+            except Exception:
+                logger.exception("live history tail failed")
+                continue
+            for event in events:
+                self.publish(event)
+
+
+broadcaster = Broadcaster()
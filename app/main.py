@@ -1,36 +1,110 @@
-import json
+import asyncio
+import hashlib
 import hmac
-from datetime import datetime
-from typing import Any, Optional
-from urllib.parse import urlparse
+import ipaddress
+import json
+import re
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+from functools import cached_property
+from typing import TYPE_CHECKING, Any, AsyncIterator, Iterator, Optional
+from urllib.parse import urlencode, urlparse
 
 import httpx
-from fastapi import Depends, FastAPI, Form, HTTPException, Request, status
-from fastapi.responses import HTMLResponse, JSONResponse, RedirectResponse
+from fastapi import BackgroundTasks, Depends, FastAPI, Form, HTTPException, Request, status
+from fastapi.responses import (
+    HTMLResponse,
+    JSONResponse,
+    PlainTextResponse,
+    RedirectResponse,
+    Response,
+    StreamingResponse,
+)
 from fastapi.staticfiles import StaticFiles
-from fastapi.templating import Jinja2Templates
+from sqlalchemy import func
+from sqlalchemy.exc import IntegrityError
 from sqlmodel import Session, select
 
+from app import metrics
+from app.admission import admission
 from app.config import settings
 from app.db import get_session, init_db
+from app.health import HALF_OPEN, WECOM_RATE_LIMITED_ERRCODE, target_health
+from app.history import SignalFilters, query_signal_summaries, signal_summary_to_dict
+from app.lanes import LANES, NORMAL, normalize_lane, rate_budget
+from app.lanes import scheduler as lane_scheduler
+from app.live import broadcaster, delivery_summary, routed_event, signal_event
+from app.maintenance import catch_up_rollups, purge_rule_deliveries, resume_pending_purges
+from app.metrics import wecom_errcode
 from app.models import Delivery, Rule, Signal
-from app.parser import parse_signal_fields
-from app.rules import match_rule
+from app.offload import (
+    PreparedSignal,
+    decode_json_array,
+    decode_ndjson_lines,
+    loop_lag_monitor,
+    prepare_body,
+    prepare_payloads,
+    run_offloaded,
+    shutdown_offload,
+)
+from app.outbound import close_http_client, get_http_client
+from app.parser import BatchItem, NdjsonLineSplitter
+from app.rollups import STAT_GROUPS, query_stats, record_deliveries
+from app.rule_cache import RuleCache
+from app.rules import CompiledRule, RuleIndex, RuleView, build_rule_index, match_rules
 from app.security import (
     build_csrf_token,
     build_session_token,
     decrypt_text,
     encrypt_text,
+    inbound_token_digest,
+    inbound_token_sources,
     mask_webhook,
     parse_session_token,
     verify_csrf_token,
 )
+from app.templating import (
+    TEMPLATE_MSGTYPES,
+    OutputTemplate,
+    build_output_template,
+    render_output,
+    template_context,
+)
+from app.tracing import Trace, ensure_export_dir, exporter, start_trace, waterfall_rows
+
+if TYPE_CHECKING:
+    from fastapi.templating import Jinja2Templates
+
+
+class _LazyTemplates:
+    # Only admin pages render HTML; defer jinja2 and the template loader until the first one.
+    @cached_property
+    def _templates(self) -> "Jinja2Templates":
+        from fastapi.templating import Jinja2Templates
+
+        return Jinja2Templates(directory="app/templates")
+
+    def TemplateResponse(self, *args: Any, **kwargs: Any):
+        return self._templates.TemplateResponse(*args, **kwargs)
+
 
 app = FastAPI(title="Signal Router")
 app.mount("/static", StaticFiles(directory="app/static"), name="static")
-templates = Jinja2Templates(directory="app/templates")
+templates = _LazyTemplates()
+rule_cache: RuleCache[RuleIndex] = RuleCache()
+rule_view_cache: RuleCache[dict[int, RuleView]] = RuleCache()
 DEFAULT_SECRETS = {"change-me-token", "change-me-password", "change-me-session-secret"}
 ALLOWED_WEBHOOK_HOSTS = {"qyapi.weixin.qq.com"}
+SIGNAL_PAGE_SIZE = 200
+MAX_SIGNAL_PAGE_SIZE = 1000
+MAX_TARGET_TIMEOUT_SECONDS = 30.0
+STATS_WINDOW_HOURS = (24, 72, 168)
+MAX_STATS_HOURS = 24 * 90
+LIVE_HEARTBEAT_SECONDS = 15.0
+LIVE_RETRY_MS = 3000
+_background_tasks: set[asyncio.Task] = set()
 
 
 @app.middleware("http")
@@ -55,9 +129,33 @@ def on_startup() -> None:
             or not settings.fernet_key
         ):
             raise RuntimeError("Refusing to start in prod with insecure default secrets")
-    if not settings.inbound_token:
-        raise RuntimeError("INBOUND_TOKEN must not be empty")
+    try:
+        token_sources = inbound_token_sources()
+    except ValueError as exc:
+        raise RuntimeError(str(exc)) from exc
+    if not token_sources:
+        raise RuntimeError("INBOUND_TOKEN or INBOUND_TOKENS must be set")
     init_db()
+    ensure_export_dir()
+    # Finish purges interrupted by a restart without holding up startup.
+    threading.Thread(target=resume_pending_purges, name="resume-purges", daemon=True).start()
+    threading.Thread(target=catch_up_rollups, name="rollup-catch-up", daemon=True).start()
+
+
+@app.on_event("startup")
+async def start_loop_lag_monitor() -> None:
+    task = asyncio.get_running_loop().create_task(loop_lag_monitor.run())
+    _background_tasks.add(task)
+
+
+@app.on_event("shutdown")
+async def on_shutdown() -> None:
+    for task in _background_tasks:
+        task.cancel()
+    _background_tasks.clear()
+    shutdown_offload()
+    await asyncio.to_thread(exporter.close)
+    await close_http_client()
 
 
 def _get_admin_username(request: Request) -> Optional[str]:
@@ -95,19 +193,87 @@ def _load_json(text: str) -> dict[str, Any]:
         return {}
 
 
-def _extract_targets(action_json: str) -> list[str]:
+def _extract_target_entries(action_json: str) -> list[tuple[str, str, Optional[float]]]:
+    # (url, stored ciphertext, timeout) per decryptable target.
     action = _load_json(action_json)
     targets = action.get("targets", [])
     if not isinstance(targets, list):
         return []
-    result: list[str] = []
-    for item in targets:
+    timeouts = action.get("timeouts")
+    if not isinstance(timeouts, list):
+        timeouts = []
+    result: list[tuple[str, str, Optional[float]]] = []
+    for index, item in enumerate(targets):
         dec = decrypt_text(item) if isinstance(item, str) else None
         if dec:
-            result.append(dec)
+            timeout = timeouts[index] if index < len(timeouts) else None
+            result.append((dec, item, float(timeout) if isinstance(timeout, (int, float)) else None))
     return result
 
 
+def _extract_targets(action_json: str) -> list[tuple[str, Optional[float]]]:
+    return [(url, timeout) for url, _, timeout in _extract_target_entries(action_json)]
+
+
+def _build_action(
+    targets: list[tuple[str, Optional[float]]], template: Optional[dict[str, str]] = None
+) -> dict[str, Any]:
+    action: dict[str, Any] = {
+        "type": "forward_wecom_webhooks",
+        "targets": [encrypt_text(url) for url, _ in targets],
+    }
+    if any(timeout is not None for _, timeout in targets):
+        action["timeouts"] = [timeout for _, timeout in targets]
+    if template:
+        action["template"] = template
+    return action
+
+
+def _extract_template(action_json: str) -> Optional[dict[str, str]]:
+    template = _load_json(action_json).get("template")
+    if not isinstance(template, dict) or not isinstance(template.get("source"), str):
+        return None
+    return {"msgtype": str(template.get("msgtype", "markdown")), "source": template["source"]}
+
+
+def _parse_and_validate_template(output_template: str, output_msgtype: str) -> Optional[dict[str, str]]:
+    source = output_template.strip()
+    if not source:
+        return None
+    if output_msgtype not in TEMPLATE_MSGTYPES:
+        raise HTTPException(status_code=400, detail="不支持的输出消息类型")
+    try:
+        build_output_template(output_msgtype, source)
+    except ValueError as exc:
+        raise HTTPException(status_code=400, detail=f"输出模板语法错误：{exc}")
+    return {"msgtype": output_msgtype, "source": source}
+
+
+def _split_sources(value: Optional[str]) -> tuple[str, ...]:
+    return tuple(item for item in (part.strip() for part in (value or "").split(",")) if item)
+
+
+def _parse_and_validate_sources(sources_text: str) -> Optional[str]:
+    # Accepts commas (ASCII or full-width), spaces or newlines between sources.
+    sources = list(dict.fromkeys(item for item in re.split(r"[,，\s]+", sources_text) if item))
+    if any(len(source) > 100 for source in sources):
+        raise HTTPException(status_code=400, detail="来源名称不能超过 100 个字符")
+    joined = ",".join(sources)
+    if len(joined) > 500:
+        raise HTTPException(status_code=400, detail="来源范围过长")
+    return joined or None
+
+
+def _parse_and_validate_lane(lane: str) -> str:
+    if lane not in LANES:
+        raise HTTPException(status_code=400, detail="不支持的转发通道")
+    return lane
+
+
+def _format_targets_text(targets: list[tuple[str, Optional[float]]]) -> str:
+    return "\n".join(f"{url} {timeout:g}" if timeout is not None else url for url, timeout in targets)
+
+
 def _is_allowed_webhook_url(url: str) -> bool:
     try:
         parsed = urlparse(url.strip())
@@ -120,70 +286,481 @@ def _is_allowed_webhook_url(url: str) -> bool:
     return parsed.path.startswith("/cgi-bin/webhook/send")
 
 
-def _parse_and_validate_targets(target_urls: str) -> list[str]:
-    targets = [item.strip() for item in target_urls.splitlines() if item.strip()]
+def _save_rule(session: Session, rule: Rule) -> None:
+    # The only constraint a validated form can hit is the live-name index.
+    session.add(rule)
+    try:
+        session.commit()
+    except IntegrityError:
+        session.rollback()
+        raise HTTPException(status_code=400, detail="规则名称已存在")
+
+
+def _get_live_rule(session: Session, rule_id: int) -> Rule:
+    rule = session.get(Rule, rule_id)
+    if not rule or rule.deleted_at is not None:
+        raise HTTPException(status_code=404)
+    return rule
+
+
+def _parse_and_validate_targets(target_urls: str) -> list[tuple[str, Optional[float]]]:
+    targets: list[tuple[str, Optional[float]]] = []
+    for line in target_urls.splitlines():
+        parts = line.split()
+        if not parts:
+            continue
+        if len(parts) > 2:
+            raise HTTPException(status_code=400, detail="每行格式为：地址 [超时秒数]")
+        timeout: Optional[float] = None
+        if len(parts) == 2:
+            try:
+                timeout = float(parts[1])
+            except ValueError:
+                timeout = 0.0
+            if not 0 < timeout <= MAX_TARGET_TIMEOUT_SECONDS:
+                raise HTTPException(status_code=400, detail=f"超时秒数必须大于 0 且不超过 {MAX_TARGET_TIMEOUT_SECONDS:g}")
+        targets.append((parts[0], timeout))
     if not targets:
         raise HTTPException(status_code=400, detail="目标地址不能为空")
-    for target in targets:
+    for target, _ in targets:
         if not _is_allowed_webhook_url(target):
             raise HTTPException(status_code=400, detail="目标地址必须是企业微信机器人 HTTPS webhook")
     return targets
 
 
-def _build_forward_payload(signal: Signal) -> dict[str, Any]:
-    payload = _load_json(signal.raw_payload)
+def _build_forward_payload(payload: dict[str, Any]) -> dict[str, Any]:
     return payload if payload else {"msgtype": "text", "text": {"content": ""}}
 
 
-async def _dispatch_for_signal(session: Session, signal: Signal) -> tuple[list[int], int]:
-    parsed_fields = _load_json(signal.parsed_fields)
-    rules = session.exec(select(Rule).where(Rule.enabled == True).order_by(Rule.priority.desc())).all()  # noqa: E712
+def _describe_conditions(conditions: dict[str, Any]) -> tuple[str, str]:
+    if not conditions.get("items"):
+        return "contains_field", ""
+    first_item = conditions["items"][0]
+    item_type = first_item.get("type")
+    if item_type == "always":
+        return "always", ""
+    if item_type == "contains_text":
+        return "contains_text", str(first_item.get("text", ""))
+    return "contains_field", str(first_item.get("field", ""))
+
+
+def _build_rule_views(session: Session) -> dict[int, RuleView]:
+    rules = session.exec(
+        select(Rule).where(Rule.deleted_at == None).order_by(Rule.priority.desc(), Rule.id.desc())  # noqa: E711
+    ).all()
+    views = {}
+    for rule in rules:
+        condition_type, condition_value = _describe_conditions(_load_json(rule.conditions_json))
+        views[rule.id] = RuleView(
+            id=rule.id,
+            name=rule.name,
+            priority=rule.priority,
+            lane=normalize_lane(rule.lane),
+            sources=_split_sources(rule.sources),
+            enabled=rule.enabled,
+            targets=[(url, mask_webhook(url), timeout) for url, timeout in _extract_targets(rule.action_json)],
+            condition_type=condition_type,
+            condition_value=condition_value,
+            template=_extract_template(rule.action_json),
+        )
+    return views
+
+
+def _etag(*parts: Any) -> str:
+    return 'W/"' + hashlib.sha256(repr(parts).encode("utf-8")).hexdigest()[:32] + '"'
+
+
+def _not_modified(request: Request, etag: str) -> Optional[Response]:
+    candidates = {item.strip() for item in request.headers.get("if-none-match", "").split(",")}
+    if etag in candidates or "*" in candidates:
+        return Response(status_code=304, headers={"ETag": etag, "Cache-Control": "private, no-cache"})
+    return None
+
+
+def _with_etag(response: Response, etag: str) -> Response:
+    # no-cache: the browser may keep the page but must revalidate, which is what makes
+    # auto-refreshing dashboards cheap.
+    response.headers["ETag"] = etag
+    response.headers["Cache-Control"] = "private, no-cache"
+    return response
+
+
+def _load_compiled_rules(session: Session) -> list[CompiledRule]:
+    rules = session.exec(
+        select(Rule)
+        .where(Rule.enabled == True, Rule.deleted_at == None)  # noqa: E711,E712
+        .order_by(Rule.priority.desc())
+    ).all()
+    compiled = []
+    for rule in rules:
+        targets = [entry for entry in _extract_target_entries(rule.action_json) if _is_allowed_webhook_url(entry[0])]
+        template_spec = _extract_template(rule.action_json)
+        template: Optional[OutputTemplate] = None
+        template_error: Optional[str] = None
+        if template_spec:
+            try:
+                template = build_output_template(template_spec["msgtype"], template_spec["source"])
+            except ValueError as exc:
+                template_error = f"template error: {exc}"[:500]
+        compiled.append(
+            CompiledRule(
+                id=rule.id,
+                conditions=_load_json(rule.conditions_json),
+                targets=[url for url, _, _ in targets],
+                targets_encrypted=[encrypted for _, encrypted, _ in targets],
+                timeouts=[timeout for _, _, timeout in targets],
+                template=template,
+                template_error=template_error,
+                lane=normalize_lane(rule.lane),
+                sources=_split_sources(rule.sources),
+            )
+        )
+    return compiled
+
+
+def _load_rule_index(session: Session) -> RuleIndex:
+    return build_rule_index(_load_compiled_rules(session))
+
+
+def _failed_delivery(target: str, error_message: str) -> dict[str, Any]:
+    return {"target_masked": mask_webhook(target), "success": False, "error_message": error_message, "duration_ms": 0.0}
+
+
+def _render_outputs(
+    signal: Signal, prepared: PreparedSignal, rules: list[CompiledRule], trace: Trace
+) -> dict[Optional[OutputTemplate], tuple[Optional[dict[str, Any]], Optional[str]]]:
+    # One payload per distinct template (None = forward as-is), however many rules or
+    # targets share it. Values are (payload, error message).
+    outputs: dict[Optional[OutputTemplate], tuple[Optional[dict[str, Any]], Optional[str]]] = {}
+    parsed_fields = prepared.parsed_fields
+    raw_payload = _build_forward_payload(prepared.payload)
+    context: Optional[dict[str, Any]] = None
+    for rule in rules:
+        if rule.template_error or rule.template in outputs:
+            continue
+        if rule.template is None:
+            outputs[None] = (raw_payload, None)
+            continue
+        if context is None:
+            context = template_context(parsed_fields, raw_payload, signal.id, signal.source, signal.received_at)
+        with metrics.template_render_seconds.time(), trace.span("render", f"rule {rule.id}"):
+            try:
+                outputs[rule.template] = (render_output(rule.template, context), None)
+            except Exception as exc:
+                outputs[rule.template] = (None, f"template error: {exc}"[:500])
+    return outputs
+
+
+async def _send_to_target(
+    client: httpx.AsyncClient,
+    target: str,
+    payload: dict[str, Any],
+    timeout: Optional[float],
+    trace: Trace,
+    lane: str = NORMAL,
+) -> dict[str, Any]:
+    target_masked = mask_webhook(target)
+    breaker = target_health.breaker(target, target_masked)
+    if not breaker.allow():
+        # Open circuit: skip without touching the network or the rate budget, and keep a
+        # failed record of it.
+        now = time.perf_counter()
+        trace.record("skip", now, now, target_masked)
+        metrics.outbound_total.inc(target_masked, "circuit_open", "")
+        return _failed_delivery(target, "circuit open: target skipped")
+    # allow() hands out at most one probe while half-open; it goes back however the send ends.
+    probing = breaker.state == HALF_OPEN
+    try:
+        deferred = time.perf_counter()
+        if not await rate_budget.acquire(target, lane, settings.wecom_rate_max_wait_seconds):
+            now = time.perf_counter()
+            trace.record("skip", deferred, now, target_masked)
+            metrics.outbound_total.inc(target_masked, "rate_limited", "")
+            return _failed_delivery(target, "rate limited: per-minute budget still exhausted after waiting")
+        if time.perf_counter() - deferred > 0.001:
+            trace.record("rate_wait", deferred, time.perf_counter(), lane)
+
+        status_code: Optional[int] = None
+        response_body: Optional[str] = None
+        error_message: Optional[str] = None
+        queued = time.perf_counter()
+        async with lane_scheduler.slot(lane):
+            started = time.perf_counter()
+            try:
+                kwargs = {"timeout": timeout} if timeout is not None else {}
+                resp = await client.post(target, json=payload, **kwargs)
+                status_code = resp.status_code
+                response_body = resp.text[:500]
+            except Exception as exc:
+                error_message = str(exc)[:500] or type(exc).__name__
+            finished = time.perf_counter()
+        metrics.lane_delivery_seconds.observe(finished - queued, lane)
+        errcode = wecom_errcode(response_body)
+        if started - queued > 0.001:
+            trace.record("queue", queued, started, lane)
+        trace.record("send", started, finished, target_masked)
+        metrics.outbound_seconds.observe(finished - started, target_masked)
+        metrics.outbound_total.inc(target_masked, str(status_code or "error"), errcode)
+        # A revoked or deleted robot still answers HTTP 200, with a non-zero errcode; a rate
+        # limited one says nothing about the robot's health.
+        if errcode != WECOM_RATE_LIMITED_ERRCODE:
+            breaker.record(
+                status_code == 200 and errcode in ("", "0"),
+                finished - started,
+                error_message or (response_body if status_code == 200 else f"HTTP {status_code}"),
+                probe=probing,
+            )
+    finally:
+        # Otherwise a cancelled or unrecorded probe would keep the target skipped for good.
+        if probing:
+            breaker.release()
+    return {
+        "target_masked": target_masked,
+        "response_status": status_code,
+        "response_body": response_body,
+        "success": status_code == 200,
+        "error_message": error_message,
+        "duration_ms": round((finished - started) * 1000, 3),
+    }
+
+
+async def _route_signal(
+    session: Session,
+    client: httpx.AsyncClient,
+    signal: Signal,
+    prepared: PreparedSignal,
+    rules: list[CompiledRule],
+    trace: Trace,
+) -> tuple[list[int], list[Delivery]]:
+    with metrics.rule_eval_seconds.time(), trace.span("match"):
+        # Substring rules scan the whole message text, which for image payloads is megabytes
+        # per rule. Threads only: shipping parsed fields and rules to a process costs more.
+        matched_rules = await run_offloaded(
+            len(prepared.message_text_lower),
+            match_rules,
+            prepared.parsed_fields,
+            prepared.message_text_lower,
+            rules,
+            allow_process=False,
+        )
 
     matched_rule_ids: list[int] = []
-    delivery_count = 0
-    async with httpx.AsyncClient(timeout=5.0) as client:
-        for rule in rules:
-            conditions = _load_json(rule.conditions_json)
-            if not match_rule(parsed_fields, conditions):
-                continue
-            matched_rule_ids.append(rule.id)
-            targets = _extract_targets(rule.action_json)
-            for target in targets:
-                if not _is_allowed_webhook_url(target):
-                    continue
-                payload = _build_forward_payload(signal)
-                success = False
-                status_code: Optional[int] = None
-                response_body: Optional[str] = None
-                error_message: Optional[str] = None
-                try:
-                    resp = await client.post(target, json=payload)
-                    status_code = resp.status_code
-                    response_body = resp.text[:500]
-                    success = resp.status_code == 200
-                except Exception as exc:
-                    error_message = str(exc)[:500]
-
-                session.add(
-                    Delivery(
-                        signal_id=signal.id,
-                        rule_id=rule.id,
-                        target_masked=mask_webhook(target),
-                        target_encrypted=encrypt_text(target),
-                        request_payload=_safe_json_dumps(payload),
-                        response_status=status_code,
-                        response_body=response_body,
-                        success=success,
-                        error_message=error_message,
-                    )
+    deliveries: list[Delivery] = []
+    sends: list[tuple[CompiledRule, int]] = []
+    for rule in matched_rules:
+        matched_rule_ids.append(rule.id)
+        metrics.rule_matches_total.inc(str(rule.id))
+        sends.extend((rule, index) for index in range(len(rule.targets)))
+
+    if sends:
+        outputs = _render_outputs(signal, prepared, matched_rules, trace)
+        request_payloads = {
+            # The as-is forward is exactly the stored raw payload; do not serialize it again.
+            key: signal.raw_payload if payload is prepared.payload else _safe_json_dumps(payload)
+            for key, (payload, _) in outputs.items()
+            if payload
+        }
+
+        async def deliver(rule: CompiledRule, target: str, timeout: Optional[float]) -> dict[str, Any]:
+            if rule.template_error:
+                return _failed_delivery(target, rule.template_error)
+            payload, error_message = outputs[rule.template]
+            if payload is None:
+                return _failed_delivery(target, error_message or "template error")
+            return await _send_to_target(client, target, payload, timeout, trace, rule.lane)
+
+        # Fan out concurrently so one slow target no longer delays the others.
+        results = await asyncio.gather(
+            *(
+                deliver(rule, rule.targets[index], rule.timeouts[index] if index < len(rule.timeouts) else None)
+                for rule, index in sends
+            )
+        )
+        for (rule, index), result in zip(sends, results):
+            request_payload = "" if rule.template_error else request_payloads.get(rule.template, "")
+            deliveries.append(
+                Delivery(
+                    signal_id=signal.id,
+                    rule_id=rule.id,
+                    # Reuse the rule's ciphertext; encrypting per delivery cost a Fernet call each.
+                    target_encrypted=rule.targets_encrypted[index],
+                    request_payload=request_payload,
+                    **result,
                 )
-                delivery_count += 1
+            )
+        session.add_all(deliveries)
 
     signal.match_count = len(matched_rule_ids)
-    signal.delivery_count = delivery_count
+    signal.delivery_count = len(sends)
+    signal.routed_at = datetime.utcnow()
+    signal.trace_json = trace.to_json()
     session.add(signal)
+    return matched_rule_ids, deliveries
+
+
+def _publish_routed(signal: Signal, matched_rule_ids: list[int], deliveries: list[Delivery]) -> None:
+    broadcaster.publish(
+        routed_event(
+            signal.id,
+            len(matched_rule_ids),
+            [delivery_summary(d.rule_id, d.target_masked, d.success, d.response_status) for d in deliveries],
+        )
+    )
+
+
+async def _dispatch_for_signal(
+    session: Session, signal: Signal, prepared: PreparedSignal, trace: Trace
+) -> tuple[list[int], int]:
+    with trace.span("load_rules"):
+        rules = rule_cache.get(session, _load_rule_index).rules_for(signal.source)
+        _release_connection(session)
+    matched_rule_ids, deliveries = await _route_signal(session, get_http_client(), signal, prepared, rules, trace)
+    # The stored trace is written by this commit, so its own duration only reaches the export.
+    with trace.span("commit"):
+        await _commit(session, deliveries)
+    _publish_routed(signal, matched_rule_ids, deliveries)
+    trace.export(signal.id)
+    return matched_rule_ids, len(deliveries)
+
+
+async def _commit(session: Session, deliveries: Optional[list[Delivery]] = None) -> None:
+    # Writes run on a thread: with SQLite another worker (or a purge, rollup fold or migration)
+    # may hold the write lock, and busy_timeout would otherwise stall this worker's whole loop.
+    # The rollup upsert goes with it, since it flushes the pending delivery rows.
+    def write() -> None:
+        if deliveries is not None:
+            record_deliveries(session, deliveries)
+        session.commit()
+
+    with metrics.db_commit_seconds.time():
+        await asyncio.to_thread(write)
+
+
+def _release_connection(session: Session) -> None:
+    # Routing only touches already-loaded objects, so end the read transaction and hand the
+    # pooled connection back before awaiting outbound I/O. Holding it across awaits lets
+    # more in-flight requests than the pool size block the event loop on checkout.
+    session.expire_on_commit = False
     session.commit()
-    return matched_rule_ids, delivery_count
+
+
+def _reject(status_code: int, detail: str) -> HTTPException:
+    metrics.ingest_rejected_total.inc(detail)
+    return HTTPException(status_code=status_code, detail=detail)
+
+
+def _verify_inbound_token(inbound_token: str) -> Optional[str]:
+    # Returns the source the token is bound to (None for INBOUND_TOKEN).
+    token_sources = inbound_token_sources()
+    digest = inbound_token_digest(inbound_token)
+    if digest not in token_sources:
+        raise _reject(401, "invalid token")
+    return token_sources[digest]
+
+
+@contextmanager
+def _admitted(bound_source: Optional[str]) -> Iterator[None]:
+    # Runs after the token check, so unauthenticated floods never spend a producer's budget.
+    rejection = admission.try_enter(bound_source or "default")
+    if rejection:
+        metrics.ingest_shed_total.inc(rejection.reason)
+        raise HTTPException(
+            status_code=rejection.status_code,
+            detail="rate limited" if rejection.status_code == 429 else "overloaded, retry later",
+            headers={"Retry-After": str(rejection.retry_after)},
+        )
+    try:
+        yield
+    finally:
+        admission.leave()
+
+
+def _check_content_length(request: Request, limit: int) -> None:
+    content_length = request.headers.get("content-length")
+    if not content_length:
+        return
+    try:
+        declared = int(content_length)
+    except ValueError:
+        raise _reject(400, "invalid content-length")
+    if declared > limit:
+        raise _reject(413, "payload too large")
+
+
+async def _iter_body_chunks(request: Request, limit: int, endpoint: str) -> AsyncIterator[bytes]:
+    # Content-Length can be absent (chunked) or wrong, so the running total is enforced as well.
+    _check_content_length(request, limit)
+    received = 0
+    async for chunk in request.stream():
+        received += len(chunk)
+        if received > limit:
+            raise _reject(413, "payload too large")
+        if chunk:
+            yield chunk
+    request.state.body_bytes = received
+    metrics.request_body_bytes.observe(received, endpoint)
+
+
+async def _read_body(request: Request, limit: int) -> bytes:
+    return b"".join([chunk async for chunk in _iter_body_chunks(request, limit, "single")])
+
+
+async def _iter_batch_items(request: Request) -> AsyncIterator[BatchItem]:
+    chunks = _iter_body_chunks(request, settings.max_webhook_batch_bytes, "batch")
+    head = bytearray()
+    async for chunk in chunks:
+        head += chunk
+        if head.strip():
+            break
+
+    if "ndjson" not in request.headers.get("content-type", "") and head.lstrip().startswith(b"["):
+        async for chunk in chunks:
+            head += chunk
+        try:
+            items = await run_offloaded(
+                len(head), decode_json_array, bytes(head), settings.max_webhook_payload_bytes
+            )
+        except UnicodeDecodeError:
+            raise _reject(400, "invalid json body")
+        for item in items:
+            yield item
+        return
+
+    # Lines are decoded a chunk's worth at a time, off the loop once they add up to a large body.
+    splitter = NdjsonLineSplitter(settings.max_webhook_payload_bytes)
+    lines = splitter.feed(bytes(head))
+    index = 0
+    while True:
+        chunk = await anext(chunks, None)
+        if chunk is None:
+            lines += splitter.close()
+        if lines:
+            size = sum(len(line) for line in lines if line is not None)
+            for item in await run_offloaded(
+                size, decode_ndjson_lines, index, lines, settings.max_webhook_payload_bytes
+            ):
+                yield item
+            index += len(lines)
+        if chunk is None:
+            return
+        lines = splitter.feed(chunk)
+
+
+def _build_signal(prepared: PreparedSignal, bound_source: Optional[str] = None) -> Signal:
+    # A source-bound token decides the source; the payload cannot claim another producer's rules.
+    payload = prepared.payload
+    source = bound_source or (str(payload.get("source")) if payload.get("source") else None)
+    return Signal(source=source, raw_payload=prepared.raw_payload, parsed_fields=prepared.parsed_fields_json)
+
+
+def _record_prepare(trace: Trace, prepared: PreparedSignal, finished: float) -> None:
+    # The work may have run in another thread or process; place its spans by duration, ending
+    # when the result was back on the loop.
+    parse_seconds = prepared.parse_seconds + prepared.serialize_seconds
+    if prepared.decode_seconds:
+        trace.record("decode", finished - parse_seconds - prepared.decode_seconds, finished - parse_seconds)
+    trace.record("parse", finished - parse_seconds, finished)
+    metrics.parse_seconds.observe(prepared.parse_seconds)
 
 
 @app.post("/webhook/{inbound_token}")
@@ -192,32 +769,56 @@ async def inbound_webhook(
     request: Request,
     session: Session = Depends(get_session),
 ):
-    if not hmac.compare_digest(inbound_token, settings.inbound_token):
-        raise HTTPException(status_code=401, detail="invalid token")
+    bound_source = _verify_inbound_token(inbound_token)
+    with _admitted(bound_source):
+        if request.headers.get("x-profile") != "1":
+            return await _ingest_signal(request, session, bound_source)
+
+        # Per-request cProfile for admins; the profile also covers other coroutines that run on
+        # the loop while this request awaits, which is usually what a latency hunt wants.
+        require_admin(request)
+        import cProfile
+
+        from app.profiling import format_profile_stats, profile_lock
+
+        if not profile_lock.acquire(blocking=False):
+            raise HTTPException(status_code=409, detail="profiler busy")
+        profiler = cProfile.Profile()
+        try:
+            profiler.enable()
+            try:
+                result = await _ingest_signal(request, session, bound_source)
+            finally:
+                profiler.disable()
+        finally:
+            profile_lock.release()
+        result["profile"] = format_profile_stats(profiler)
+        return result
+
+
+async def _ingest_signal(request: Request, session: Session, bound_source: Optional[str]) -> dict[str, Any]:
+    trace = start_trace()
 
     try:
-        body = await request.body()
-        if len(body) > settings.max_webhook_payload_bytes:
-            raise HTTPException(status_code=413, detail="payload too large")
-        payload = json.loads(body.decode("utf-8"))
-        if not isinstance(payload, dict):
-            raise ValueError("payload must be object")
+        with trace.span("receive"):
+            body = await _read_body(request, settings.max_webhook_payload_bytes)
+        prepared = await run_offloaded(len(body), prepare_body, body)
     except HTTPException:
         raise
     except Exception:
-        raise HTTPException(status_code=400, detail="invalid json body")
-
-    parsed_fields = parse_signal_fields(payload)
-    signal = Signal(
-        source=str(payload.get("source")) if payload.get("source") else None,
-        raw_payload=_safe_json_dumps(payload),
-        parsed_fields=_safe_json_dumps(parsed_fields),
-    )
-    session.add(signal)
-    session.commit()
-    session.refresh(signal)
-
-    matched_rule_ids, delivery_count = await _dispatch_for_signal(session, signal)
+        raise _reject(400, "invalid json body")
+    _record_prepare(trace, prepared, time.perf_counter())
+
+    with trace.span("persist"):
+        signal = _build_signal(prepared, bound_source)
+        session.add(signal)
+        session.expire_on_commit = False
+        await _commit(session)
+    metrics.ingest_signals_total.inc("single")
+    metrics.ingest_token_signals_total.inc(bound_source or "default")
+    broadcaster.publish(signal_event(signal))
+
+    matched_rule_ids, delivery_count = await _dispatch_for_signal(session, signal, prepared, trace)
     return {
         "ok": True,
         "signal_id": signal.id,
@@ -226,6 +827,78 @@ async def inbound_webhook(
     }
 
 
+@app.post("/webhook/{inbound_token}/batch")
+async def inbound_webhook_batch(
+    inbound_token: str,
+    request: Request,
+    session: Session = Depends(get_session),
+):
+    bound_source = _verify_inbound_token(inbound_token)
+    with _admitted(bound_source):
+        return await _ingest_batch(request, session, bound_source)
+
+
+async def _ingest_batch(request: Request, session: Session, bound_source: Optional[str]) -> dict[str, Any]:
+    results: list[dict[str, Any]] = []
+    payloads: list[dict[str, Any]] = []
+    async for index, payload, error in _iter_batch_items(request):
+        if index >= settings.max_webhook_batch_items:
+            raise _reject(413, "too many items")
+        if error:
+            metrics.ingest_rejected_total.inc(error)
+            results.append({"index": index, "ok": False, "error": error})
+            continue
+        result: dict[str, Any] = {"index": index, "ok": True}
+        results.append(result)
+        payloads.append(payload)
+
+    # One executor round trip for the whole batch, sized by the body it came from.
+    prepared_items = await run_offloaded(request.state.body_bytes, prepare_payloads, payloads) if payloads else []
+    finished = time.perf_counter()
+    accepted: list[tuple[dict[str, Any], Signal, PreparedSignal, Trace]] = []
+    for result, prepared in zip([item for item in results if item["ok"]], prepared_items):
+        trace = start_trace()
+        _record_prepare(trace, prepared, finished)
+        accepted.append((result, _build_signal(prepared, bound_source), prepared, trace))
+
+    # Signals stay loaded across commits so routing does not refresh them row by row.
+    session.expire_on_commit = False
+    started = time.perf_counter()
+    session.add_all([signal for _, signal, _, _ in accepted])
+    await _commit(session)
+    finished = time.perf_counter()
+    metrics.ingest_signals_total.inc("batch", amount=len(accepted))
+    metrics.ingest_token_signals_total.inc(bound_source or "default", amount=len(accepted))
+    for _, signal, _, _ in accepted:
+        broadcaster.publish(signal_event(signal))
+
+    rule_index = rule_cache.get(session, _load_rule_index)
+    _release_connection(session)
+    client = get_http_client()
+    routed: list[tuple[Signal, list[int], list[Delivery]]] = []
+    for result, signal, prepared, trace in accepted:
+        trace.record("persist", started, finished, "batch")
+        rules = rule_index.rules_for(signal.source)
+        matched_rule_ids, deliveries = await _route_signal(session, client, signal, prepared, rules, trace)
+        result.update(signal_id=signal.id, matched_rule_ids=matched_rule_ids, delivery_count=len(deliveries))
+        routed.append((signal, matched_rule_ids, deliveries))
+    # One rollup upsert for the whole batch: deliveries to the same rule/target/hour fold together.
+    started = time.perf_counter()
+    await _commit(session, [delivery for _, _, deliveries in routed for delivery in deliveries])
+    finished = time.perf_counter()
+    for signal, matched_rule_ids, deliveries in routed:
+        _publish_routed(signal, matched_rule_ids, deliveries)
+    for _, signal, _, trace in accepted:
+        trace.record("commit", started, finished, "batch")
+        trace.export(signal.id)
+    return {
+        "ok": True,
+        "accepted": len(accepted),
+        "rejected": len(results) - len(accepted),
+        "results": results,
+    }
+
+
 @app.get("/admin/login", response_class=HTMLResponse)
 def admin_login_page(request: Request):
     return templates.TemplateResponse(request, "login.html", {"error": None})
@@ -262,18 +935,27 @@ def admin_logout(request: Request, csrf_token: str = Form(...)):
 
 @app.get("/admin/rules", response_class=HTMLResponse)
 def rules_page(request: Request, session: Session = Depends(get_session)):
-    require_admin(request)
-    rules = session.exec(select(Rule).order_by(Rule.priority.desc(), Rule.id.desc())).all()
-    display_rules = []
-    for rule in rules:
-        action = _load_json(rule.action_json)
-        masked_targets = [mask_webhook(decrypt_text(t) or "") for t in action.get("targets", []) if isinstance(t, str)]
-        display_rules.append((rule, masked_targets))
-    return templates.TemplateResponse(
+    username = require_admin(request)
+    fingerprint, views = rule_view_cache.get_with_fingerprint(session, _build_rule_views)
+    display_rules = [
+        (view, [(masked, target_health.snapshot(url)) for url, masked, _ in view.targets]) for view in views.values()
+    ]
+    # Target health is live state, so it is part of the validator alongside the rule version.
+    etag = _etag(
+        "rules",
+        username,
+        fingerprint,
+        [[tuple(health.values()) if health else None for _, health in targets] for _, targets in display_rules],
+    )
+    not_modified = _not_modified(request, etag)
+    if not_modified:
+        return not_modified
+    response = templates.TemplateResponse(
         request,
         "rules.html",
-        {"rules": display_rules, "csrf_token": _build_csrf_for_request(request)},
+        {"rules": display_rules, "csrf_token": build_csrf_token(username)},
     )
+    return _with_etag(response, etag)
 
 
 @app.get("/admin/rules/new", response_class=HTMLResponse)
@@ -287,6 +969,9 @@ def rules_new_page(request: Request):
             "form_action": "/admin/rules",
             "rule": None,
             "targets_text": "",
+            "output_template": None,
+            "template_msgtypes": TEMPLATE_MSGTYPES,
+            "lanes": LANES,
             "condition_type": "contains_text",
             "condition_value": "",
             "csrf_token": _build_csrf_for_request(request),
@@ -301,13 +986,20 @@ def rules_create(
     name: str = Form(...),
     enabled: Optional[str] = Form(None),
     priority: int = Form(0),
+    lane: str = Form(NORMAL),
+    sources: str = Form(""),
     condition_type: str = Form(...),
     condition_value: str = Form(""),
     target_urls: str = Form(...),
+    output_template: str = Form(""),
+    output_msgtype: str = Form("markdown"),
     csrf_token: str = Form(...),
 ):
     verify_csrf(request, csrf_token)
+    lane = _parse_and_validate_lane(lane)
+    rule_sources = _parse_and_validate_sources(sources)
     targets = _parse_and_validate_targets(target_urls)
+    template = _parse_and_validate_template(output_template, output_msgtype)
     condition_value = condition_value.strip()
     if condition_type == "always":
         conditions = {"op": "and", "items": [{"type": "always"}]}
@@ -322,49 +1014,31 @@ def rules_create(
     else:
         return JSONResponse(status_code=400, content={"ok": False, "error": "不支持的规则类型"})
 
-    action = {
-        "type": "forward_wecom_webhooks",
-        "targets": [encrypt_text(t) for t in targets],
-    }
+    action = _build_action(targets, template)
 
     now = datetime.utcnow()
     rule = Rule(
         name=name.strip(),
         enabled=enabled == "on",
         priority=priority,
+        lane=lane,
+        sources=rule_sources,
         conditions_json=_safe_json_dumps(conditions),
         action_json=_safe_json_dumps(action),
         created_at=now,
         updated_at=now,
     )
-    session.add(rule)
-    session.commit()
+    _save_rule(session, rule)
     return RedirectResponse(url="/admin/rules", status_code=303)
 
 
 @app.get("/admin/rules/{rule_id}/edit", response_class=HTMLResponse)
 def rules_edit_page(rule_id: int, request: Request, session: Session = Depends(get_session)):
     require_admin(request)
-    rule = session.get(Rule, rule_id)
-    if not rule:
+    rule = rule_view_cache.get(session, _build_rule_views).get(rule_id)
+    if rule is None:
         raise HTTPException(status_code=404)
 
-    conditions = _load_json(rule.conditions_json)
-    condition_type = "contains_field"
-    condition_value = ""
-    if conditions.get("items"):
-        first_item = conditions["items"][0]
-        item_type = first_item.get("type")
-        if item_type == "always":
-            condition_type = "always"
-        elif item_type == "contains_text":
-            condition_type = "contains_text"
-            condition_value = str(first_item.get("text", ""))
-        else:
-            condition_type = "contains_field"
-            condition_value = str(first_item.get("field", ""))
-    targets = _extract_targets(rule.action_json)
-
     return templates.TemplateResponse(
         request,
         "rule_form.html",
@@ -372,9 +1046,12 @@ def rules_edit_page(rule_id: int, request: Request, session: Session = Depends(g
             "title": "编辑规则",
             "form_action": f"/admin/rules/{rule.id}",
             "rule": rule,
-            "targets_text": "\n".join(targets),
-            "condition_type": condition_type,
-            "condition_value": condition_value,
+            "targets_text": _format_targets_text([(url, timeout) for url, _, timeout in rule.targets]),
+            "output_template": rule.template,
+            "template_msgtypes": TEMPLATE_MSGTYPES,
+            "lanes": LANES,
+            "condition_type": rule.condition_type,
+            "condition_value": rule.condition_value,
             "csrf_token": _build_csrf_for_request(request),
         },
     )
@@ -388,17 +1065,22 @@ def rules_update(
     name: str = Form(...),
     enabled: Optional[str] = Form(None),
     priority: int = Form(0),
+    lane: str = Form(NORMAL),
+    sources: str = Form(""),
     condition_type: str = Form(...),
     condition_value: str = Form(""),
     target_urls: str = Form(...),
+    output_template: str = Form(""),
+    output_msgtype: str = Form("markdown"),
     csrf_token: str = Form(...),
 ):
     verify_csrf(request, csrf_token)
-    rule = session.get(Rule, rule_id)
-    if not rule:
-        raise HTTPException(status_code=404)
+    rule = _get_live_rule(session, rule_id)
 
+    lane = _parse_and_validate_lane(lane)
+    rule_sources = _parse_and_validate_sources(sources)
     targets = _parse_and_validate_targets(target_urls)
+    template = _parse_and_validate_template(output_template, output_msgtype)
     condition_value = condition_value.strip()
     if condition_type == "always":
         conditions = {"op": "and", "items": [{"type": "always"}]}
@@ -416,17 +1098,53 @@ def rules_update(
     rule.name = name.strip()
     rule.enabled = enabled == "on"
     rule.priority = priority
+    rule.lane = lane
+    rule.sources = rule_sources
     rule.conditions_json = _safe_json_dumps(conditions)
-    rule.action_json = _safe_json_dumps(
-        {"type": "forward_wecom_webhooks", "targets": [encrypt_text(t) for t in targets]}
-    )
+    rule.action_json = _safe_json_dumps(_build_action(targets, template))
     rule.updated_at = datetime.utcnow()
 
-    session.add(rule)
-    session.commit()
+    _save_rule(session, rule)
     return RedirectResponse(url="/admin/rules", status_code=303)
 
 
+@app.get("/admin/rules/{rule_id}/replay", response_class=HTMLResponse)
+def rules_replay_page(
+    rule_id: int,
+    request: Request,
+    session: Session = Depends(get_session),
+    since: Optional[str] = None,
+    until: Optional[str] = None,
+    include_enabled: Optional[str] = None,
+):
+    require_admin(request)
+    from app.replay import WECOM_MESSAGES_PER_MINUTE, load_replay_rules, run_replay
+
+    rule = _get_live_rule(session, rule_id)
+    replay_rules = load_replay_rules(session, [rule.id], include_enabled == "on")
+    since_at = _parse_datetime_param(since) or datetime.utcnow() - timedelta(hours=settings.replay_ui_default_hours)
+    report = run_replay(
+        replay_rules,
+        since=since_at,
+        until=_parse_datetime_param(until),
+        workers=settings.replay_workers,
+        max_signals=settings.replay_ui_max_signals,
+    )
+    return templates.TemplateResponse(
+        request,
+        "rule_replay.html",
+        {
+            "rule": rule,
+            "report": report.to_dict(replay_rules),
+            "filters": request.query_params,
+            "since": since_at.strftime("%Y-%m-%dT%H:%M"),
+            "max_signals": settings.replay_ui_max_signals,
+            "rate_limit": WECOM_MESSAGES_PER_MINUTE,
+            "csrf_token": _build_csrf_for_request(request),
+        },
+    )
+
+
 @app.post("/admin/rules/{rule_id}/toggle")
 def rules_toggle(
     rule_id: int,
@@ -435,9 +1153,7 @@ def rules_toggle(
     csrf_token: str = Form(...),
 ):
     verify_csrf(request, csrf_token)
-    rule = session.get(Rule, rule_id)
-    if not rule:
-        raise HTTPException(status_code=404)
+    rule = _get_live_rule(session, rule_id)
     rule.enabled = not rule.enabled
     rule.updated_at = datetime.utcnow()
     session.add(rule)
@@ -449,51 +1165,272 @@ def rules_toggle(
 def rules_delete(
     rule_id: int,
     request: Request,
+    background_tasks: BackgroundTasks,
     session: Session = Depends(get_session),
     csrf_token: str = Form(...),
+    mode: str = Form("archive"),
 ):
     verify_csrf(request, csrf_token)
-    rule = session.get(Rule, rule_id)
-    if not rule:
-        raise HTTPException(status_code=404)
+    if mode not in ("archive", "purge"):
+        raise HTTPException(status_code=400, detail="invalid delete mode")
+    rule = _get_live_rule(session, rule_id)
 
-    deliveries = session.exec(select(Delivery).where(Delivery.rule_id == rule_id)).all()
-    for delivery in deliveries:
-        session.delete(delivery)
-    session.delete(rule)
+    now = datetime.utcnow()
+    rule.enabled = False
+    rule.deleted_at = now
+    rule.delete_mode = mode
+    rule.updated_at = now
+    session.add(rule)
     session.commit()
+    if mode == "purge":
+        background_tasks.add_task(purge_rule_deliveries, rule_id)
     return RedirectResponse(url="/admin/rules", status_code=303)
 
 
+def _parse_datetime_param(value: Optional[str]) -> Optional[datetime]:
+    if not value:
+        return None
+    try:
+        return datetime.fromisoformat(value)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="invalid datetime")
+
+
+def _parse_yes_no_param(value: Optional[str]) -> Optional[bool]:
+    if not value:
+        return None
+    if value not in ("yes", "no"):
+        raise HTTPException(status_code=400, detail="expected yes or no")
+    return value == "yes"
+
+
+def _history_version(session: Session) -> tuple[Optional[int], Optional[int], Optional[datetime]]:
+    # New signals raise max(signal.id) and deliveries max(delivery.id); every routing commit,
+    # with or without deliveries, raises max(routed_at). All three are index lookups.
+    last_signal_id = session.exec(select(func.max(Signal.id))).one()
+    last_delivery_id = session.exec(select(func.max(Delivery.id))).one()
+    last_routed_at = session.exec(select(func.max(Signal.routed_at))).one()
+    return last_signal_id, last_delivery_id, last_routed_at
+
+
+def _signal_filters(
+    source: Optional[str] = None,
+    since: Optional[str] = None,
+    until: Optional[str] = None,
+    matched: Optional[str] = None,
+    delivered: Optional[str] = None,
+) -> SignalFilters:
+    return SignalFilters(
+        source=(source.strip() or None) if source else None,
+        since=_parse_datetime_param(since),
+        until=_parse_datetime_param(until),
+        matched=_parse_yes_no_param(matched),
+        delivered=_parse_yes_no_param(delivered),
+    )
+
+
 @app.get("/admin/signals", response_class=HTMLResponse)
-def signals_page(request: Request, session: Session = Depends(get_session)):
+def signals_page(
+    request: Request,
+    session: Session = Depends(get_session),
+    filters: SignalFilters = Depends(_signal_filters),
+    before_id: Optional[int] = None,
+):
+    username = require_admin(request)
+    etag = _etag("signals", username, _history_version(session), sorted(request.query_params.multi_items()))
+    not_modified = _not_modified(request, etag)
+    if not_modified:
+        return not_modified
+    signals, next_before_id = query_signal_summaries(session, filters, before_id, SIGNAL_PAGE_SIZE)
+    params = {key: value for key, value in request.query_params.items() if value and key != "before_id"}
+    next_query = None
+    if next_before_id is not None:
+        next_query = urlencode({**params, "before_id": str(next_before_id)})
+    response = templates.TemplateResponse(
+        request,
+        "signals.html",
+        {
+            "signals": signals,
+            "filters": request.query_params,
+            "next_query": next_query,
+            "first_query": urlencode(params),
+            "is_first_page": before_id is None,
+            "csrf_token": build_csrf_token(username),
+        },
+    )
+    return _with_etag(response, etag)
+
+
+@app.get("/admin/api/signals")
+def signals_api(
+    request: Request,
+    session: Session = Depends(get_session),
+    filters: SignalFilters = Depends(_signal_filters),
+    before_id: Optional[int] = None,
+    limit: int = SIGNAL_PAGE_SIZE,
+):
     require_admin(request)
-    signals = session.exec(select(Signal).order_by(Signal.id.desc()).limit(200)).all()
+    etag = _etag("signals-api", _history_version(session), sorted(request.query_params.multi_items()))
+    not_modified = _not_modified(request, etag)
+    if not_modified:
+        return not_modified
+    limit = max(1, min(limit, MAX_SIGNAL_PAGE_SIZE))
+    signals, next_before_id = query_signal_summaries(session, filters, before_id, limit)
+    response = JSONResponse(
+        {
+            "items": [signal_summary_to_dict(row) for row in signals],
+            "next_before_id": next_before_id,
+        }
+    )
+    return _with_etag(response, etag)
+
+
+def _stats_since(hours: int) -> datetime:
+    return datetime.utcnow() - timedelta(hours=max(1, min(hours, MAX_STATS_HOURS)))
+
+
+@app.get("/admin/stats", response_class=HTMLResponse)
+def stats_page(
+    request: Request,
+    session: Session = Depends(get_session),
+    hours: int = 24,
+    rule_id: Optional[int] = None,
+):
+    username = require_admin(request)
+    since = _stats_since(hours)
+    rule_names = {view.id: view.name for view in rule_view_cache.get(session, _build_rule_views).values()}
     return templates.TemplateResponse(
         request,
-        "signals.html",
-        {"signals": signals, "csrf_token": _build_csrf_for_request(request)},
+        "stats.html",
+        {
+            "by_target": query_stats(session, since, rule_id=rule_id, group="target"),
+            "by_hour": query_stats(session, since, rule_id=rule_id, group="hour"),
+            "rule_names": rule_names,
+            "hours": hours,
+            "rule_id": rule_id,
+            "window_hours": STATS_WINDOW_HOURS,
+            "csrf_token": build_csrf_token(username),
+        },
+    )
+
+
+@app.get("/admin/api/stats")
+def stats_api(
+    request: Request,
+    session: Session = Depends(get_session),
+    since: Optional[str] = None,
+    until: Optional[str] = None,
+    hours: int = 24,
+    rule_id: Optional[int] = None,
+    group: str = "target",
+):
+    require_admin(request)
+    if group not in STAT_GROUPS:
+        raise HTTPException(status_code=400, detail=f"group must be one of: {', '.join(STAT_GROUPS)}")
+    since_at = _parse_datetime_param(since) or _stats_since(hours)
+    until_at = _parse_datetime_param(until)
+    return {
+        "since": since_at.isoformat(),
+        "until": until_at.isoformat() if until_at else None,
+        "group": group,
+        "items": query_stats(session, since_at, until_at, rule_id, group),
+    }
+
+
+@app.get("/admin/signals/stream")
+async def signals_stream(request: Request):
+    require_admin(request)
+    subscriber = broadcaster.subscribe()
+
+    async def frames() -> AsyncIterator[str]:
+        try:
+            yield f"retry: {LIVE_RETRY_MS}\n\n"
+            while not subscriber.dropped:
+                try:
+                    yield await asyncio.wait_for(subscriber.queue.get(), LIVE_HEARTBEAT_SECONDS)
+                except asyncio.TimeoutError:
+                    if await request.is_disconnected():
+                        return
+                    yield ": keepalive\n\n"
+            # Fell too far behind; the browser reconnects after LIVE_RETRY_MS with a fresh buffer.
+            yield "event: dropped\ndata: {}\n\n"
+        finally:
+            broadcaster.unsubscribe(subscriber)
+
+    return StreamingResponse(
+        frames(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
     )
 
 
 @app.get("/admin/signals/{signal_id}", response_class=HTMLResponse)
 def signal_detail_page(signal_id: int, request: Request, session: Session = Depends(get_session)):
-    require_admin(request)
+    username = require_admin(request)
     signal = session.get(Signal, signal_id)
     if not signal:
         raise HTTPException(status_code=404)
 
+    # Deliveries are written in the same commit that updates the signal's counters; a purge
+    # only ever removes them, so (count, max id) identifies the delivery list.
+    delivery_count, last_delivery_id = session.exec(
+        select(func.count(Delivery.id), func.max(Delivery.id)).where(Delivery.signal_id == signal_id)
+    ).one()
+    etag = _etag("signal", username, signal.id, signal.match_count, signal.delivery_count, delivery_count, last_delivery_id)
+    not_modified = _not_modified(request, etag)
+    if not_modified:
+        return not_modified
+
     deliveries = session.exec(select(Delivery).where(Delivery.signal_id == signal_id).order_by(Delivery.id.desc())).all()
-    return templates.TemplateResponse(
+    response = templates.TemplateResponse(
         request,
         "signal_detail.html",
         {
             "signal": signal,
             "deliveries": deliveries,
             "parsed_fields": _load_json(signal.parsed_fields),
-            "csrf_token": _build_csrf_for_request(request),
+            "trace_rows": waterfall_rows(signal.trace_json),
+            "csrf_token": build_csrf_token(username),
         },
     )
+    return _with_etag(response, etag)
+
+
+@app.get("/admin/debug/profile")
+def debug_profile(request: Request, seconds: float = 10.0):
+    require_admin(request)
+    from app.profiling import profile_lock, sample_stacks
+
+    if not profile_lock.acquire(blocking=False):
+        raise HTTPException(status_code=409, detail="profiler busy")
+    try:
+        collapsed = sample_stacks(seconds)
+    finally:
+        profile_lock.release()
+    return PlainTextResponse(
+        collapsed,
+        headers={"Content-Disposition": 'attachment; filename="signal-router.folded"'},
+    )
+
+
+def _is_loopback_client(request: Request) -> bool:
+    # start.sh runs uvicorn with --proxy-headers, so behind a local reverse proxy this is the
+    # forwarded client address rather than the proxy's 127.0.0.1.
+    try:
+        return request.client is not None and ipaddress.ip_address(request.client.host).is_loopback
+    except ValueError:
+        return False
+
+
+@app.get("/metrics")
+def metrics_page(request: Request):
+    if settings.metrics_token:
+        expected = f"Bearer {settings.metrics_token}"
+        if not hmac.compare_digest(request.headers.get("authorization", ""), expected):
+            raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED)
+    elif not settings.metrics_public and not _is_loopback_client(request):
+        require_admin(request)
+    return PlainTextResponse(metrics.registry.render(), media_type="text/plain; version=0.0.4")
 
 
 @app.get("/")
@@ -0,0 +1,59 @@
+import logging
+import time
+
+from sqlmodel import Session, delete, select
+
+from app.config import settings
+from app.db import engine, process_lock
+from app.models import Delivery, Rule
+from app.rollups import delete_rule_rollups, fold_pending_rollups
+
+logger = logging.getLogger(__name__)
+
+# Short pause between chunks so ingest writers can take the SQLite write lock.
+PURGE_CHUNK_PAUSE_SECONDS = 0.05
+
+
+def purge_rule_deliveries(rule_id: int, chunk_size: int = 0) -> int:
+    chunk_size = chunk_size or settings.delivery_purge_chunk_size
+    deleted = 0
+    while True:
+        with Session(engine) as session:
+            chunk_ids = select(Delivery.id).where(Delivery.rule_id == rule_id).limit(chunk_size)
+            result = session.exec(delete(Delivery).where(Delivery.id.in_(chunk_ids)))
+            session.commit()
+        if not result.rowcount:
+            break
+        deleted += result.rowcount
+        time.sleep(PURGE_CHUNK_PAUSE_SECONDS)
+
+    with Session(engine) as session:
+        rule = session.get(Rule, rule_id)
+        if rule is not None and rule.delete_mode == "purge":
+            delete_rule_rollups(session, rule_id)
+            session.delete(rule)
+            session.commit()
+    logger.info("purged %s deliveries for rule %s", deleted, rule_id)
+    return deleted
+
+
+def resume_pending_purges() -> None:
+    # Every worker calls this on startup; only the first to take the lock does the work.
+    with process_lock("resume-purges", blocking=False) as acquired:
+        if not acquired:
+            return
+        with Session(engine) as session:
+            rule_ids = session.exec(select(Rule.id).where(Rule.delete_mode == "purge")).all()
+        for rule_id in rule_ids:
+            purge_rule_deliveries(rule_id)
+
+
+def catch_up_rollups() -> None:
+    # Runs for the life of the worker: old workers keep writing deliveries without rollups
+    # until the deploy finishes, and the watermark lets every worker share the fold safely.
+    while True:
+        try:
+            fold_pending_rollups(engine)
+        except Exception:
+            logger.exception("rollup catch-up failed")
+        time.sleep(settings.rollup_catch_up_interval_seconds)
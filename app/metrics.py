@@ -0,0 +1,223 @@
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from typing import Iterator, Optional, TypeVar
+
+# Prometheus text exposition without the client library. Updates are plain dict
+# operations with no locks: the ingest path runs on the event loop thread, and a
+# rare lost increment from a threadpool endpoint is an acceptable trade-off.
+
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304, 16777216)
+
+
+def _escape_label_value(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(names: tuple[str, ...], values: tuple[str, ...], extra: str = "") -> str:
+    parts = [f'{name}="{_escape_label_value(value)}"' for name, value in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def _format_number(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+
+class Counter:
+    kind = "counter"
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple[str, ...] = ()) -> None:
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = labelnames
+        self._values: dict[tuple[str, ...], float] = {}
+
+    def inc(self, *labels: str, amount: float = 1.0) -> None:
+        self._values[labels] = self._values.get(labels, 0.0) + amount
+
+    def value(self, *labels: str) -> float:
+        return self._values.get(labels, 0.0)
+
+    def samples(self) -> Iterator[str]:
+        for labels, value in list(self._values.items()):
+            yield f"{self.name}{_format_labels(self.labelnames, labels)} {_format_number(value)}"
+
+
+class Gauge(Counter):
+    kind = "gauge"
+
+    def set(self, value: float, *labels: str) -> None:
+        self._values[labels] = value
+
+    def dec(self, *labels: str, amount: float = 1.0) -> None:
+        self.inc(*labels, amount=-amount)
+
+
+class Histogram:
+    kind = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: tuple[str, ...] = (),
+        buckets: tuple[float, ...] = LATENCY_BUCKETS,
+    ) -> None:
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = labelnames
+        self.buckets = buckets
+        # Per label set: [per-bucket counts..., +Inf count, sum]
+        self._values: dict[tuple[str, ...], list[float]] = {}
+
+    def observe(self, value: float, *labels: str) -> None:
+        state = self._values.get(labels)
+        if state is None:
+            state = self._values[labels] = [0.0] * (len(self.buckets) + 2)
+        state[bisect_left(self.buckets, value)] += 1
+        state[-1] += value
+
+    @contextmanager
+    def time(self, *labels: str) -> Iterator[None]:
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, *labels)
+
+    def count(self, *labels: str) -> int:
+        state = self._values.get(labels)
+        return int(sum(state[:-1])) if state else 0
+
+    def samples(self) -> Iterator[str]:
+        for labels, state in list(self._values.items()):
+            cumulative = 0.0
+            for bound, bucket_count in zip(self.buckets + (float("inf"),), state[:-1]):
+                cumulative += bucket_count
+                le = _format_labels(self.labelnames, labels, f'le="{_format_number(bound)}"')
+                yield f"{self.name}_bucket{le} {_format_number(cumulative)}"
+            plain = _format_labels(self.labelnames, labels)
+            yield f"{self.name}_sum{plain} {_format_number(state[-1])}"
+            yield f"{self.name}_count{plain} {_format_number(cumulative)}"
+
+
+MetricT = TypeVar("MetricT", Counter, Histogram)
+
+
+class Registry:
+    def __init__(self) -> None:
+        self._metrics: list[Counter | Histogram] = []
+
+    def register(self, metric: MetricT) -> MetricT:
+        self._metrics.append(metric)
+        return metric
+
+    def render(self) -> str:
+        lines: list[str] = []
+        for metric in self._metrics:
+            lines.append(f"# HELP {metric.name} {metric.documentation}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            lines.extend(metric.samples())
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+
+ingest_signals_total = registry.register(
+    Counter("signal_router_ingest_signals_total", "Signals accepted for routing.", ("endpoint",))
+)
+ingest_token_signals_total = registry.register(
+    Counter(
+        "signal_router_ingest_token_signals_total",
+        "Signals accepted per inbound token, labelled by the token's bound source.",
+        ("token",),
+    )
+)
+ingest_rejected_total = registry.register(
+    Counter("signal_router_ingest_rejected_total", "Inbound requests or batch items rejected.", ("reason",))
+)
+ingest_shed_total = registry.register(
+    Counter("signal_router_ingest_shed_total", "Inbound requests turned away by admission control.", ("reason",))
+)
+ingest_in_flight = registry.register(
+    Gauge("signal_router_ingest_in_flight", "Admitted inbound requests still being processed.")
+)
+request_body_bytes = registry.register(
+    Histogram("signal_router_request_body_bytes", "Inbound body size in bytes.", ("endpoint",), SIZE_BUCKETS)
+)
+parse_seconds = registry.register(
+    Histogram("signal_router_parse_seconds", "Time spent in parse_signal_fields per signal.")
+)
+offload_total = registry.register(
+    Counter("signal_router_offload_total", "Inbound parse jobs by where they ran.", ("executor",))
+)
+offload_seconds = registry.register(
+    Histogram("signal_router_offload_seconds", "Executor wait plus run time of an offloaded parse job.", ("executor",))
+)
+event_loop_lag_seconds = registry.register(
+    Histogram("signal_router_event_loop_lag_seconds", "How late the event loop wakes a 100 ms timer.")
+)
+rule_eval_seconds = registry.register(
+    Histogram("signal_router_rule_eval_seconds", "Time spent matching all rules against one signal.")
+)
+template_render_seconds = registry.register(
+    Histogram("signal_router_template_render_seconds", "Time spent rendering one output template.")
+)
+rule_matches_total = registry.register(
+    Counter("signal_router_rule_matches_total", "Signals matched per rule.", ("rule_id",))
+)
+db_commit_seconds = registry.register(
+    Histogram("signal_router_db_commit_seconds", "Latency of ingest-path database commits.")
+)
+outbound_seconds = registry.register(
+    Histogram("signal_router_outbound_seconds", "Outbound WeCom request latency.", ("target",))
+)
+outbound_total = registry.register(
+    Counter(
+        "signal_router_outbound_total",
+        "Outbound WeCom requests by HTTP status and WeCom errcode.",
+        ("target", "status", "errcode"),
+    )
+)
+outbound_circuit_open = registry.register(
+    Gauge("signal_router_outbound_circuit_open", "1 while the target's circuit breaker is open.", ("target",))
+)
+lane_queue_depth = registry.register(
+    Gauge("signal_router_lane_queue_depth", "Outbound sends waiting for a slot, per dispatch lane.", ("lane",))
+)
+lane_wait_seconds = registry.register(
+    Histogram("signal_router_lane_wait_seconds", "Time a send waited for an outbound slot.", ("lane",))
+)
+lane_delivery_seconds = registry.register(
+    Histogram("signal_router_lane_delivery_seconds", "Queue wait plus WeCom request time per send.", ("lane",))
+)
+live_subscribers = registry.register(
+    Gauge("signal_router_live_subscribers", "Open live signal streams in this worker.")
+)
+live_dropped_total = registry.register(
+    Counter("signal_router_live_dropped_total", "Live streams cut off because their buffer filled up.")
+)
+trace_export_dropped_total = registry.register(
+    Counter("signal_router_trace_export_dropped_total", "Sampled traces not exported because the export queue was full.")
+)
+
+
+def wecom_errcode(response_body: Optional[str]) -> str:
+    # WeCom answers {"errcode":0,"errmsg":"ok"}; avoid a full JSON parse on the hot path.
+    if not response_body:
+        return ""
+    marker = response_body.find('"errcode"')
+    if marker < 0:
+        return ""
+    colon = response_body.find(":", marker)
+    if colon < 0:
+        return ""
+    start = end = colon + 1
+    while end < len(response_body) and (response_body[end] in "-0123456789 "):
+        end += 1
+    return response_body[start:end].strip()
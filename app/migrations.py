@@ -0,0 +1,252 @@
+import argparse
+import logging
+import time
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Callable, Optional
+
+from sqlalchemy import Column, DateTime, Integer, MetaData, String, Table, func, inspect, insert, select, text
+from sqlalchemy.engine import Engine
+from sqlmodel import SQLModel
+
+from app.config import settings
+from app.db import engine, process_lock
+from app.models import Delivery, DeliveryRollup, RollupWatermark
+from app.rollups import fold_pending_rollups, rollup_watermark_insert
+
+logger = logging.getLogger(__name__)
+
+# Short pause between backfill batches so ingest writers can take the SQLite write lock.
+BACKFILL_PAUSE_SECONDS = 0.05
+
+schema_migrations = Table(
+    "schema_migrations",
+    MetaData(),
+    Column("version", Integer, primary_key=True),
+    Column("name", String(100), nullable=False),
+    Column("applied_at", DateTime, nullable=False),
+)
+
+
+@dataclass
+class Migration:
+    version: int
+    name: str
+    apply: Callable[[Engine], None]
+    # Online migrations (index builds, backfills) are run by the CLI during deploy while the
+    # old workers keep serving; worker startup only waits for the offline ones.
+    online: bool = False
+
+
+def add_column_if_missing(bind: Engine, table: str, column: str, ddl_type: str) -> None:
+    existing = {item["name"] for item in inspect(bind).get_columns(table)}
+    if column not in existing:
+        with bind.begin() as conn:
+            conn.execute(text(f'ALTER TABLE "{table}" ADD COLUMN "{column}" {ddl_type}'))
+
+
+def create_index_online(bind: Engine, table: str, *columns: str) -> None:
+    # Same name SQLModel gives index=True columns, so fresh and migrated databases match.
+    name = f"ix_{table}_{'_'.join(columns)}"
+    column_list = ", ".join(f'"{column}"' for column in columns)
+    if bind.dialect.name == "postgresql":
+        # CONCURRENTLY cannot run inside a transaction, and a failed build leaves an INVALID
+        # index behind that IF NOT EXISTS would silently accept; drop it and rebuild.
+        with bind.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+            invalid = conn.execute(
+                text(
+                    "SELECT 1 FROM pg_class c JOIN pg_index i ON i.indexrelid = c.oid "
+                    "WHERE c.relname = :name AND NOT i.indisvalid"
+                ),
+                {"name": name},
+            ).first()
+            if invalid:
+                conn.execute(text(f'DROP INDEX CONCURRENTLY IF EXISTS "{name}"'))
+            conn.execute(text(f'CREATE INDEX CONCURRENTLY IF NOT EXISTS "{name}" ON "{table}" ({column_list})'))
+        return
+    # SQLite has no concurrent build: readers keep going under WAL, and ingest writers wait
+    # on busy_timeout for the single statement instead of failing.
+    with bind.begin() as conn:
+        conn.execute(text(f'CREATE INDEX IF NOT EXISTS "{name}" ON "{table}" ({column_list})'))
+
+
+def backfill_in_batches(bind: Engine, table: str, assignment: str, where: str, batch_size: int = 0) -> int:
+    # Small UPDATE transactions keyed on id, so a large backfill never holds the write lock long.
+    batch_size = batch_size or settings.migration_batch_size
+    statement = text(
+        f'UPDATE "{table}" SET {assignment} WHERE id IN (SELECT id FROM "{table}" WHERE {where} LIMIT :limit)'
+    )
+    updated = 0
+    while True:
+        with bind.begin() as conn:
+            rowcount = conn.execute(statement, {"limit": batch_size}).rowcount
+        if not rowcount:
+            return updated
+        updated += rowcount
+        time.sleep(BACKFILL_PAUSE_SECONDS)
+
+
+def _baseline(bind: Engine) -> None:
+    SQLModel.metadata.create_all(bind)
+
+
+def _add_trace_delete_and_timing_columns(bind: Engine) -> None:
+    add_column_if_missing(bind, "signal", "trace_json", "TEXT")
+    add_column_if_missing(bind, "rule", "deleted_at", "TIMESTAMP")
+    add_column_if_missing(bind, "rule", "delete_mode", "VARCHAR(20)")
+    add_column_if_missing(bind, "delivery", "duration_ms", "FLOAT")
+
+
+def _index_signal_history(bind: Engine) -> None:
+    for column in ("received_at", "source", "match_count", "delivery_count"):
+        create_index_online(bind, "signal", column)
+
+
+def _index_rule_lookups(bind: Engine) -> None:
+    create_index_online(bind, "rule", "deleted_at")
+    create_index_online(bind, "rule", "updated_at")
+
+
+def _add_delivery_rollups(bind: Engine) -> None:
+    # New workers upsert rollups as they route, so the table must exist before they start.
+    # Old workers keep writing unrolled deliveries until they stop; the fold only goes up to
+    # the watermark here, and the workers' catch-up (app.maintenance) folds the rest.
+    add_column_if_missing(bind, "delivery", "rolled_up", "BOOLEAN")
+    DeliveryRollup.__table__.create(bind, checkfirst=True)
+    RollupWatermark.__table__.create(bind, checkfirst=True)
+    with bind.begin() as conn:
+        conn.execute(rollup_watermark_insert(bind.dialect.name), {"id": 1, "delivery_id": 0})
+    fold_pending_rollups(bind)
+
+
+def _add_rule_lane(bind: Engine) -> None:
+    add_column_if_missing(bind, "rule", "lane", "VARCHAR(20)")
+
+
+def _backfill_rule_lane(bind: Engine) -> None:
+    # NULL already routes as "normal"; the backfill only makes the stored value explicit.
+    backfill_in_batches(bind, "rule", "lane = 'normal'", "lane IS NULL")
+
+
+def _add_rule_sources(bind: Engine) -> None:
+    add_column_if_missing(bind, "rule", "sources", "VARCHAR(500)")
+
+
+def _scope_rule_name_to_live_rules(bind: Engine) -> None:
+    # create_all made ix_rule_name unique over all rows, archived ones included.
+    with bind.begin() as conn:
+        conn.execute(text('DROP INDEX IF EXISTS "ix_rule_name"'))
+        conn.execute(text('CREATE INDEX "ix_rule_name" ON "rule" ("name")'))
+        conn.execute(
+            text('CREATE UNIQUE INDEX IF NOT EXISTS "uq_rule_live_name" ON "rule" ("name") WHERE deleted_at IS NULL')
+        )
+
+
+def _add_rollup_watermark(bind: Engine) -> None:
+    # Databases that took migration 5 before the watermark existed already counted every
+    # delivery up to now, so start the watermark at the current last id.
+    add_column_if_missing(bind, "delivery", "rolled_up", "BOOLEAN")
+    RollupWatermark.__table__.create(bind, checkfirst=True)
+    with bind.begin() as conn:
+        if conn.execute(select(RollupWatermark.__table__.c.id)).first() is None:
+            last_id = conn.execute(select(func.max(Delivery.__table__.c.id))).scalar()
+            conn.execute(insert(RollupWatermark.__table__).values(id=1, delivery_id=last_id or 0))
+
+
+def _add_signal_routed_at(bind: Engine) -> None:
+    add_column_if_missing(bind, "signal", "routed_at", "TIMESTAMP")
+
+
+def _index_signal_routed_at(bind: Engine) -> None:
+    create_index_online(bind, "signal", "routed_at")
+
+
+MIGRATIONS = [
+    Migration(1, "baseline", _baseline),
+    Migration(2, "add_trace_delete_and_timing_columns", _add_trace_delete_and_timing_columns),
+    Migration(3, "index_signal_history", _index_signal_history, online=True),
+    Migration(4, "index_rule_lookups", _index_rule_lookups, online=True),
+    Migration(5, "add_delivery_rollups", _add_delivery_rollups),
+    Migration(6, "add_rule_lane", _add_rule_lane),
+    Migration(7, "backfill_rule_lane", _backfill_rule_lane, online=True),
+    Migration(8, "add_rule_sources", _add_rule_sources),
+    Migration(9, "scope_rule_name_to_live_rules", _scope_rule_name_to_live_rules),
+    Migration(10, "add_rollup_watermark", _add_rollup_watermark),
+    Migration(11, "add_signal_routed_at", _add_signal_routed_at),
+    Migration(12, "index_signal_routed_at", _index_signal_routed_at, online=True),
+]
+
+
+def applied_versions(bind: Engine) -> set[int]:
+    if not inspect(bind).has_table(schema_migrations.name):
+        return set()
+    with bind.connect() as conn:
+        return set(conn.execute(select(schema_migrations.c.version)).scalars())
+
+
+def pending_migrations(bind: Engine, include_online: bool = True) -> list[Migration]:
+    applied = applied_versions(bind)
+    return [item for item in MIGRATIONS if item.version not in applied and (include_online or not item.online)]
+
+
+def _record(bind: Engine, migrations: list[Migration]) -> None:
+    if not migrations:
+        return
+    now = datetime.utcnow()
+    with bind.begin() as conn:
+        conn.execute(
+            insert(schema_migrations),
+            [{"version": item.version, "name": item.name, "applied_at": now} for item in migrations],
+        )
+
+
+def _apply(bind: Engine, migrations: list[Migration]) -> None:
+    for migration in migrations:
+        started = time.perf_counter()
+        migration.apply(bind)
+        _record(bind, [migration])
+        logger.info("applied migration %s %s in %.2fs", migration.version, migration.name, time.perf_counter() - started)
+
+
+def upgrade(bind: Optional[Engine] = None, include_online: bool = True) -> list[Migration]:
+    bind = bind or engine
+    with process_lock("migrations"):
+        fresh = not inspect(bind).has_table("signal")
+        schema_migrations.create(bind, checkfirst=True)
+        if fresh:
+            # create_all already produces the latest schema, indexes included.
+            _baseline(bind)
+            pending = pending_migrations(bind)
+            _record(bind, pending)
+            return pending
+        offline = pending_migrations(bind, include_online=False)
+        _apply(bind, offline)
+    if not include_online:
+        return offline
+    # Index builds can take a while; hold a separate lock so restarting workers are not kept waiting.
+    with process_lock("online-migrations"):
+        online = pending_migrations(bind)
+        _apply(bind, online)
+    return offline + online
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="数据库表结构迁移（索引在线创建，不阻塞入站写入）")
+    parser.add_argument("command", nargs="?", choices=("upgrade", "status"), default="upgrade")
+    parser.add_argument("--offline-only", action="store_true", help="只执行启动所需的迁移，跳过在线建索引/回填")
+    args = parser.parse_args()
+    logging.basicConfig(level=settings.log_level, format="%(asctime)s %(levelname)s %(message)s")
+
+    if args.command == "status":
+        applied = applied_versions(engine)
+        for item in MIGRATIONS:
+            mark = "applied" if item.version in applied else "pending"
+            print(f"{item.version:04d} {item.name:<40} {'online' if item.online else 'offline':<8} {mark}")
+        return
+
+    done = upgrade(include_online=not args.offline_only)
+    print(f"applied {len(done)} migration(s)" + (": " + ", ".join(item.name for item in done) if done else ""))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,28 +1,50 @@
 from datetime import datetime
 from typing import Optional
 
+from sqlalchemy import Index, UniqueConstraint, text
 from sqlmodel import Field, SQLModel
 
 
 class Signal(SQLModel, table=True):
     id: Optional[int] = Field(default=None, primary_key=True)
-    received_at: datetime = Field(default_factory=datetime.utcnow, nullable=False)
-    source: Optional[str] = Field(default=None, max_length=100)
+    received_at: datetime = Field(default_factory=datetime.utcnow, nullable=False, index=True)
+    source: Optional[str] = Field(default=None, max_length=100, index=True)
     raw_payload: str = Field(nullable=False)
     parsed_fields: str = Field(nullable=False)
-    match_count: int = Field(default=0, nullable=False)
-    delivery_count: int = Field(default=0, nullable=False)
+    match_count: int = Field(default=0, nullable=False, index=True)
+    delivery_count: int = Field(default=0, nullable=False, index=True)
+    # Set by the routing commit; the history pages' ETag watches it, since a match without
+    # valid targets writes no delivery row.
+    routed_at: Optional[datetime] = Field(default=None, index=True)
+    # Sampled stage timings, see app.tracing: [[stage, detail, start_ms, duration_ms], ...]
+    trace_json: Optional[str] = Field(default=None)
+
+
+LIVE_RULE = text("deleted_at IS NULL")
 
 
 class Rule(SQLModel, table=True):
+    # Names are unique among live rules only, so a deleted rule's name can be reused while
+    # its archived row keeps the name for delivery history.
+    __table_args__ = (
+        Index("uq_rule_live_name", "name", unique=True, sqlite_where=LIVE_RULE, postgresql_where=LIVE_RULE),
+    )
+
     id: Optional[int] = Field(default=None, primary_key=True)
-    name: str = Field(unique=True, index=True, max_length=100, nullable=False)
+    name: str = Field(index=True, max_length=100, nullable=False)
     enabled: bool = Field(default=True, nullable=False)
     priority: int = Field(default=0, nullable=False)
+    # Dispatch lane for this rule's sends: urgent / normal / bulk (app.lanes).
+    lane: Optional[str] = Field(default="normal", max_length=20)
+    # Comma-separated signal sources the rule is limited to; NULL/empty matches every source.
+    sources: Optional[str] = Field(default=None, max_length=500)
     conditions_json: str = Field(nullable=False)
     action_json: str = Field(nullable=False)
     created_at: datetime = Field(default_factory=datetime.utcnow, nullable=False)
-    updated_at: datetime = Field(default_factory=datetime.utcnow, nullable=False)
+    updated_at: datetime = Field(default_factory=datetime.utcnow, nullable=False, index=True)
+    # Soft delete: "archive" keeps delivery history, "purge" removes it in the background.
+    deleted_at: Optional[datetime] = Field(default=None, index=True)
+    delete_mode: Optional[str] = Field(default=None, max_length=20)
 
 
 class Delivery(SQLModel, table=True):
@@ -36,4 +58,39 @@ class Delivery(SQLModel, table=True):
     response_body: Optional[str] = Field(default=None)
     success: bool = Field(nullable=False)
     error_message: Optional[str] = Field(default=None)
+    duration_ms: Optional[float] = Field(default=None)
     created_at: datetime = Field(default_factory=datetime.utcnow, nullable=False, index=True)
+    # Set when the routing commit also upserted the rollup; NULL rows (written before the
+    # rollup table existed, or by old workers mid-deploy) are folded by app.rollups.
+    rolled_up: Optional[bool] = Field(default=None)
+
+
+class DeliveryRollup(SQLModel, table=True):
+    # Hourly per-rule, per-target delivery counters, upserted in the same commit as the
+    # Delivery rows (app.rollups) so stats never scan the delivery table.
+    __table_args__ = (UniqueConstraint("bucket_start", "rule_id", "target_masked"),)
+
+    id: Optional[int] = Field(default=None, primary_key=True)
+    bucket_start: datetime = Field(nullable=False, index=True)
+    rule_id: int = Field(nullable=False, index=True)
+    target_masked: str = Field(max_length=255, nullable=False)
+    total: int = Field(default=0, nullable=False)
+    success: int = Field(default=0, nullable=False)
+    failure: int = Field(default=0, nullable=False)
+    latency_ms_sum: float = Field(default=0.0, nullable=False)
+    latency_count: int = Field(default=0, nullable=False)
+    # Latency histogram, one non-cumulative count per bucket (upper bound in ms).
+    latency_le_50: int = Field(default=0, nullable=False)
+    latency_le_100: int = Field(default=0, nullable=False)
+    latency_le_250: int = Field(default=0, nullable=False)
+    latency_le_500: int = Field(default=0, nullable=False)
+    latency_le_1000: int = Field(default=0, nullable=False)
+    latency_le_2500: int = Field(default=0, nullable=False)
+    latency_le_5000: int = Field(default=0, nullable=False)
+    latency_le_inf: int = Field(default=0, nullable=False)
+
+
+class RollupWatermark(SQLModel, table=True):
+    # Single row: every delivery with id <= delivery_id is already counted in the rollups.
+    id: int = Field(default=1, primary_key=True)
+    delivery_id: int = Field(default=0, nullable=False)
@@ -0,0 +1,164 @@
+import asyncio
+import json
+import time
+from concurrent.futures import Executor, ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import TYPE_CHECKING, Any, Callable, Optional, TypeVar
+
+from app import metrics
+from app.config import settings
+from app.parser import decode_ndjson_line, iter_json_array_payloads, parse_signal_fields
+from app.rules import lower_message_text
+
+if TYPE_CHECKING:
+    from concurrent.futures import ProcessPoolExecutor
+
+T = TypeVar("T")
+
+# The lag probe asks to wake up this often; how late it actually wakes is the loop lag.
+LOOP_LAG_PROBE_SECONDS = 0.1
+
+INLINE = "inline"
+THREAD = "thread"
+PROCESS = "process"
+
+
+@dataclass
+class PreparedSignal:
+    payload: dict[str, Any]
+    parsed_fields: dict[str, Any]
+    # Serialized once here and reused for the signal row and as-is forwards.
+    raw_payload: str
+    parsed_fields_json: str
+    # Lower-cased message_text for contains_text rules, computed here rather than per rule.
+    message_text_lower: str
+    decode_seconds: float = 0.0
+    parse_seconds: float = 0.0
+    serialize_seconds: float = 0.0
+
+
+def prepare_payload(payload: dict[str, Any], decode_seconds: float = 0.0) -> PreparedSignal:
+    started = time.perf_counter()
+    parsed_fields = parse_signal_fields(payload)
+    text_lower = lower_message_text(parsed_fields)
+    parsed = time.perf_counter()
+    raw_payload = json.dumps(payload, ensure_ascii=False)
+    parsed_fields_json = json.dumps(parsed_fields, ensure_ascii=False)
+    return PreparedSignal(
+        payload=payload,
+        parsed_fields=parsed_fields,
+        raw_payload=raw_payload,
+        parsed_fields_json=parsed_fields_json,
+        message_text_lower=text_lower,
+        decode_seconds=decode_seconds,
+        parse_seconds=parsed - started,
+        serialize_seconds=time.perf_counter() - parsed,
+    )
+
+
+def prepare_body(body: bytes) -> PreparedSignal:
+    started = time.perf_counter()
+    payload = json.loads(body.decode("utf-8"))
+    if not isinstance(payload, dict):
+        raise ValueError("payload must be object")
+    return prepare_payload(payload, time.perf_counter() - started)
+
+
+def prepare_payloads(payloads: list[dict[str, Any]]) -> list[PreparedSignal]:
+    return [prepare_payload(payload) for payload in payloads]
+
+
+def decode_json_array(body: bytes, max_item_bytes: int) -> list[Any]:
+    # UnicodeDecodeError is a ValueError; the caller turns it into a 400.
+    return list(iter_json_array_payloads(body.decode("utf-8"), max_item_bytes))
+
+
+def decode_ndjson_lines(start_index: int, lines: list[Optional[bytes]], max_item_bytes: int) -> list[Any]:
+    return [decode_ndjson_line(start_index + offset, line, max_item_bytes) for offset, line in enumerate(lines)]
+
+
+_thread_pool: Optional[ThreadPoolExecutor] = None
+_process_pool: Optional["ProcessPoolExecutor"] = None
+
+
+def _thread_executor() -> ThreadPoolExecutor:
+    global _thread_pool
+    if _thread_pool is None:
+        _thread_pool = ThreadPoolExecutor(max_workers=settings.offload_workers, thread_name_prefix="offload")
+    return _thread_pool
+
+
+def _executor_for(size: int, allow_process: bool) -> tuple[str, Optional[Executor]]:
+    global _process_pool
+    if allow_process and settings.offload_process_min_bytes and size >= settings.offload_process_min_bytes:
+        if _process_pool is None:
+            # Imported here so workers that never see a large body skip multiprocessing at startup.
+            import multiprocessing
+            from concurrent.futures import ProcessPoolExecutor
+
+            # spawn, not fork: a forked child would inherit the event loop, DB pool and HTTP client.
+            _process_pool = ProcessPoolExecutor(
+                max_workers=settings.offload_workers, mp_context=multiprocessing.get_context("spawn")
+            )
+        return PROCESS, _process_pool
+    if settings.offload_thread_min_bytes and size >= settings.offload_thread_min_bytes:
+        return THREAD, _thread_executor()
+    return INLINE, None
+
+
+def _is_broken_pool(exc: Exception) -> bool:
+    # Only reached once a process pool exists, so this import is already loaded.
+    from concurrent.futures.process import BrokenProcessPool
+
+    return isinstance(exc, BrokenProcessPool)
+
+
+async def run_offloaded(size: int, func: Callable[..., T], *args: Any, allow_process: bool = True) -> T:
+    # Small bodies stay on the loop: a thread hop costs more than parsing a text message.
+    # Thread offload helps with the Python-level field walk; the C json codecs hold the GIL,
+    # so payloads of a megabyte or more go to a process pool instead.
+    global _process_pool
+    kind, executor = _executor_for(size, allow_process)
+    metrics.offload_total.inc(kind)
+    if executor is None:
+        return func(*args)
+    loop = asyncio.get_running_loop()
+    started = time.perf_counter()
+    try:
+        return await loop.run_in_executor(executor, func, *args)
+    except Exception as exc:
+        if kind != PROCESS or not _is_broken_pool(exc):
+            raise
+        # A child died (e.g. OOM on a huge payload); start a fresh pool next time and
+        # finish this one on a thread.
+        _process_pool = None
+        executor.shutdown(wait=False)
+        kind = THREAD
+        return await loop.run_in_executor(_thread_executor(), func, *args)
+    finally:
+        metrics.offload_seconds.observe(time.perf_counter() - started, kind)
+
+
+def shutdown_offload(wait: bool = False) -> None:
+    global _thread_pool, _process_pool
+    for pool in (_thread_pool, _process_pool):
+        if pool is not None:
+            pool.shutdown(wait=wait, cancel_futures=True)
+    _thread_pool = _process_pool = None
+
+
+class LoopLagMonitor:
+    def __init__(self) -> None:
+        # Latest probe result; admission control sheds ingest while the loop is behind.
+        self.last = 0.0
+
+    async def run(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            expected = loop.time() + LOOP_LAG_PROBE_SECONDS
+            await asyncio.sleep(LOOP_LAG_PROBE_SECONDS)
+            self.last = max(0.0, loop.time() - expected)
+            metrics.event_loop_lag_seconds.observe(self.last)
+
+
+loop_lag_monitor = LoopLagMonitor()
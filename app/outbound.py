@@ -0,0 +1,28 @@
+from typing import Optional
+
+import httpx
+
+from app.config import settings
+
+# One pooled client per worker process: keeps TLS sessions and connections to WeCom alive
+# instead of paying for a new SSL context and handshake on every signal.
+_client: Optional[httpx.AsyncClient] = None
+
+
+def get_http_client() -> httpx.AsyncClient:
+    global _client
+    if _client is None or _client.is_closed:
+        _client = httpx.AsyncClient(
+            timeout=settings.outbound_timeout_seconds,
+            # Matches the lane scheduler's slots so queuing happens there, in priority order,
+            # rather than first-come-first-served inside the pool.
+            limits=httpx.Limits(max_connections=settings.outbound_concurrency, max_keepalive_connections=20),
+        )
+    return _client
+
+
+async def close_http_client() -> None:
+    global _client
+    if _client is not None:
+        await _client.aclose()
+        _client = None
@@ -1,5 +1,8 @@
+import json
 import re
-from typing import Any
+from typing import Any, Iterator, Optional
+
+_json_decoder = json.JSONDecoder()
 
 
 def _walk_payload(value: Any, path: str, fields: dict[str, Any], text_chunks: list[str]) -> None:
@@ -52,3 +55,95 @@ def parse_signal_fields(payload: dict[str, Any]) -> dict[str, Any]:
                 fields[k] = v
 
     return fields
+
+
+BatchItem = tuple[int, Optional[dict[str, Any]], Optional[str]]
+
+
+def _check_batch_item(index: int, value: Any, size: int, max_item_bytes: int) -> BatchItem:
+    if size > max_item_bytes:
+        return index, None, "payload too large"
+    if not isinstance(value, dict):
+        return index, None, "payload must be object"
+    return index, value, None
+
+
+class NdjsonLineSplitter:
+    # Splits streamed NDJSON into lines; an over-long line is dropped as soon as it
+    # crosses the limit and reported as None instead of being buffered whole.
+    def __init__(self, max_line_bytes: int) -> None:
+        self.max_line_bytes = max_line_bytes
+        self._buffer = bytearray()
+        self._oversized = False
+
+    def feed(self, chunk: bytes) -> list[Optional[bytes]]:
+        pieces = chunk.split(b"\n")
+        lines = [self._take(piece) for piece in pieces[:-1]]
+        self._append(pieces[-1])
+        return [line for line in lines if line is None or line.strip()]
+
+    def close(self) -> list[Optional[bytes]]:
+        if not self._oversized and not self._buffer.strip():
+            return []
+        return [self._take(b"")]
+
+    def _append(self, piece: bytes) -> None:
+        if self._oversized:
+            return
+        self._buffer += piece
+        if len(self._buffer) > self.max_line_bytes:
+            self._buffer.clear()
+            self._oversized = True
+
+    def _take(self, piece: bytes) -> Optional[bytes]:
+        self._append(piece)
+        if self._oversized:
+            self._oversized = False
+            return None
+        line = bytes(self._buffer)
+        self._buffer.clear()
+        return line
+
+
+def decode_ndjson_line(index: int, line: Optional[bytes], max_item_bytes: int) -> BatchItem:
+    if line is None:
+        return index, None, "payload too large"
+    try:
+        value = json.loads(line)
+    except ValueError:
+        return index, None, "invalid json"
+    return _check_batch_item(index, value, len(line), max_item_bytes)
+
+
+def iter_json_array_payloads(text: str, max_item_bytes: int) -> Iterator[BatchItem]:
+    # Decode one element at a time; a malformed element makes the rest unreadable, so stop there.
+    pos = _skip_ws(text, 0)
+    if not text.startswith("[", pos):
+        yield 0, None, "invalid json"
+        return
+    pos = _skip_ws(text, pos + 1)
+    if text.startswith("]", pos):
+        return
+    index = 0
+    while True:
+        try:
+            value, end = _json_decoder.raw_decode(text, pos)
+        except ValueError:
+            yield index, None, "invalid json"
+            return
+        size = len(text[pos:end].encode("utf-8"))
+        yield _check_batch_item(index, value, size, max_item_bytes)
+        index += 1
+        pos = _skip_ws(text, end)
+        if text.startswith(",", pos):
+            pos = _skip_ws(text, pos + 1)
+            continue
+        if not text.startswith("]", pos) or text[pos + 1 :].strip():
+            yield index, None, "invalid json"
+        return
+
+
+def _skip_ws(text: str, pos: int) -> int:
+    while pos < len(text) and text[pos] in " \t\r\n":
+        pos += 1
+    return pos
@@ -0,0 +1,49 @@
+import cProfile
+import io
+import os
+import pstats
+import sys
+import threading
+import time
+from collections import Counter
+
+MAX_PROFILE_SECONDS = 60.0
+DEFAULT_SAMPLE_INTERVAL = 0.005
+
+# Only one sampler or cProfile session at a time: cProfile hooks are per thread and the
+# ingest path shares the event loop thread, so overlapping sessions would clobber each other.
+profile_lock = threading.Lock()
+
+
+def _frame_label(frame) -> str:
+    code = frame.f_code
+    directory, filename = os.path.split(code.co_filename)
+    return f"{os.path.basename(directory)}/{filename}:{code.co_qualname}"
+
+
+def sample_stacks(seconds: float, interval: float = DEFAULT_SAMPLE_INTERVAL) -> str:
+    # Polls sys._current_frames() from a worker thread; returns Brendan Gregg's collapsed
+    # format ("frame;frame;frame count"), readable by flamegraph.pl and speedscope.
+    seconds = min(max(seconds, interval), MAX_PROFILE_SECONDS)
+    sampler_id = threading.get_ident()
+    thread_names = {thread.ident: thread.name for thread in threading.enumerate()}
+    stacks: Counter[str] = Counter()
+    deadline = time.monotonic() + seconds
+    while time.monotonic() < deadline:
+        for thread_id, frame in sys._current_frames().items():
+            if thread_id == sampler_id:
+                continue
+            labels = []
+            while frame is not None:
+                labels.append(_frame_label(frame))
+                frame = frame.f_back
+            labels.append(thread_names.get(thread_id, str(thread_id)))
+            stacks[";".join(reversed(labels))] += 1
+        time.sleep(interval)
+    return "".join(f"{stack} {count}\n" for stack, count in stacks.most_common())
+
+
+def format_profile_stats(profiler: cProfile.Profile, limit: int = 40) -> str:
+    stream = io.StringIO()
+    pstats.Stats(profiler, stream=stream).sort_stats("cumulative").print_stats(limit)
+    return stream.getvalue()
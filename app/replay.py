@@ -0,0 +1,260 @@
+import argparse
+import json
+import multiprocessing
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Any, Iterator, Optional
+
+from sqlmodel import Session, select
+
+from app.config import settings
+from app.db import engine
+from app.lanes import WECOM_MESSAGES_PER_MINUTE
+from app.models import Rule, Signal
+from app.rules import lower_message_text, match_rule
+from app.security import decrypt_text, mask_webhook
+
+
+# Saved rules have ids from 1, so the unsaved CLI candidate can never share a match counter.
+CANDIDATE_RULE_ID = 0
+
+
+@dataclass
+class ReplayRule:
+    id: int
+    name: str
+    conditions: dict[str, Any]
+    targets: list[str]
+    # Empty: every source, as for live rules.
+    sources: tuple[str, ...] = ()
+
+
+@dataclass
+class ReplayReport:
+    scanned: int = 0
+    first_signal_id: Optional[int] = None
+    last_signal_id: Optional[int] = None
+    matches: Counter = field(default_factory=Counter)
+    deliveries: Counter = field(default_factory=Counter)
+    per_minute: Counter = field(default_factory=Counter)
+    # Set when max_signals stopped the scan before the end of the window.
+    truncated: bool = False
+
+    def merge(self, scanned: int, matches: Counter, per_minute: Counter) -> None:
+        self.scanned += scanned
+        self.matches.update(matches)
+        self.per_minute.update(per_minute)
+        for (target, _), count in per_minute.items():
+            self.deliveries[target] += count
+
+    def overflow(self) -> Counter:
+        overflow: Counter = Counter()
+        for (target, _), count in self.per_minute.items():
+            if count > WECOM_MESSAGES_PER_MINUTE:
+                overflow[target] += count - WECOM_MESSAGES_PER_MINUTE
+        return overflow
+
+    def busiest_minutes(self) -> dict[str, int]:
+        busiest: dict[str, int] = {}
+        for (target, _), count in self.per_minute.items():
+            busiest[target] = max(busiest.get(target, 0), count)
+        return busiest
+
+    def to_dict(self, rules: list[ReplayRule]) -> dict[str, Any]:
+        overflow = self.overflow()
+        busiest = self.busiest_minutes()
+        return {
+            "scanned": self.scanned,
+            "first_signal_id": self.first_signal_id,
+            "last_signal_id": self.last_signal_id,
+            "truncated": self.truncated,
+            "rules": [
+                {"id": rule.id, "name": rule.name, "matches": self.matches[rule.id]} for rule in rules
+            ],
+            "targets": [
+                {
+                    "target": target,
+                    "deliveries": count,
+                    "busiest_minute": busiest.get(target, 0),
+                    "rate_limit_overflow": overflow[target],
+                }
+                for target, count in self.deliveries.most_common()
+            ],
+        }
+
+
+def compile_replay_rule(rule: Rule) -> ReplayRule:
+    try:
+        conditions = json.loads(rule.conditions_json)
+        action = json.loads(rule.action_json)
+    except ValueError:
+        conditions, action = {}, {}
+    targets = []
+    for item in action.get("targets", []) if isinstance(action, dict) else []:
+        url = decrypt_text(item) if isinstance(item, str) else None
+        if url:
+            targets.append(mask_webhook(url))
+    return ReplayRule(
+        id=rule.id,
+        name=rule.name,
+        conditions=conditions if isinstance(conditions, dict) else {},
+        targets=targets,
+        sources=tuple(item.strip() for item in (rule.sources or "").split(",") if item.strip()),
+    )
+
+
+def load_replay_rules(session: Session, rule_ids: list[int], include_enabled: bool) -> list[ReplayRule]:
+    statement = select(Rule).where(Rule.deleted_at == None)  # noqa: E711
+    if include_enabled:
+        statement = statement.where((Rule.enabled == True) | Rule.id.in_(rule_ids))  # noqa: E712
+    else:
+        statement = statement.where(Rule.id.in_(rule_ids))
+    rules = session.exec(statement.order_by(Rule.priority.desc())).all()
+    return [compile_replay_rule(rule) for rule in rules]
+
+
+def iter_signal_chunks(
+    session: Session,
+    chunk_size: int,
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
+) -> Iterator[list[tuple[int, datetime, str, Optional[str]]]]:
+    last_id = 0
+    while True:
+        statement = select(Signal.id, Signal.received_at, Signal.parsed_fields, Signal.source).where(
+            Signal.id > last_id
+        )
+        if since:
+            statement = statement.where(Signal.received_at >= since)
+        if until:
+            statement = statement.where(Signal.received_at < until)
+        rows = session.exec(statement.order_by(Signal.id).limit(chunk_size)).all()
+        if not rows:
+            return
+        last_id = rows[-1][0]
+        yield [tuple(row) for row in rows]
+
+
+def evaluate_chunk(
+    rules: list[ReplayRule], rows: list[tuple[int, datetime, str, Optional[str]]]
+) -> tuple[int, Counter, Counter]:
+    matches: Counter = Counter()
+    per_minute: Counter = Counter()
+    for _, received_at, parsed_fields_json, source in rows:
+        try:
+            parsed_fields = json.loads(parsed_fields_json)
+        except ValueError:
+            continue
+        minute = received_at.replace(second=0, microsecond=0).isoformat()
+        text_lower = lower_message_text(parsed_fields)
+        for rule in rules:
+            if rule.sources and source not in rule.sources:
+                continue
+            if not match_rule(parsed_fields, rule.conditions, text_lower):
+                continue
+            matches[rule.id] += 1
+            for target in rule.targets:
+                per_minute[(target, minute)] += 1
+    return len(rows), matches, per_minute
+
+
+def run_replay(
+    rules: list[ReplayRule],
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
+    workers: int = 1,
+    chunk_size: int = 0,
+    max_signals: int = 0,
+) -> ReplayReport:
+    chunk_size = chunk_size or settings.replay_chunk_size
+    report = ReplayReport()
+    with Session(engine) as session:
+        chunks = _capped(report, iter_signal_chunks(session, chunk_size, since, until), max_signals)
+        if workers <= 1:
+            for rows in chunks:
+                _note_range(report, rows)
+                report.merge(*evaluate_chunk(rules, rows))
+            return report
+
+        # Keep at most two chunks per worker in flight so memory stays bounded on long histories.
+        # spawn, not fork: the admin page runs this inside a worker that owns an event loop,
+        # a DB pool and an HTTP client, none of which a forked child may touch.
+        with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn")) as pool:
+            pending = []
+            for rows in chunks:
+                _note_range(report, rows)
+                pending.append(pool.submit(evaluate_chunk, rules, rows))
+                if len(pending) >= workers * 2:
+                    report.merge(*pending.pop(0).result())
+            for future in pending:
+                report.merge(*future.result())
+    return report
+
+
+def _capped(
+    report: ReplayReport, chunks: Iterator[list[tuple[int, datetime, str, Optional[str]]]], max_signals: int
+) -> Iterator[list[tuple[int, datetime, str, Optional[str]]]]:
+    remaining = max_signals
+    for rows in chunks:
+        if max_signals and len(rows) >= remaining:
+            yield rows[:remaining]
+            # Only a truncation if the window really had more signals than the cap.
+            report.truncated = len(rows) > remaining or next(chunks, None) is not None
+            return
+        remaining -= len(rows)
+        yield rows
+
+
+def _note_range(report: ReplayReport, rows: list[tuple[int, datetime, str, Optional[str]]]) -> None:
+    if report.first_signal_id is None:
+        report.first_signal_id = rows[0][0]
+    report.last_signal_id = rows[-1][0]
+
+
+def _candidate_from_args(args: argparse.Namespace) -> Optional[ReplayRule]:
+    if args.contains_text:
+        item = {"type": "contains_text", "text": args.contains_text}
+    elif args.contains_field:
+        item = {"type": "contains_field", "field": args.contains_field}
+    elif args.always:
+        item = {"type": "always"}
+    else:
+        return None
+    return ReplayRule(
+        id=CANDIDATE_RULE_ID,
+        name="候选规则",
+        conditions={"op": "and", "items": [item]},
+        targets=[mask_webhook(url) for url in args.target],
+    )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="规则试运行：用历史信号回放候选规则，只统计不转发")
+    parser.add_argument("--rule-id", type=int, action="append", default=[], help="要回放的已有规则 ID，可重复")
+    parser.add_argument("--include-enabled", action="store_true", help="同时回放所有启用中的规则（用于评估共享目标的频控）")
+    parser.add_argument("--contains-text", help="临时候选规则：消息内容包含关键词")
+    parser.add_argument("--contains-field", help="临时候选规则：消息包含字段名")
+    parser.add_argument("--always", action="store_true", help="临时候选规则：全部消息")
+    parser.add_argument("--target", action="append", default=[], help="临时候选规则的目标 webhook，可重复")
+    parser.add_argument("--since", type=datetime.fromisoformat, help="起始时间(UTC)，如 2026-02-01T00:00")
+    parser.add_argument("--until", type=datetime.fromisoformat, help="结束时间(UTC)")
+    parser.add_argument("--workers", type=int, default=settings.replay_workers, help="并行进程数（1 为单进程）")
+    parser.add_argument("--chunk-size", type=int, default=settings.replay_chunk_size, help="每批读取的信号条数")
+    args = parser.parse_args()
+
+    with Session(engine) as session:
+        rules = load_replay_rules(session, args.rule_id, args.include_enabled)
+    candidate = _candidate_from_args(args)
+    if candidate:
+        rules.append(candidate)
+    if not rules:
+        parser.error("请指定 --rule-id、--include-enabled 或一个临时候选规则")
+
+    report = run_replay(rules, args.since, args.until, args.workers, args.chunk_size)
+    print(json.dumps(report.to_dict(rules), ensure_ascii=False, indent=2))
+
+
+if __name__ == "__main__":
+    main()
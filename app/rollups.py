@@ -0,0 +1,183 @@
+from datetime import datetime, timedelta
+from functools import lru_cache
+from itertools import takewhile
+from typing import Any, Iterable, Optional
+
+from sqlalchemy import func
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.engine import Engine
+from sqlmodel import Session, select
+
+from app.config import settings
+from app.models import Delivery, DeliveryRollup, RollupWatermark
+
+LATENCY_BUCKETS_MS = (50, 100, 250, 500, 1000, 2500, 5000)
+LATENCY_COLUMNS = tuple(f"latency_le_{bound}" for bound in LATENCY_BUCKETS_MS) + ("latency_le_inf",)
+COUNTER_COLUMNS = ("total", "success", "failure", "latency_ms_sum", "latency_count") + LATENCY_COLUMNS
+KEY_COLUMNS = ("bucket_start", "rule_id", "target_masked")
+# How old a delivery must be before the catch-up fold trusts that no lower id is still uncommitted.
+FOLD_SETTLE_SECONDS = 60
+STAT_GROUPS = {
+    "target": ("rule_id", "target_masked"),
+    "rule": ("rule_id",),
+    "hour": ("bucket_start",),
+}
+
+
+def hour_bucket(moment: datetime) -> datetime:
+    return moment.replace(minute=0, second=0, microsecond=0)
+
+
+def _latency_column(duration_ms: float) -> str:
+    for bound, column in zip(LATENCY_BUCKETS_MS, LATENCY_COLUMNS):
+        if duration_ms <= bound:
+            return column
+    return "latency_le_inf"
+
+
+def aggregate(deliveries: Iterable[Any]) -> list[dict[str, Any]]:
+    rows: dict[tuple[datetime, int, str], dict[str, Any]] = {}
+    for delivery in deliveries:
+        key = (hour_bucket(delivery.created_at), delivery.rule_id, delivery.target_masked)
+        row = rows.get(key)
+        if row is None:
+            row = rows[key] = {**dict(zip(KEY_COLUMNS, key)), **dict.fromkeys(COUNTER_COLUMNS, 0)}
+        row["total"] += 1
+        row["success" if delivery.success else "failure"] += 1
+        # Skipped sends (open circuit, template errors) are stored with 0 ms; keep them out of latency.
+        if delivery.duration_ms:
+            row["latency_ms_sum"] += delivery.duration_ms
+            row["latency_count"] += 1
+            row[_latency_column(delivery.duration_ms)] += 1
+    # Fixed key order so concurrent upserts lock rollup rows in the same order.
+    return [rows[key] for key in sorted(rows)]
+
+
+@lru_cache(maxsize=None)
+def rollup_upsert(dialect_name: str):
+    # Built once and executed with a parameter list, so the SQL is compiled a single time
+    # instead of once per routing commit.
+    dialect = postgresql if dialect_name == "postgresql" else sqlite
+    table = DeliveryRollup.__table__
+    statement = dialect.insert(table)
+    return statement.on_conflict_do_update(
+        index_elements=[table.c[name] for name in KEY_COLUMNS],
+        set_={name: table.c[name] + statement.excluded[name] for name in COUNTER_COLUMNS},
+    )
+
+
+@lru_cache(maxsize=None)
+def rollup_watermark_insert(dialect_name: str):
+    # First fold on a database without a watermark row; a concurrent first fold inserts
+    # nothing and reports rowcount 0, like a lost compare-and-swap.
+    dialect = postgresql if dialect_name == "postgresql" else sqlite
+    return dialect.insert(RollupWatermark.__table__).on_conflict_do_nothing(index_elements=["id"])
+
+
+def record_deliveries(session: Session, deliveries: list[Delivery]) -> None:
+    # Runs inside the routing transaction, so rollups and delivery rows commit together.
+    for delivery in deliveries:
+        delivery.rolled_up = True
+    rows = aggregate(deliveries)
+    if rows:
+        session.execute(rollup_upsert(session.get_bind().dialect.name), rows)
+
+
+def fold_pending_rollups(bind: Engine, batch_size: int = 0, settle_seconds: float = FOLD_SETTLE_SECONDS) -> int:
+    # Folds deliveries past the watermark that were routed without a rollup upsert, in id
+    # order. Each batch moves the shared watermark with a compare-and-swap in the same
+    # transaction as its upsert, so workers catching up at the same time never fold a row
+    # twice. Rows younger than settle_seconds stop the batch: a routing commit still in
+    # flight may hold a lower id.
+    batch_size = batch_size or settings.migration_batch_size
+    watermark = RollupWatermark.__table__
+    statement = select(
+        Delivery.id,
+        Delivery.created_at,
+        Delivery.rule_id,
+        Delivery.target_masked,
+        Delivery.success,
+        Delivery.duration_ms,
+        Delivery.rolled_up,
+    ).order_by(Delivery.id)
+    folded = 0
+    while True:
+        cutoff = datetime.utcnow() - timedelta(seconds=settle_seconds)
+        with bind.connect() as conn:
+            mark = conn.execute(select(watermark.c.delivery_id).where(watermark.c.id == 1)).scalar()
+            batch = conn.execute(statement.where(Delivery.id > (mark or 0)).limit(batch_size)).all()
+        settled = list(takewhile(lambda row: row.created_at < cutoff, batch))
+        if not settled:
+            return folded
+        pending = [row for row in settled if not row.rolled_up]
+        with bind.begin() as conn:
+            if mark is None:
+                moved = conn.execute(
+                    rollup_watermark_insert(bind.dialect.name), {"id": 1, "delivery_id": settled[-1].id}
+                ).rowcount
+            else:
+                moved = conn.execute(
+                    watermark.update()
+                    .where(watermark.c.id == 1, watermark.c.delivery_id == mark)
+                    .values(delivery_id=settled[-1].id)
+                ).rowcount
+            if moved and pending:
+                conn.execute(rollup_upsert(bind.dialect.name), aggregate(pending))
+                folded += len(pending)
+        # On a lost race another worker folded this batch; loop to re-read the watermark.
+        if moved and len(settled) < len(batch):
+            return folded
+
+
+def delete_rule_rollups(session: Session, rule_id: int) -> None:
+    session.execute(DeliveryRollup.__table__.delete().where(DeliveryRollup.rule_id == rule_id))
+
+
+def _latency_percentile(histogram: list[int], fraction: float) -> Optional[float]:
+    # Upper bound of the bucket holding the percentile; None when it falls in the +Inf bucket.
+    total = sum(histogram)
+    if not total:
+        return None
+    running = 0
+    for bound, count in zip(LATENCY_BUCKETS_MS, histogram):
+        running += count
+        if running >= total * fraction:
+            return float(bound)
+    return None
+
+
+def query_stats(
+    session: Session,
+    since: datetime,
+    until: Optional[datetime] = None,
+    rule_id: Optional[int] = None,
+    group: str = "target",
+) -> list[dict[str, Any]]:
+    group_columns = [getattr(DeliveryRollup, name) for name in STAT_GROUPS[group]]
+    statement = select(
+        *group_columns, *(func.sum(getattr(DeliveryRollup, name)).label(name) for name in COUNTER_COLUMNS)
+    ).where(DeliveryRollup.bucket_start >= hour_bucket(since))
+    if until is not None:
+        statement = statement.where(DeliveryRollup.bucket_start < until)
+    if rule_id is not None:
+        statement = statement.where(DeliveryRollup.rule_id == rule_id)
+    statement = statement.group_by(*group_columns).order_by(*group_columns)
+
+    items = []
+    for row in session.exec(statement).all():
+        histogram = [int(getattr(row, name)) for name in LATENCY_COLUMNS]
+        total = int(row.total)
+        item: dict[str, Any] = {name: getattr(row, name) for name in STAT_GROUPS[group]}
+        if "bucket_start" in item:
+            item["bucket_start"] = item["bucket_start"].isoformat()
+        item.update(
+            total=total,
+            success=int(row.success),
+            failure=int(row.failure),
+            failure_rate=round(int(row.failure) / total * 100, 1) if total else 0.0,
+            avg_latency_ms=round(row.latency_ms_sum / row.latency_count, 1) if row.latency_count else None,
+            p95_latency_ms=_latency_percentile(histogram, 0.95),
+            latency_histogram=dict(zip([str(bound) for bound in LATENCY_BUCKETS_MS] + ["+Inf"], histogram)),
+        )
+        items.append(item)
+    return items
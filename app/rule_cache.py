@@ -0,0 +1,33 @@
+from datetime import datetime
+from typing import Callable, Generic, Optional, TypeVar
+
+from sqlalchemy import func
+from sqlmodel import Session, select
+
+from app.models import Rule
+
+T = TypeVar("T")
+Fingerprint = tuple[int, Optional[datetime]]
+
+
+class RuleCache(Generic[T]):
+    # Per-worker cache of values derived from the rule table (compiled rules, admin view
+    # models). Every rule change bumps updated_at and purges change the row count, so one
+    # aggregate query tells each worker whether to rebuild, without cross-process messages.
+    def __init__(self) -> None:
+        # (fingerprint, value) swapped as one object so threadpool readers never see a mix.
+        self._entry: Optional[tuple[Fingerprint, T]] = None
+
+    def get(self, session: Session, build: Callable[[Session], T]) -> T:
+        return self.get_with_fingerprint(session, build)[1]
+
+    def get_with_fingerprint(self, session: Session, build: Callable[[Session], T]) -> tuple[Fingerprint, T]:
+        count, last_updated = session.exec(select(func.count(Rule.id), func.max(Rule.updated_at))).one()
+        fingerprint = (count, last_updated)
+        entry = self._entry
+        if entry is None or entry[0] != fingerprint:
+            entry = self._entry = (fingerprint, build(session))
+        return entry
+
+    def clear(self) -> None:
+        self._entry = None
@@ -1,13 +1,81 @@
-from typing import Any
+from dataclasses import dataclass, field
+from typing import TYPE_CHECKING, Any, Optional
 
+if TYPE_CHECKING:
+    from app.templating import OutputTemplate
 
-def match_rule(parsed_fields: dict[str, Any], conditions: dict[str, Any]) -> bool:
+
+@dataclass
+class CompiledRule:
+    id: int
+    conditions: dict[str, Any]
+    targets: list[str]
+    # Parallel to targets: the stored ciphertext, copied onto delivery rows as-is.
+    targets_encrypted: list[str] = field(default_factory=list)
+    # Parallel to targets; None means the default OUTBOUND_TIMEOUT_SECONDS.
+    timeouts: list[Optional[float]] = field(default_factory=list)
+    # None forwards the inbound payload unchanged.
+    template: Optional["OutputTemplate"] = None
+    template_error: Optional[str] = None
+    # Dispatch lane, see app.lanes.
+    lane: str = "normal"
+    # Sources this rule applies to; empty means every source.
+    sources: tuple[str, ...] = ()
+
+
+@dataclass
+class RuleIndex:
+    # Enabled rules partitioned by signal source, so matching only walks the rules that can
+    # apply. Each partition already merges that source's scoped rules with the unscoped ones,
+    # in priority order; sources no rule is scoped to share the unscoped list.
+    partitions: dict[str, list[CompiledRule]]
+    unscoped: list[CompiledRule]
+
+    def rules_for(self, source: Optional[str]) -> list[CompiledRule]:
+        if source is None:
+            return self.unscoped
+        return self.partitions.get(source, self.unscoped)
+
+
+def build_rule_index(rules: list[CompiledRule]) -> RuleIndex:
+    unscoped = [rule for rule in rules if not rule.sources]
+    partitions = {
+        source: [rule for rule in rules if not rule.sources or source in rule.sources]
+        for source in sorted({source for rule in rules for source in rule.sources})
+    }
+    return RuleIndex(partitions=partitions, unscoped=unscoped)
+
+
+@dataclass
+class RuleView:
+    # Admin-page projection of a live rule: targets are decrypted and masked once per rule
+    # version instead of on every page load.
+    id: int
+    name: str
+    priority: int
+    lane: str
+    sources: tuple[str, ...]
+    enabled: bool
+    # (url, masked url, timeout seconds or None)
+    targets: list[tuple[str, str, Optional[float]]]
+    condition_type: str
+    condition_value: str
+    template: Optional[dict[str, str]]
+
+
+def lower_message_text(parsed_fields: dict[str, Any]) -> str:
+    return str(parsed_fields.get("message_text", "")).lower()
+
+
+def match_rule(
+    parsed_fields: dict[str, Any], conditions: dict[str, Any], text_lower: Optional[str] = None
+) -> bool:
+    # text_lower lets callers lower-case the message once per signal instead of once per rule.
     op = conditions.get("op", "and")
     items = conditions.get("items", [])
     if op != "and":
         return False
-    message_text = str(parsed_fields.get("message_text", ""))
-    message_text_lower = message_text.lower()
+    message_text_lower = text_lower if text_lower is not None else lower_message_text(parsed_fields)
     for item in items:
         item_type = item.get("type")
         if item_type == "always":
@@ -25,3 +93,7 @@ def match_rule(parsed_fields: dict[str, Any], conditions: dict[str, Any]) -> boo
         else:
             return False
     return True
+
+
+def match_rules(parsed_fields: dict[str, Any], text_lower: str, rules: list[CompiledRule]) -> list[CompiledRule]:
+    return [rule for rule in rules if match_rule(parsed_fields, rule.conditions, text_lower)]
@@ -1,12 +1,15 @@
 import base64
 import hashlib
-from typing import Optional
+from functools import lru_cache
+from typing import TYPE_CHECKING, Optional
 
 from cryptography.fernet import Fernet, InvalidToken
-from itsdangerous import URLSafeSerializer, URLSafeTimedSerializer
 
 from app.config import settings
 
+if TYPE_CHECKING:
+    from itsdangerous import URLSafeSerializer, URLSafeTimedSerializer
+
 
 def _derive_fernet_key(raw: str) -> bytes:
     if raw:
@@ -20,8 +23,47 @@ def _derive_fernet_key(raw: str) -> bytes:
 
 
 fernet = Fernet(_derive_fernet_key(settings.fernet_key))
-session_serializer = URLSafeTimedSerializer(settings.session_secret, salt="admin-session")
-csrf_serializer = URLSafeSerializer(settings.session_secret, salt="admin-csrf")
+
+
+# Admin session/CSRF serializers are built on first admin request; ingest never needs them.
+@lru_cache(maxsize=None)
+def _session_serializer() -> "URLSafeTimedSerializer":
+    from itsdangerous import URLSafeTimedSerializer
+
+    return URLSafeTimedSerializer(settings.session_secret, salt="admin-session")
+
+
+@lru_cache(maxsize=None)
+def _csrf_serializer() -> "URLSafeSerializer":
+    from itsdangerous import URLSafeSerializer
+
+    return URLSafeSerializer(settings.session_secret, salt="admin-csrf")
+
+
+def inbound_token_digest(token: str) -> bytes:
+    return hashlib.sha256(token.encode("utf-8")).digest()
+
+
+@lru_cache(maxsize=None)
+def inbound_token_sources() -> dict[bytes, Optional[str]]:
+    # sha256(token) -> bound source. Looking up the digest costs the same however many
+    # tokens exist, and the dict comparison only sees a hash the caller cannot steer, so it
+    # leaks nothing useful about the stored tokens. INBOUND_TOKEN maps to None: its
+    # signals keep the source named in the payload.
+    sources: dict[bytes, Optional[str]] = {}
+    if settings.inbound_token:
+        sources[inbound_token_digest(settings.inbound_token)] = None
+    for entry in settings.inbound_tokens.split(","):
+        if not entry.strip():
+            continue
+        source, _, token = (part.strip() for part in entry.partition(":"))
+        if not source or not token:
+            raise ValueError("INBOUND_TOKENS entries must look like source:token")
+        digest = inbound_token_digest(token)
+        if digest in sources:
+            raise ValueError(f"INBOUND_TOKENS: token for source {source!r} is already in use")
+        sources[digest] = source
+    return sources
 
 
 def encrypt_text(value: str) -> str:
@@ -47,24 +89,24 @@ def mask_webhook(url: str) -> str:
 
 
 def build_session_token(username: str) -> str:
-    return session_serializer.dumps({"username": username})
+    return _session_serializer().dumps({"username": username})
 
 
 def parse_session_token(token: str) -> Optional[str]:
     try:
-        data = session_serializer.loads(token, max_age=settings.admin_session_ttl_seconds)
+        data = _session_serializer().loads(token, max_age=settings.admin_session_ttl_seconds)
         return data.get("username")
     except Exception:
         return None
 
 
 def build_csrf_token(username: str) -> str:
-    return csrf_serializer.dumps({"username": username})
+    return _csrf_serializer().dumps({"username": username})
 
 
 def verify_csrf_token(token: str, username: str) -> bool:
     try:
-        data = csrf_serializer.loads(token)
+        data = _csrf_serializer().loads(token)
     except Exception:
         return False
     return data.get("username") == username
@@ -10,7 +10,8 @@ from app.security import encrypt_text
 
 
 def upsert_rule(session: Session, name: str, priority: int, conditions: dict, target_urls: list[str]) -> Rule:
-    rule = session.exec(select(Rule).where(Rule.name == name)).first()
+    # Deleted rules keep their name; seeding creates a fresh live rule next to them.
+    rule = session.exec(select(Rule).where(Rule.name == name, Rule.deleted_at == None)).first()  # noqa: E711
     now = datetime.utcnow()
     action = {
         "type": "forward_wecom_webhooks",
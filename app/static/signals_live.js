@@ -0,0 +1,92 @@
+(function () {
+  const toggle = document.getElementById('liveToggle');
+  const status = document.getElementById('liveStatus');
+  const rows = document.getElementById('signalRows');
+  if (!toggle || !status || !rows) {
+    return;
+  }
+
+  const MAX_ROWS = 200;
+  let source = null;
+
+  function cell(text) {
+    const td = document.createElement('td');
+    td.textContent = text;
+    return td;
+  }
+
+  function findRow(id) {
+    return rows.querySelector('tr[data-signal-id="' + id + '"]');
+  }
+
+  function onSignal(message) {
+    const data = JSON.parse(message.data);
+    if (findRow(data.id)) {
+      return;
+    }
+    const tr = document.createElement('tr');
+    tr.dataset.signalId = data.id;
+    tr.appendChild(cell(data.id));
+    tr.appendChild(cell(data.received_at.replace('T', ' ')));
+    tr.appendChild(cell(data.source || '-'));
+    tr.appendChild(cell(data.match_count));
+    tr.appendChild(cell(data.delivery_count));
+    const link = document.createElement('a');
+    link.className = 'btn btn-sm btn-outline-primary';
+    link.href = '/admin/signals/' + data.id;
+    link.textContent = '查看';
+    const td = document.createElement('td');
+    td.appendChild(link);
+    tr.appendChild(td);
+    rows.insertBefore(tr, rows.firstChild);
+    while (rows.rows.length > MAX_ROWS) {
+      rows.deleteRow(-1);
+    }
+  }
+
+  function onRouted(message) {
+    const data = JSON.parse(message.data);
+    const tr = findRow(data.id);
+    if (!tr) {
+      return;
+    }
+    tr.cells[3].textContent = data.match_count;
+    tr.cells[4].textContent = data.delivery_count;
+    const failed = data.deliveries.filter(function (d) { return !d.success; }).length;
+    tr.classList.toggle('table-danger', failed > 0);
+    tr.title = failed ? failed + ' 个目标转发失败' : '';
+  }
+
+  function start() {
+    source = new EventSource('/admin/signals/stream');
+    source.addEventListener('signal', onSignal);
+    source.addEventListener('routed', onRouted);
+    source.addEventListener('dropped', function () {
+      status.textContent = '接收过慢已被断开，正在重连…';
+    });
+    source.onopen = function () {
+      status.textContent = '实时更新中';
+    };
+    source.onerror = function () {
+      status.textContent = '连接中断，正在重连…';
+    };
+    toggle.textContent = '停止实时';
+    toggle.classList.replace('btn-outline-success', 'btn-success');
+  }
+
+  function stop() {
+    source.close();
+    source = null;
+    status.textContent = '';
+    toggle.textContent = '实时模式';
+    toggle.classList.replace('btn-success', 'btn-outline-success');
+  }
+
+  toggle.addEventListener('click', function () {
+    if (source) {
+      stop();
+    } else {
+      start();
+    }
+  });
+})();
@@ -0,0 +1,63 @@
+from dataclasses import dataclass, field
+from datetime import datetime
+from functools import lru_cache
+from typing import TYPE_CHECKING, Any, Optional
+
+if TYPE_CHECKING:
+    from jinja2 import Template
+    from jinja2.sandbox import SandboxedEnvironment
+
+TEMPLATE_MSGTYPES = ("markdown", "markdown_v2", "text")
+
+
+@lru_cache(maxsize=None)
+def get_environment() -> "SandboxedEnvironment":
+    # jinja2 is imported on first use so workers without templated rules never load it.
+    # Sandboxed: templates are written in the admin UI and must not reach Python internals.
+    from jinja2.sandbox import SandboxedEnvironment
+
+    return SandboxedEnvironment(autoescape=False, trim_blocks=True, lstrip_blocks=True)
+
+
+@dataclass(frozen=True)
+class OutputTemplate:
+    msgtype: str
+    source: str
+    compiled: "Template" = field(compare=False, hash=False, repr=False)
+
+
+@lru_cache(maxsize=1024)
+def _compile(source: str) -> "Template":
+    # Keyed by source, so rules sharing a template text share one compiled template and a
+    # rule-cache rebuild only compiles templates that actually changed.
+    return get_environment().from_string(source)
+
+
+def build_output_template(msgtype: str, source: str) -> OutputTemplate:
+    from jinja2 import TemplateError
+
+    if msgtype not in TEMPLATE_MSGTYPES:
+        raise ValueError(f"unsupported msgtype: {msgtype}")
+    try:
+        compiled = _compile(source)
+    except TemplateError as exc:
+        raise ValueError(str(exc)) from exc
+    return OutputTemplate(msgtype=msgtype, source=source, compiled=compiled)
+
+
+def template_context(
+    parsed_fields: dict[str, Any],
+    payload: dict[str, Any],
+    signal_id: Optional[int],
+    source: Optional[str],
+    received_at: Optional[datetime],
+) -> dict[str, Any]:
+    # Simple field names ({{ symbol }}) are usable directly; dotted paths via fields["a.b"].
+    context = {key: value for key, value in parsed_fields.items() if key.isidentifier()}
+    context.update(fields=parsed_fields, payload=payload, signal_id=signal_id, source=source, received_at=received_at)
+    return context
+
+
+def render_output(template: OutputTemplate, context: dict[str, Any]) -> dict[str, Any]:
+    content = template.compiled.render(context)
+    return {"msgtype": template.msgtype, template.msgtype: {"content": content}}
@@ -0,0 +1,203 @@
+import json
+import logging
+import os
+import queue
+import random
+import secrets
+import threading
+import time
+from contextlib import contextmanager, nullcontext
+from typing import Any, ContextManager, Iterator, Optional, Union
+
+from app import metrics
+from app.config import settings
+
+logger = logging.getLogger(__name__)
+
+# Traces waiting for the export thread; beyond this the newest are dropped rather than
+# letting a slow disk grow memory without bound.
+EXPORT_QUEUE_SIZE = 10000
+EXPORT_BATCH_SIZE = 500
+# Pause between writes so traces arriving meanwhile go out in one append.
+EXPORT_FLUSH_SECONDS = 1.0
+
+
+class SignalTrace:
+    sampled = True
+
+    def __init__(self) -> None:
+        self._origin = time.perf_counter()
+        self._origin_unix_ns = time.time_ns()
+        # (stage, detail, start offset seconds, duration seconds)
+        self.spans: list[tuple[str, str, float, float]] = []
+
+    @contextmanager
+    def span(self, stage: str, detail: str = "") -> Iterator[None]:
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(stage, started, time.perf_counter(), detail)
+
+    def record(self, stage: str, started: float, finished: float, detail: str = "") -> None:
+        self.spans.append((stage, detail, started - self._origin, finished - started))
+
+    def to_json(self) -> str:
+        return json.dumps(
+            [[stage, detail, round(start * 1000, 3), round(duration * 1000, 3)] for stage, detail, start, duration in self.spans],
+            ensure_ascii=False,
+            separators=(",", ":"),
+        )
+
+    def export(self, signal_id: Optional[int]) -> None:
+        if settings.trace_export_path:
+            exporter.submit(self, signal_id)
+
+
+class _UnsampledTrace:
+    sampled = False
+    spans: list[tuple[str, str, float, float]] = []
+
+    def span(self, stage: str, detail: str = "") -> ContextManager[None]:
+        return nullcontext()
+
+    def record(self, stage: str, started: float, finished: float, detail: str = "") -> None:
+        pass
+
+    def to_json(self) -> Optional[str]:
+        return None
+
+    def export(self, signal_id: Optional[int]) -> None:
+        pass
+
+
+Trace = Union[SignalTrace, _UnsampledTrace]
+UNSAMPLED = _UnsampledTrace()
+
+
+def start_trace() -> Trace:
+    rate = settings.trace_sample_rate
+    if rate >= 1.0 or (rate > 0.0 and random.random() < rate):
+        return SignalTrace()
+    return UNSAMPLED
+
+
+def waterfall_rows(trace_json: Optional[str]) -> list[dict[str, Any]]:
+    try:
+        spans = json.loads(trace_json) if trace_json else []
+    except ValueError:
+        return []
+    total = max((start + duration for _, _, start, duration in spans), default=0.0) or 1.0
+    return [
+        {
+            "stage": stage,
+            "detail": detail,
+            "start_ms": start,
+            "duration_ms": duration,
+            "x_pct": round(start / total * 100, 2),
+            "w_pct": max(round(duration / total * 100, 2), 0.5),
+        }
+        for stage, detail, start, duration in spans
+    ]
+
+
+def _otlp_json_line(trace: SignalTrace, signal_id: Optional[int]) -> str:
+    # One OTLP/JSON "resourceSpans" document per line, as read by the OpenTelemetry
+    # Collector's otlpjsonfile receiver.
+    trace_id = secrets.token_hex(16)
+    root_id = secrets.token_hex(8)
+    end = max((start + duration for _, _, start, duration in trace.spans), default=0.0)
+    origin = trace._origin_unix_ns
+
+    def otlp_span(span_id: str, parent_id: str, name: str, start: float, duration: float, attributes: dict) -> dict:
+        return {
+            "traceId": trace_id,
+            "spanId": span_id,
+            "parentSpanId": parent_id,
+            "name": name,
+            "kind": 1,
+            "startTimeUnixNano": str(origin + int(start * 1e9)),
+            "endTimeUnixNano": str(origin + int((start + duration) * 1e9)),
+            "attributes": [{"key": key, "value": {"stringValue": str(value)}} for key, value in attributes.items()],
+        }
+
+    spans = [otlp_span(root_id, "", "signal", 0.0, end, {"signal.id": signal_id})]
+    for stage, detail, start, duration in trace.spans:
+        attributes = {"signal.id": signal_id}
+        if detail:
+            attributes["detail"] = detail
+        spans.append(otlp_span(secrets.token_hex(8), root_id, stage, start, duration, attributes))
+
+    document = {
+        "resourceSpans": [
+            {
+                "resource": {"attributes": [{"key": "service.name", "value": {"stringValue": "signal-router"}}]},
+                "scopeSpans": [{"scope": {"name": "app.tracing"}, "spans": spans}],
+            }
+        ]
+    }
+    return json.dumps(document, separators=(",", ":")) + "\n"
+
+
+class SpanExporter:
+    # The event loop only enqueues finished traces; one background thread builds the OTLP
+    # documents and appends them in batches, so file I/O and JSON encoding stay off ingest.
+    def __init__(self) -> None:
+        self._queue: queue.Queue = queue.Queue(maxsize=EXPORT_QUEUE_SIZE)
+        self._thread: Optional[threading.Thread] = None
+        self._thread_lock = threading.Lock()
+
+    def submit(self, trace: SignalTrace, signal_id: Optional[int]) -> None:
+        if self._thread is None:
+            self._start()
+        try:
+            self._queue.put_nowait((trace, signal_id))
+        except queue.Full:
+            metrics.trace_export_dropped_total.inc()
+
+    def _start(self) -> None:
+        with self._thread_lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="trace-export", daemon=True)
+                self._thread.start()
+
+    def _run(self) -> None:
+        while True:
+            batch = [self._queue.get()]
+            while len(batch) < EXPORT_BATCH_SIZE:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            lines = [_otlp_json_line(*item) for item in batch if item is not None]
+            if lines:
+                try:
+                    with open(settings.trace_export_path, "a", encoding="utf-8") as handle:
+                        handle.write("".join(lines))
+                except OSError:
+                    logger.exception("trace export to %s failed", settings.trace_export_path)
+            if None in batch:
+                return
+            time.sleep(EXPORT_FLUSH_SECONDS)
+
+    def close(self, timeout: float = 5.0) -> None:
+        # Writes whatever is queued, then stops the thread; called on worker shutdown.
+        with self._thread_lock:
+            thread, self._thread = self._thread, None
+        if thread is None:
+            return
+        try:
+            self._queue.put(None, timeout=timeout)
+        except queue.Full:
+            return
+        thread.join(timeout)
+
+
+exporter = SpanExporter()
+
+
+def ensure_export_dir() -> None:
+    if settings.trace_export_path:
+        directory = os.path.dirname(settings.trace_export_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
@@ -0,0 +1,71 @@
+import argparse
+import asyncio
+import json
+import os
+import random
+import statistics
+import sys
+import time
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT_DIR)
+
+from app.lanes import LaneScheduler  # noqa: E402
+
+
+def percentile(values: list[float], fraction: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
+
+
+async def run(args: argparse.Namespace, lanes: bool) -> dict[str, dict[str, float]]:
+    # Without lanes every send goes through one FIFO queue, as when the HTTP pool was the only limit.
+    scheduler = LaneScheduler(args.slots, args.reserved if lanes else 0)
+    rng = random.Random(args.seed)
+    latencies: dict[str, list[float]] = {"urgent": [], "bulk": []}
+
+    async def send(lane: str) -> None:
+        queued = time.perf_counter()
+        async with scheduler.slot(lane if lanes else "normal"):
+            await asyncio.sleep(rng.uniform(0.5, 1.5) * args.send_ms / 1000)
+        latencies[lane].append((time.perf_counter() - queued) * 1000)
+
+    tasks = []
+    interval = args.duration / args.urgent
+    for index in range(args.urgent):
+        # A burst of bulk sends lands just before each urgent signal.
+        tasks += [asyncio.create_task(send("bulk")) for _ in range(args.bulk // args.urgent)]
+        tasks.append(asyncio.create_task(send("urgent")))
+        await asyncio.sleep(interval)
+    await asyncio.gather(*tasks)
+    return {
+        lane: {
+            "sends": len(values),
+            "p50_ms": round(statistics.median(values), 1),
+            "p99_ms": round(percentile(values, 0.99), 1),
+        }
+        for lane, values in latencies.items()
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="转发通道调度基准：批量资讯洪峰下紧急信号的排队延迟（有/无通道对比）")
+    parser.add_argument("--slots", type=int, default=20, help="每个 worker 的并发发送数")
+    parser.add_argument("--reserved", type=int, default=4, help="为紧急通道预留的并发数")
+    parser.add_argument("--bulk", type=int, default=2000, help="批量通道发送总数")
+    parser.add_argument("--urgent", type=int, default=50, help="紧急通道发送总数")
+    parser.add_argument("--send-ms", type=float, default=50.0, help="模拟单次企业微信请求平均耗时（毫秒）")
+    parser.add_argument("--duration", type=float, default=2.0, help="信号到达持续时间（秒）")
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+
+    report = {
+        "config": vars(args),
+        "fifo": asyncio.run(run(args, lanes=False)),
+        "lanes": asyncio.run(run(args, lanes=True)),
+    }
+    print(json.dumps(report, ensure_ascii=False, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,320 @@
+import argparse
+import asyncio
+import base64
+import hashlib
+import json
+import os
+import random
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Any, Optional
+from unittest.mock import patch
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT_DIR)
+
+FAKE_TARGET = "https://qyapi.weixin.qq.com/cgi-bin/webhook/send?key=bench-{index}"
+MESSAGE_TYPES = ["text", "markdown", "markdown_v2", "image", "news", "file", "voice", "template_card"]
+
+
+def build_message(msgtype: str, keyword: str, image_bytes: int) -> dict[str, Any]:
+    content = f"symbol=BTCUSDT\nside=BUY\nprice=62000\n{keyword}"
+    if msgtype == "text":
+        return {"msgtype": "text", "text": {"content": content}}
+    if msgtype in ("markdown", "markdown_v2"):
+        return {"msgtype": msgtype, msgtype: {"content": content}}
+    if msgtype == "image":
+        raw = random.randbytes(image_bytes)
+        return {
+            "msgtype": "image",
+            "image": {"base64": base64.b64encode(raw).decode("ascii"), "md5": hashlib.md5(raw).hexdigest()},
+        }
+    if msgtype == "news":
+        return {
+            "msgtype": "news",
+            "news": {"articles": [{"title": keyword, "description": content, "url": "https://example.com/n"}]},
+        }
+    if msgtype in ("file", "voice"):
+        return {"msgtype": msgtype, msgtype: {"media_id": f"MEDIA_{keyword}"}}
+    return {
+        "msgtype": "template_card",
+        "template_card": {"card_type": "text_notice", "main_title": {"title": keyword}},
+    }
+
+
+def build_bodies(args: argparse.Namespace, rule_count: int) -> list[bytes]:
+    msgtypes = args.msgtypes.split(",")
+    bodies = []
+    images = 0
+    for index in range(args.requests):
+        msgtype = msgtypes[index % len(msgtypes)]
+        # Count image messages only; an index-based modulus never lined up with the image slot.
+        image_bytes = args.small_image_bytes
+        if msgtype == "image":
+            if images % args.large_image_every == 0:
+                image_bytes = args.large_image_bytes
+            images += 1
+        keyword = f"keyword-{random.randrange(rule_count * 4)}"
+        bodies.append(json.dumps(build_message(msgtype, keyword, image_bytes), ensure_ascii=False).encode("utf-8"))
+    return bodies
+
+
+def seed_rules(rule_count: int) -> None:
+    from sqlmodel import Session, delete
+
+    from app.db import engine
+    from app.models import Delivery, Rule, Signal
+    from app.security import encrypt_text
+
+    with Session(engine) as session:
+        session.exec(delete(Delivery))
+        session.exec(delete(Signal))
+        session.exec(delete(Rule))
+        session.commit()
+        # One catch-all rule plus keyword rules of which roughly a quarter can match.
+        rules = [
+            Rule(
+                name="bench-fallback",
+                priority=1000,
+                conditions_json=json.dumps({"op": "and", "items": [{"type": "always"}]}),
+                action_json=json.dumps(
+                    {"type": "forward_wecom_webhooks", "targets": [encrypt_text(FAKE_TARGET.format(index="fallback"))]}
+                ),
+            )
+        ]
+        for index in range(rule_count - 1):
+            rules.append(
+                Rule(
+                    name=f"bench-{index}",
+                    priority=index,
+                    conditions_json=json.dumps(
+                        {"op": "and", "items": [{"type": "contains_text", "text": f"keyword-{index}"}]}
+                    ),
+                    action_json=json.dumps(
+                        {"type": "forward_wecom_webhooks", "targets": [encrypt_text(FAKE_TARGET.format(index=index % 50))]}
+                    ),
+                )
+            )
+        session.add_all(rules)
+        session.commit()
+
+
+def make_fake_wecom(latency_ms: float, error_rate: float):
+    import httpx
+
+    async def fake_post(self, url, json=None, **kwargs):
+        if latency_ms:
+            await asyncio.sleep(latency_ms / 1000)
+        if random.random() < error_rate:
+            return httpx.Response(status_code=200, text='{"errcode":45009,"errmsg":"api freq out of limit"}')
+        return httpx.Response(status_code=200, text='{"errcode":0,"errmsg":"ok"}')
+
+    return fake_post
+
+
+def cpu_usage() -> float:
+    # Offloaded parsing may run in child processes; count their CPU too.
+    total = 0.0
+    for who in (resource.RUSAGE_SELF, resource.RUSAGE_CHILDREN):
+        usage = resource.getrusage(who)
+        total += usage.ru_utime + usage.ru_stime
+    return total
+
+
+def percentile(sorted_values: list[float], fraction: float) -> float:
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, int(round(fraction * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+async def probe_loop_lag(samples: list[float], interval: float = 0.01) -> None:
+    loop = asyncio.get_running_loop()
+    while True:
+        expected = loop.time() + interval
+        await asyncio.sleep(interval)
+        samples.append(max(0.0, loop.time() - expected))
+
+
+async def drive(
+    app, bodies: list[bytes], concurrency: int, token: str, small_limit: int
+) -> tuple[list[float], list[float], list[float], int, float]:
+    import httpx
+
+    latencies: list[float] = []
+    # Requests well below the large-image size: these should not wait behind image parsing.
+    small_latencies: list[float] = []
+    lag_samples: list[float] = []
+    failures = 0
+    semaphore = asyncio.Semaphore(concurrency)
+    transport = httpx.ASGITransport(app=app)
+
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+
+        async def one(body: bytes) -> None:
+            nonlocal failures
+            async with semaphore:
+                started = time.perf_counter()
+                # request() rather than post(): post() is patched to act as the fake WeCom server.
+                resp = await client.request(
+                    "POST", f"/webhook/{token}", content=body, headers={"Content-Type": "application/json"}
+                )
+                latencies.append(time.perf_counter() - started)
+                if len(body) < small_limit:
+                    small_latencies.append(latencies[-1])
+                if resp.status_code != 200:
+                    failures += 1
+
+        probe = asyncio.create_task(probe_loop_lag(lag_samples))
+        started = time.perf_counter()
+        await asyncio.gather(*(one(body) for body in bodies))
+        elapsed = time.perf_counter() - started
+        probe.cancel()
+    return latencies, small_latencies, lag_samples, failures, elapsed
+
+
+def run_scenario(args: argparse.Namespace, rule_count: int) -> dict[str, Any]:
+    import httpx
+
+    from app.main import app
+    from app.offload import shutdown_offload
+
+    seed_rules(rule_count)
+    bodies = build_bodies(args, rule_count)
+    small_limit = args.large_image_bytes // 2
+    usage_before = cpu_usage()
+    with patch.object(httpx.AsyncClient, "post", new=make_fake_wecom(args.latency_ms, args.error_rate)):
+        latencies, small_latencies, lag_samples, failures, elapsed = asyncio.run(
+            drive(app, bodies, args.concurrency, args.token, small_limit)
+        )
+    # Children only show up in RUSAGE_CHILDREN once they have exited.
+    shutdown_offload(wait=True)
+    cpu_seconds = cpu_usage() - usage_before
+    usage_after = resource.getrusage(resource.RUSAGE_SELF)
+
+    latencies.sort()
+    small_latencies.sort()
+    lag_samples.sort()
+    return {
+        "rule_count": rule_count,
+        "requests": len(bodies),
+        "failures": failures,
+        "concurrency": args.concurrency,
+        "throughput_rps": round(len(bodies) / elapsed, 2) if elapsed else 0.0,
+        "latency_ms": {
+            "p50": round(percentile(latencies, 0.50) * 1000, 3),
+            "p99": round(percentile(latencies, 0.99) * 1000, 3),
+            "max": round(latencies[-1] * 1000, 3) if latencies else 0.0,
+        },
+        "small_latency_ms": {
+            "p50": round(percentile(small_latencies, 0.50) * 1000, 3),
+            "p99": round(percentile(small_latencies, 0.99) * 1000, 3),
+        },
+        "loop_lag_ms": {
+            "p99": round(percentile(lag_samples, 0.99) * 1000, 3),
+            "max": round(lag_samples[-1] * 1000, 3) if lag_samples else 0.0,
+        },
+        "cpu_seconds": round(cpu_seconds, 3),
+        # Peak RSS of the process this scenario ran in (each scenario gets a fresh one).
+        "max_rss_kb": usage_after.ru_maxrss,
+    }
+
+
+def find_regressions(report: dict[str, Any], baseline: dict[str, Any], tolerance: float) -> list[str]:
+    previous = {item["rule_count"]: item for item in baseline.get("scenarios", [])}
+    problems = []
+    for item in report["scenarios"]:
+        old: Optional[dict[str, Any]] = previous.get(item["rule_count"])
+        if not old:
+            continue
+        if item["latency_ms"]["p99"] > old["latency_ms"]["p99"] * (1 + tolerance):
+            problems.append(f"rules={item['rule_count']}: p99 {old['latency_ms']['p99']} -> {item['latency_ms']['p99']} ms")
+        if item["throughput_rps"] < old["throughput_rps"] * (1 - tolerance):
+            problems.append(f"rules={item['rule_count']}: throughput {old['throughput_rps']} -> {item['throughput_rps']} rps")
+    return problems
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="离线压测：驱动 /webhook/{token}，企业微信端为进程内模拟")
+    parser.add_argument("--requests", type=int, default=500, help="每个场景的请求数")
+    parser.add_argument("--concurrency", type=int, default=20, help="并发请求数")
+    parser.add_argument("--rule-counts", default="10,100,1000", help="规则数量场景，逗号分隔，如 10,100,1000,10000")
+    parser.add_argument("--msgtypes", default=",".join(MESSAGE_TYPES), help="消息类型轮换顺序，逗号分隔")
+    parser.add_argument("--small-image-bytes", type=int, default=2048, help="普通图片消息原始字节数")
+    parser.add_argument("--large-image-bytes", type=int, default=1024 * 1024, help="大图片消息原始字节数")
+    parser.add_argument("--large-image-every", type=int, default=50, help="每 N 条图片消息使用一次大图片")
+    parser.add_argument("--latency-ms", type=float, default=20.0, help="模拟企业微信响应延迟（毫秒）")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="模拟企业微信返回错误的比例（0~1）")
+    parser.add_argument("--seed", type=int, default=42, help="随机种子，保证消息组合可复现")
+    parser.add_argument("--output", help="结果 JSON 写入路径（默认输出到 stdout）")
+    parser.add_argument("--baseline", help="对比的历史结果 JSON，退化超过阈值时退出码为 1")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="允许的退化比例（默认 0.2）")
+    parser.add_argument("--scenario", type=int, help="内部使用：在当前进程只运行该规则数量的场景并输出其结果")
+    args = parser.parse_args()
+    args.token = "bench-token"
+
+    if args.scenario is None:
+        run_all(args)
+        return
+
+    workdir = tempfile.mkdtemp(prefix="signal-router-bench-")
+    os.environ.update(
+        {
+            "DATABASE_URL": f"sqlite:///{os.path.join(workdir, 'bench.db')}",
+            "INBOUND_TOKEN": args.token,
+            "APP_ENV": "bench",
+            # Every signal hits the fallback robot; keep measuring real sends, not rate-limit skips.
+            "WECOM_RATE_LIMIT_PER_MINUTE": "0",
+            "MAX_WEBHOOK_PAYLOAD_BYTES": str(max(5 * 1024 * 1024, args.large_image_bytes * 2)),
+        }
+    )
+    os.chdir(ROOT_DIR)
+    random.seed(args.seed)
+
+    from app.main import on_startup
+
+    on_startup()
+    print(json.dumps(run_scenario(args, args.scenario)))
+
+
+def run_all(args: argparse.Namespace) -> None:
+    # One fresh process per scenario: ru_maxrss is a process-lifetime high-water mark, so in a
+    # shared process every scenario after the largest would report the same peak.
+    scenarios = []
+    for count in args.rule_counts.split(","):
+        child = subprocess.run(
+            [sys.executable, os.path.abspath(__file__), *sys.argv[1:], "--scenario", count],
+            stdout=subprocess.PIPE,
+            check=True,
+            text=True,
+        )
+        scenarios.append(json.loads(child.stdout.strip().splitlines()[-1]))
+    report = {
+        "python": sys.version.split()[0],
+        "config": {
+            key: value for key, value in vars(args).items() if key not in ("output", "baseline", "token", "scenario")
+        },
+        "scenarios": scenarios,
+    }
+
+    text = json.dumps(report, ensure_ascii=False, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as handle:
+            handle.write(text + "\n")
+    else:
+        print(text)
+
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as handle:
+            problems = find_regressions(report, json.load(handle), args.tolerance)
+        for problem in problems:
+            print(f"[bench] regression: {problem}", file=sys.stderr)
+        if problems:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
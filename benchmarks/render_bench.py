@@ -0,0 +1,82 @@
+import argparse
+import json
+import os
+import sys
+import time
+from typing import Any, Callable
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT_DIR)
+
+from app.parser import parse_signal_fields  # noqa: E402
+from app.templating import build_output_template, get_environment, render_output, template_context  # noqa: E402
+
+TEMPLATE = """**{{ symbol }}** {{ side }} @ {{ price }}
+{% for key, value in fields.items() if key.startswith("extra_") %}
+> {{ key }}: {{ value }}
+{% endfor %}
+来源: {{ source or "-" }} · #{{ signal_id }} · 规则 {variant}"""
+
+
+def build_signal(extra_fields: int) -> tuple[dict[str, Any], dict[str, Any]]:
+    lines = ["symbol=BTCUSDT", "side=BUY", "price=62000"] + [f"extra_{i}=value-{i}" for i in range(extra_fields)]
+    payload = {"msgtype": "text", "text": {"content": "\n".join(lines)}, "source": "bench"}
+    return payload, parse_signal_fields(payload)
+
+
+def time_per_signal(fn: Callable[[], None], signals: int) -> float:
+    started = time.perf_counter()
+    for _ in range(signals):
+        fn()
+    return (time.perf_counter() - started) / signals
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="输出模板渲染开销：每条信号渲染所有命中规则模板的耗时")
+    parser.add_argument("--signals", type=int, default=2000, help="模拟信号条数")
+    parser.add_argument("--targets", type=int, default=20, help="每条信号命中的目标数（规则×目标）")
+    parser.add_argument("--distinct-templates", type=int, default=2, help="这些目标共用的不同模板数")
+    parser.add_argument("--extra-fields", type=int, default=10, help="消息中额外 key=value 字段数")
+    args = parser.parse_args()
+
+    payload, parsed_fields = build_signal(args.extra_fields)
+    sources = [TEMPLATE.replace("{variant}", str(index % args.distinct_templates)) for index in range(args.targets)]
+    templates = [build_output_template("markdown", source) for source in sources]
+
+    def context() -> dict[str, Any]:
+        return template_context(parsed_fields, payload, 1, "bench", None)
+
+    def compile_every_time() -> None:
+        ctx = context()
+        for source in sources:
+            get_environment().from_string(source).render(ctx)
+
+    def cached_per_target() -> None:
+        ctx = context()
+        for template in templates:
+            render_output(template, ctx)
+
+    def cached_deduplicated() -> None:
+        ctx = context()
+        rendered: dict[Any, Any] = {}
+        for template in templates:
+            if template not in rendered:
+                rendered[template] = render_output(template, ctx)
+
+    report = {
+        "python": sys.version.split()[0],
+        "config": vars(args),
+        "us_per_signal": {
+            name: round(time_per_signal(fn, args.signals) * 1e6, 2)
+            for name, fn in [
+                ("compile_every_time", compile_every_time),
+                ("cached_per_target", cached_per_target),
+                ("cached_deduplicated", cached_deduplicated),
+            ]
+        },
+    }
+    print(json.dumps(report, ensure_ascii=False, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,88 @@
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Needed only by admin pages, profiling or replay; importing app.main must not load them.
+ADMIN_ONLY_MODULES = (
+    "jinja2",
+    "fastapi.templating",
+    "itsdangerous",
+    "app.replay",
+    "app.profiling",
+    "cProfile",
+    "concurrent.futures.process",
+)
+
+CHILD = """
+import json, sys, time
+started = time.perf_counter()
+import app.main
+imported = time.perf_counter()
+app.main.on_startup()
+ready = time.perf_counter()
+print(json.dumps({
+    "import_ms": (imported - started) * 1000,
+    "startup_ms": (ready - imported) * 1000,
+    "eager_modules": [name for name in %r if name in sys.modules],
+}))
+"""
+
+
+def run_child(env: dict[str, str]) -> dict:
+    output = subprocess.run(
+        [sys.executable, "-c", CHILD % (ADMIN_ONLY_MODULES,)],
+        cwd=ROOT_DIR,
+        env=env,
+        check=True,
+        capture_output=True,
+        text=True,
+    ).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="启动耗时基准：在子进程中测量 import app.main 与 on_startup 的耗时")
+    parser.add_argument("--runs", type=int, default=5, help="重复启动次数（第一次为空库冷启动）")
+    parser.add_argument("--import-budget-ms", type=float, default=1500.0, help="import app.main 中位耗时上限（毫秒）")
+    parser.add_argument("--startup-budget-ms", type=float, default=100.0, help="已是最新表结构时 on_startup 中位耗时上限（毫秒）")
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="signal-router-startup-")
+    env = dict(
+        os.environ,
+        DATABASE_URL=f"sqlite:///{os.path.join(workdir, 'startup.db')}",
+        INBOUND_TOKEN="startup-token",
+        APP_ENV="bench",
+    )
+    runs = [run_child(env) for _ in range(max(args.runs, 2))]
+    warm = runs[1:]
+    report = {
+        "python": sys.version.split()[0],
+        "cold_schema_startup_ms": round(runs[0]["startup_ms"], 2),
+        "import_ms_median": round(statistics.median(run["import_ms"] for run in runs), 2),
+        "startup_ms_median": round(statistics.median(run["startup_ms"] for run in warm), 2),
+        "eager_admin_modules": sorted({name for run in runs for name in run["eager_modules"]}),
+    }
+    print(json.dumps(report, ensure_ascii=False, indent=2))
+
+    problems = []
+    if report["import_ms_median"] > args.import_budget_ms:
+        problems.append(f"import {report['import_ms_median']} ms > budget {args.import_budget_ms} ms")
+    if report["startup_ms_median"] > args.startup_budget_ms:
+        problems.append(f"startup {report['startup_ms_median']} ms > budget {args.startup_budget_ms} ms")
+    if report["eager_admin_modules"]:
+        problems.append(f"admin-only modules imported eagerly: {', '.join(report['eager_admin_modules'])}")
+    for problem in problems:
+        print(f"[bench] {problem}", file=sys.stderr)
+    if problems:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -5,6 +5,7 @@ APP_DIR="${APP_DIR:-/opt/signal-router}"
 SERVICE_NAME="${SERVICE_NAME:-signal-router}"
 BRANCH="${BRANCH:-main}"
 SKIP_TESTS="${SKIP_TESTS:-0}"
+BENCH_BASELINE="${BENCH_BASELINE:-}"
 
 cd "$APP_DIR"
 
@@ -33,7 +34,29 @@ else
   echo "[deploy] skipping tests (SKIP_TESTS=1)"
 fi
 
-echo "[deploy] restarting service: $SERVICE_NAME"
+if [ -n "$BENCH_BASELINE" ]; then
+  echo "[deploy] running benchmark against baseline: $BENCH_BASELINE"
+  .venv/bin/python benchmarks/load_test.py --output bench_output.txt --baseline "$BENCH_BASELINE"
+fi
+
+echo "[deploy] running database migrations (old workers keep serving)..."
+(
+  if [ -f .env ]; then
+    set -a
+    source .env
+    set +a
+  fi
+  .venv/bin/python -m app.migrations upgrade
+)
+
+# 多核扩展：systemd 单元的 ExecStart 指向 scripts/start.sh（uvicorn --workers），
+# PostgreSQL 默认每个 CPU 核一个 worker，SQLite 默认单 worker，可在 .env 或单元的 Environment= 中设置 WEB_CONCURRENCY 覆盖。
+# 各 worker 独立持有连接池与规则缓存；SQLite 为 WAL 单写者，多 worker 的写入仍逐个排队，入站量需要多核时请换用 PostgreSQL。
+#   [Service]
+#   WorkingDirectory=/opt/signal-router
+#   ExecStart=/opt/signal-router/scripts/start.sh
+#   Environment=WEB_CONCURRENCY=4
+echo "[deploy] restarting service: $SERVICE_NAME (WEB_CONCURRENCY=${WEB_CONCURRENCY:-auto})"
 sudo systemctl daemon-reload
 sudo systemctl restart "$SERVICE_NAME"
 
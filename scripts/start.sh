@@ -0,0 +1,27 @@
+#!/usr/bin/env bash
+set -euo pipefail
+
+ROOT_DIR="$(cd "$(dirname "$0")/.." && pwd)"
+cd "$ROOT_DIR"
+
+if [ -f .env ]; then
+  set -a
+  source .env
+  set +a
+fi
+
+# 每个 worker 是独立进程：各自持有 HTTP 连接池、规则缓存和指标，启动时通过文件锁串行建表。
+# SQLite 同一时刻只有一个写者，多 worker 只会互相等写锁，默认单 worker；其他数据库默认每核一个。
+case "${DATABASE_URL:-sqlite:///./data/app.db}" in
+  sqlite*) DEFAULT_WORKERS=1 ;;
+  *) DEFAULT_WORKERS="$(nproc 2>/dev/null || echo 1)" ;;
+esac
+WORKERS="${WEB_CONCURRENCY:-$DEFAULT_WORKERS}"
+# 实时信号流据此判断是否需要跨 worker 轮询新记录。
+export WEB_CONCURRENCY="$WORKERS"
+
+exec .venv/bin/python -m uvicorn app.main:app \
+  --host "${APP_HOST:-0.0.0.0}" \
+  --port "${APP_PORT:-8000}" \
+  --workers "$WORKERS" \
+  --proxy-headers
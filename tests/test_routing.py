@@ -1,17 +1,36 @@
 import json
 import os
+import subprocess
 import sys
 import tempfile
+import time
 import unittest
 from unittest.mock import patch
 
 import httpx
 from fastapi.testclient import TestClient
-from sqlmodel import Session, select
+from sqlalchemy import text
+from sqlmodel import Session, SQLModel, select
 
 
 def _reload_app_modules():
-    for name in ["app.main", "app.db", "app.config", "app.security"]:
+    for name in [
+        "app.main",
+        "app.outbound",
+        "app.health",
+        "app.lanes",
+        "app.admission",
+        "app.offload",
+        "app.live",
+        "app.replay",
+        "app.rollups",
+        "app.maintenance",
+        "app.migrations",
+        "app.tracing",
+        "app.db",
+        "app.config",
+        "app.security",
+    ]:
         if name in sys.modules:
             del sys.modules[name]
 
@@ -340,6 +359,1670 @@ class RoutingTestCase(unittest.TestCase):
                 self.assertEqual(len(signals), len(payloads))
                 self.assertEqual(len(deliveries), len(payloads))
 
+    def test_batch_endpoint_accepts_json_array_and_ndjson_with_per_item_results(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            db_file = os.path.join(tmpdir, "test_batch.db")
+            env = {
+                "DATABASE_URL": f"sqlite:///{db_file}",
+                "INBOUND_TOKEN": "test-token",
+                "ADMIN_USERNAME": "admin",
+                "ADMIN_PASSWORD": "admin-pass",
+                "SESSION_SECRET": "test-session-secret",
+                "FERNET_KEY": "",
+                "MAX_WEBHOOK_PAYLOAD_BYTES": "200",
+            }
+
+            with patch.dict(os.environ, env, clear=False):
+                _reload_app_modules()
+
+                from app.db import engine, init_db
+                from app.main import app
+                from app.models import Delivery, Rule, Signal
+                from app.security import encrypt_text
+
+                init_db()
+                with Session(engine) as session:
+                    session.add(
+                        Rule(
+                            name="batch关键词匹配",
+                            enabled=True,
+                            priority=100,
+                            conditions_json=json.dumps(
+                                {"op": "and", "items": [{"type": "contains_text", "text": "BUY"}]},
+                                ensure_ascii=False,
+                            ),
+                            action_json=json.dumps(
+                                {
+                                    "type": "forward_wecom_webhooks",
+                                    "targets": [
+                                        encrypt_text("https://qyapi.weixin.qq.com/cgi-bin/webhook/send?key=batch-demo")
+                                    ],
+                                },
+                                ensure_ascii=False,
+                            ),
+                        )
+                    )
+                    session.commit()
+
+                sent_targets = []
+
+                async def fake_post(self, url, json=None, **kwargs):
+                    sent_targets.append((url, json))
+                    return httpx.Response(status_code=200, text='{"errcode":0}')
+
+                buy = {"msgtype": "text", "text": {"content": "symbol=BTCUSDT\nside=BUY"}, "source": "replay"}
+                sell = {"msgtype": "text", "text": {"content": "symbol=BTCUSDT\nside=SELL"}}
+                too_large = {"msgtype": "text", "text": {"content": "x" * 300}}
+
+                with patch.object(httpx.AsyncClient, "post", new=fake_post):
+                    with TestClient(app) as client:
+                        array_resp = client.post(
+                            "/webhook/test-token/batch",
+                            content=json.dumps([buy, sell, [1, 2], too_large]),
+                            headers={"Content-Type": "application/json"},
+                        )
+                        ndjson_resp = client.post(
+                            "/webhook/test-token/batch",
+                            content="\n".join([json.dumps(buy), "{not json", json.dumps(sell)]),
+                            headers={"Content-Type": "application/x-ndjson"},
+                        )
+                        bad_token_resp = client.post("/webhook/wrong/batch", content=json.dumps([buy]))
+
+                self.assertEqual(bad_token_resp.status_code, 401)
+
+                self.assertEqual(array_resp.status_code, 200)
+                body = array_resp.json()
+                self.assertEqual(body["accepted"], 2)
+                self.assertEqual(body["rejected"], 2)
+                results = body["results"]
+                self.assertEqual([item["index"] for item in results], [0, 1, 2, 3])
+                self.assertEqual(results[0]["delivery_count"], 1)
+                self.assertEqual(len(results[0]["matched_rule_ids"]), 1)
+                self.assertEqual(results[1]["delivery_count"], 0)
+                self.assertEqual(results[2], {"index": 2, "ok": False, "error": "payload must be object"})
+                self.assertEqual(results[3], {"index": 3, "ok": False, "error": "payload too large"})
+
+                self.assertEqual(ndjson_resp.status_code, 200)
+                results = ndjson_resp.json()["results"]
+                self.assertTrue(results[0]["ok"])
+                self.assertEqual(results[1], {"index": 1, "ok": False, "error": "invalid json"})
+                self.assertTrue(results[2]["ok"])
+
+                self.assertEqual(len(sent_targets), 2)
+                for _, sent_payload in sent_targets:
+                    self.assertEqual(sent_payload, buy)
+
+                with Session(engine) as session:
+                    signals = session.exec(select(Signal).order_by(Signal.id)).all()
+                    deliveries = session.exec(select(Delivery)).all()
+                self.assertEqual(len(signals), 4)
+                self.assertEqual([s.match_count for s in signals], [1, 0, 1, 0])
+                self.assertEqual(signals[0].source, "replay")
+                self.assertEqual(len(deliveries), 2)
+
+    def test_oversized_bodies_are_rejected_while_streaming(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            db_file = os.path.join(tmpdir, "test_limits.db")
+            env = {
+                "DATABASE_URL": f"sqlite:///{db_file}",
+                "INBOUND_TOKEN": "test-token",
+                "ADMIN_USERNAME": "admin",
+                "ADMIN_PASSWORD": "admin-pass",
+                "SESSION_SECRET": "test-session-secret",
+                "FERNET_KEY": "",
+                "MAX_WEBHOOK_PAYLOAD_BYTES": "100",
+                "MAX_WEBHOOK_BATCH_BYTES": "300",
+            }
+
+            with patch.dict(os.environ, env, clear=False):
+                _reload_app_modules()
+
+                from app.db import engine
+                from app.main import app
+                from app.models import Signal
+
+                def chunked_body():
+                    for _ in range(100):
+                        yield b"x" * 64
+
+                big = json.dumps({"msgtype": "text", "text": {"content": "x" * 200}})
+                with TestClient(app) as client:
+                    declared_resp = client.post(
+                        "/webhook/test-token", content=big, headers={"Content-Type": "application/json"}
+                    )
+                    chunked_resp = client.post("/webhook/test-token", content=chunked_body())
+                    batch_resp = client.post(
+                        "/webhook/test-token/batch",
+                        content=big + "\n" + big,
+                        headers={"Content-Type": "application/x-ndjson"},
+                    )
+
+                self.assertEqual(declared_resp.status_code, 413)
+                self.assertEqual(chunked_resp.status_code, 413)
+                self.assertEqual(batch_resp.status_code, 413)
+
+                with Session(engine) as session:
+                    self.assertEqual(session.exec(select(Signal)).all(), [])
+
+    def test_signal_history_api_pages_by_keyset_and_filters(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            db_file = os.path.join(tmpdir, "test_history.db")
+            env = {
+                "DATABASE_URL": f"sqlite:///{db_file}",
+                "INBOUND_TOKEN": "test-token",
+                "ADMIN_USERNAME": "admin",
+                "ADMIN_PASSWORD": "admin-pass",
+                "SESSION_SECRET": "test-session-secret",
+                "FERNET_KEY": "",
+            }
+
+            with patch.dict(os.environ, env, clear=False):
+                _reload_app_modules()
+
+                from app.db import engine, init_db
+                from app.main import app
+                from app.models import Signal
+
+                init_db()
+                with Session(engine) as session:
+                    for index in range(7):
+                        session.add(
+                            Signal(
+                                source="alpha" if index % 2 == 0 else "beta",
+                                raw_payload="{}",
+                                parsed_fields="{}",
+                                match_count=1 if index < 3 else 0,
+                            )
+                        )
+                    session.commit()
+
+                with TestClient(app) as client:
+                    self.assertEqual(client.get("/admin/api/signals").status_code, 401)
+                    client.post("/admin/login", data={"username": "admin", "password": "admin-pass"})
+
+                    first = client.get("/admin/api/signals", params={"limit": 3}).json()
+                    second = client.get(
+                        "/admin/api/signals", params={"limit": 3, "before_id": first["next_before_id"]}
+                    ).json()
+                    third = client.get(
+                        "/admin/api/signals", params={"limit": 3, "before_id": second["next_before_id"]}
+                    ).json()
+                    filtered = client.get("/admin/api/signals", params={"source": "alpha", "matched": "yes"}).json()
+                    page = client.get("/admin/signals", params={"source": "beta"})
+                    bad = client.get("/admin/api/signals", params={"since": "not-a-date"})
+
+                self.assertEqual([item["id"] for item in first["items"]], [7, 6, 5])
+                self.assertEqual([item["id"] for item in second["items"]], [4, 3, 2])
+                self.assertEqual([item["id"] for item in third["items"]], [1])
+                self.assertIsNone(third["next_before_id"])
+                self.assertNotIn("raw_payload", first["items"][0])
+                self.assertEqual([item["id"] for item in filtered["items"]], [3, 1])
+                self.assertEqual(page.status_code, 200)
+                self.assertIn("/admin/signals/6", page.text)
+                self.assertNotIn("/admin/signals/7", page.text)
+                self.assertEqual(bad.status_code, 400)
+
+    def test_rule_delete_archives_or_purges_deliveries_in_chunks(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            db_file = os.path.join(tmpdir, "test_delete.db")
+            env = {
+                "DATABASE_URL": f"sqlite:///{db_file}",
+                "INBOUND_TOKEN": "test-token",
+                "ADMIN_USERNAME": "admin",
+                "ADMIN_PASSWORD": "admin-pass",
+                "SESSION_SECRET": "test-session-secret",
+                "FERNET_KEY": "",
+                "DELIVERY_PURGE_CHUNK_SIZE": "2",
+            }
+
+            with patch.dict(os.environ, env, clear=False):
+                _reload_app_modules()
+
+                from app.db import engine, init_db
+                from app.main import app
+                from app.models import Delivery, Rule, Signal
+                from app.security import build_csrf_token
+
+                init_db()
+                with Session(engine) as session:
+                    signal = Signal(raw_payload="{}", parsed_fields="{}")
+                    session.add(signal)
+                    rules = [
+                        Rule(
+                            name=name,
+                            conditions_json=json.dumps({"op": "and", "items": [{"type": "always"}]}),
+                            action_json=json.dumps({"type": "forward_wecom_webhooks", "targets": []}),
+                        )
+                        for name in ("archived", "purged")
+                    ]
+                    session.add_all(rules)
+                    session.commit()
+                    for rule in rules:
+                        for _ in range(5):
+                            session.add(
+                                Delivery(
+                                    signal_id=signal.id,
+                                    rule_id=rule.id,
+                                    target_masked="***",
+                                    target_encrypted="",
+                                    request_payload="{}",
+                                    success=True,
+                                )
+                            )
+                    session.commit()
+                    archived_id, purged_id = rules[0].id, rules[1].id
+
+                with patch("app.maintenance.PURGE_CHUNK_PAUSE_SECONDS", 0):
+                    with TestClient(app) as client:
+                        client.post("/admin/login", data={"username": "admin", "password": "admin-pass"})
+                        csrf_token = build_csrf_token("admin")
+                        archive_resp = client.post(
+                            f"/admin/rules/{archived_id}/delete",
+                            data={"csrf_token": csrf_token, "mode": "archive"},
+                            follow_redirects=False,
+                        )
+                        purge_resp = client.post(
+                            f"/admin/rules/{purged_id}/delete",
+                            data={"csrf_token": csrf_token, "mode": "purge"},
+                            follow_redirects=False,
+                        )
+                        rules_page = client.get("/admin/rules")
+                        edit_resp = client.get(f"/admin/rules/{archived_id}/edit")
+
+                self.assertEqual(archive_resp.status_code, 303)
+                self.assertEqual(purge_resp.status_code, 303)
+                self.assertNotIn("archived", rules_page.text)
+                self.assertEqual(edit_resp.status_code, 404)
+
+                with Session(engine) as session:
+                    archived = session.get(Rule, archived_id)
+                    self.assertIsNotNone(archived.deleted_at)
+                    self.assertFalse(archived.enabled)
+                    self.assertIsNone(session.get(Rule, purged_id))
+                    remaining = session.exec(select(Delivery)).all()
+                self.assertEqual({item.rule_id for item in remaining}, {archived_id})
+                self.assertEqual(len(remaining), 5)
+
+    def test_deleted_rule_names_can_be_reused_by_form_and_seed(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            db_file = os.path.join(tmpdir, "test_rule_names.db")
+            env = {
+                "DATABASE_URL": f"sqlite:///{db_file}",
+                "INBOUND_TOKEN": "test-token",
+                "ADMIN_USERNAME": "admin",
+                "ADMIN_PASSWORD": "admin-pass",
+                "SESSION_SECRET": "test-session-secret",
+                "FERNET_KEY": "",
+            }
+
+            with patch.dict(os.environ, env, clear=False):
+                _reload_app_modules()
+
+                from app.db import engine, init_db
+                from app.main import app
+                from app.models import Rule
+                from app.security import build_csrf_token
+                from app.seed_rules import upsert_rule
+
+                init_db()
+                with Session(engine) as session:
+                    for name in ("行情", "保底转发"):
+                        session.add(
+                            Rule(
+                                name=name,
+                                conditions_json=json.dumps({"op": "and", "items": [{"type": "always"}]}),
+                                action_json=json.dumps({"type": "forward_wecom_webhooks", "targets": []}),
+                            )
+                        )
+                    session.commit()
+                    ids = {rule.name: rule.id for rule in session.exec(select(Rule)).all()}
+
+                form = {
+                    "name": "行情",
+                    "enabled": "on",
+                    "condition_type": "always",
+                    "target_urls": "https://qyapi.weixin.qq.com/cgi-bin/webhook/send?key=names",
+                }
+                with TestClient(app) as client:
+                    client.post("/admin/login", data={"username": "admin", "password": "admin-pass"})
+                    csrf_token = build_csrf_token("admin")
+                    duplicate_live = client.post("/admin/rules", data={**form, "csrf_token": csrf_token})
+                    for rule_id in ids.values():
+                        client.post(
+                            f"/admin/rules/{rule_id}/delete",
+                            data={"csrf_token": csrf_token, "mode": "archive"},
+                            follow_redirects=False,
+                        )
+                    recreated = client.post(
+                        "/admin/rules", data={**form, "csrf_token": csrf_token}, follow_redirects=False
+                    )
+                    duplicate_again = client.post("/admin/rules", data={**form, "csrf_token": csrf_token})
+
+                with Session(engine) as session:
+                    seeded = upsert_rule(session, "保底转发", 1000, {"op": "and", "items": [{"type": "always"}]}, [])
+                    rows = session.exec(select(Rule.id, Rule.name, Rule.deleted_at).order_by(Rule.id)).all()
+
+            self.assertEqual(duplicate_live.status_code, 400)
+            self.assertEqual(recreated.status_code, 303)
+            self.assertEqual(duplicate_again.status_code, 400)
+            self.assertEqual(duplicate_again.json()["detail"], "规则名称已存在")
+            # The archived rows keep their names; the new live rules are separate rows.
+            self.assertNotIn(seeded.id, ids.values())
+            self.assertIsNone(seeded.deleted_at)
+            self.assertEqual(
+                [(name, deleted_at is None) for _, name, deleted_at in rows],
+                [("行情", False), ("保底转发", False), ("行情", True), ("保底转发", True)],
+            )
+
+    def test_metrics_endpoint_reports_ingest_and_outbound_series(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            db_file = os.path.join(tmpdir, "test_metrics.db")
+            env = {
+                "DATABASE_URL": f"sqlite:///{db_file}",
+                "INBOUND_TOKEN": "test-token",
+                "ADMIN_USERNAME": "admin",
+                "ADMIN_PASSWORD": "admin-pass",
+                "SESSION_SECRET": "test-session-secret",
+                "FERNET_KEY": "",
+                "METRICS_TOKEN": "metrics-secret",
+            }
+
+            with patch.dict(os.environ, env, clear=False):
+                _reload_app_modules()
+
+                from app import metrics
+                from app.config import settings
+                from app.db import engine, init_db
+                from app.main import app
+                from app.models import Rule
+                from app.security import encrypt_text
+
+                init_db()
+                with Session(engine) as session:
+                    rule = Rule(
+                        name="metrics-forward",
+                        conditions_json=json.dumps({"op": "and", "items": [{"type": "always"}]}),
+                        action_json=json.dumps(
+                            {
+                                "type": "forward_wecom_webhooks",
+                                "targets": [encrypt_text("https://qyapi.weixin.qq.com/cgi-bin/webhook/send?key=metrics-demo")],
+                            }
+                        ),
+                    )
+                    session.add(rule)
+                    session.commit()
+                    rule_id = rule.id
+
+                async def fake_post(self, url, json=None, **kwargs):
+                    return httpx.Response(status_code=200, text='{"errcode":93000,"errmsg":"invalid webhook url"}')
+
+                target_label = "https://qyapi.weixin.qq.com/cgi-bin/webhook/send?key=metr***demo"
+                outbound_before = metrics.outbound_total.value(target_label, "200", "93000")
+                matches_before = metrics.rule_matches_total.value(str(rule_id))
+
+                with patch.object(httpx.AsyncClient, "post", new=fake_post):
+                    with TestClient(app) as client:
+                        client.post("/webhook/test-token", json={"msgtype": "text", "text": {"content": "hi"}})
+                        client.post("/webhook/wrong-token", json={})
+                        unauthorized = client.get("/metrics")
+                        resp = client.get("/metrics", headers={"Authorization": "Bearer metrics-secret"})
+                        # Without a token the endpoint is closed to remote clients until an admin logs in.
+                        with patch.object(settings, "metrics_token", ""):
+                            remote = client.get("/metrics")
+                            with patch.object(settings, "metrics_public", True):
+                                public = client.get("/metrics")
+                            client.post("/admin/login", data={"username": "admin", "password": "admin-pass"})
+                            as_admin = client.get("/metrics")
+                    with patch.object(settings, "metrics_token", ""), TestClient(app, client=("127.0.0.1", 50000)) as local:
+                        loopback = local.get("/metrics")
+
+                self.assertEqual(unauthorized.status_code, 401)
+                self.assertEqual(resp.status_code, 200)
+                self.assertEqual(
+                    [item.status_code for item in (remote, public, as_admin, loopback)], [401, 200, 200, 200]
+                )
+                self.assertIn("# TYPE signal_router_parse_seconds histogram", resp.text)
+                self.assertIn('signal_router_ingest_rejected_total{reason="invalid token"}', resp.text)
+                self.assertIn('signal_router_db_commit_seconds_bucket{le="+Inf"}', resp.text)
+                self.assertEqual(metrics.outbound_total.value(target_label, "200", "93000"), outbound_before + 1)
+                self.assertEqual(metrics.rule_matches_total.value(str(rule_id)), matches_before + 1)
+
+    def test_sampled_signal_records_stage_trace_and_exports_otlp_json(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            db_file = os.path.join(tmpdir, "test_trace.db")
+            export_file = os.path.join(tmpdir, "traces", "spans.jsonl")
+            env = {
+                "DATABASE_URL": f"sqlite:///{db_file}",
+                "INBOUND_TOKEN": "test-token",
+                "ADMIN_USERNAME": "admin",
+                "ADMIN_PASSWORD": "admin-pass",
+                "SESSION_SECRET": "test-session-secret",
+                "FERNET_KEY": "",
+                "TRACE_SAMPLE_RATE": "1",
+                "TRACE_EXPORT_PATH": export_file,
+            }
+
+            with patch.dict(os.environ, env, clear=False):
+                _reload_app_modules()
+
+                from app.db import engine, init_db
+                from app.main import app
+                from app.models import Delivery, Rule, Signal
+                from app.security import encrypt_text
+                from app.tracing import exporter
+
+                init_db()
+                with Session(engine) as session:
+                    session.add(
+                        Rule(
+                            name="trace-forward",
+                            conditions_json=json.dumps({"op": "and", "items": [{"type": "always"}]}),
+                            action_json=json.dumps(
+                                {
+                                    "type": "forward_wecom_webhooks",
+                                    "targets": [encrypt_text("https://qyapi.weixin.qq.com/cgi-bin/webhook/send?key=trace-demo")],
+                                }
+                            ),
+                        )
+                    )
+                    session.commit()
+
+                async def fake_post(self, url, json=None, **kwargs):
+                    return httpx.Response(status_code=200, text='{"errcode":0}')
+
+                with patch.object(httpx.AsyncClient, "post", new=fake_post):
+                    with TestClient(app) as client:
+                        resp = client.post("/webhook/test-token", json={"msgtype": "text", "text": {"content": "hi"}})
+                        # The request only queues the trace; the export thread writes it, and
+                        # shutdown flushes whatever is still queued.
+                        export_thread = exporter._thread
+                        client.post("/admin/login", data={"username": "admin", "password": "admin-pass"})
+                        detail = client.get(f"/admin/signals/{resp.json()['signal_id']}")
+
+                with Session(engine) as session:
+                    signal = session.exec(select(Signal)).one()
+                    delivery = session.exec(select(Delivery)).one()
+
+                stages = [span[0] for span in json.loads(signal.trace_json)]
+                self.assertEqual(stages, ["receive", "decode", "parse", "persist", "load_rules", "match", "send"])
+                self.assertIsNotNone(delivery.duration_ms)
+                self.assertEqual(detail.status_code, 200)
+                self.assertIn("<svg", detail.text)
+
+                with open(export_file, encoding="utf-8") as handle:
+                    document = json.loads(handle.readline())
+                spans = document["resourceSpans"][0]["scopeSpans"][0]["spans"]
+                self.assertEqual([span["name"] for span in spans], ["signal"] + stages + ["commit"])
+                self.assertEqual({span["traceId"] for span in spans}, {spans[0]["traceId"]})
+                self.assertEqual(export_thread.name, "trace-export")
+                self.assertFalse(export_thread.is_alive())
+
+    def test_admin_profiling_endpoints(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            db_file = os.path.join(tmpdir, "test_profile.db")
+            env = {
+                "DATABASE_URL": f"sqlite:///{db_file}",
+                "INBOUND_TOKEN": "test-token",
+                "ADMIN_USERNAME": "admin",
+                "ADMIN_PASSWORD": "admin-pass",
+                "SESSION_SECRET": "test-session-secret",
+                "FERNET_KEY": "",
+            }
+
+            with patch.dict(os.environ, env, clear=False):
+                _reload_app_modules()
+
+                from app.main import app
+
+                payload = {"msgtype": "text", "text": {"content": "symbol=BTCUSDT"}}
+                with TestClient(app) as client:
+                    anonymous_profile = client.post("/webhook/test-token", json=payload, headers={"X-Profile": "1"})
+                    anonymous_sampler = client.get("/admin/debug/profile", params={"seconds": 0.05})
+                    client.post("/admin/login", data={"username": "admin", "password": "admin-pass"})
+                    profiled = client.post("/webhook/test-token", json=payload, headers={"X-Profile": "1"})
+                    sampled = client.get("/admin/debug/profile", params={"seconds": 0.05})
+
+                self.assertEqual(anonymous_profile.status_code, 401)
+                self.assertEqual(anonymous_sampler.status_code, 401)
+                self.assertEqual(profiled.status_code, 200)
+                self.assertTrue(profiled.json()["ok"])
+                self.assertIn("_ingest_signal", profiled.json()["profile"])
+                self.assertEqual(sampled.status_code, 200)
+                first_line = sampled.text.splitlines()[0]
+                stack, count = first_line.rsplit(" ", 1)
+                self.assertIn(";", stack)
+                self.assertGreater(int(count), 0)
+
+    def test_rule_replay_counts_matches_and_rate_limit_overflow_without_sending(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            db_file = os.path.join(tmpdir, "test_replay.db")
+            env = {
+                "DATABASE_URL": f"sqlite:///{db_file}",
+                "INBOUND_TOKEN": "test-token",
+                "ADMIN_USERNAME": "admin",
+                "ADMIN_PASSWORD": "admin-pass",
+                "SESSION_SECRET": "test-session-secret",
+                "FERNET_KEY": "",
+                "REPLAY_CHUNK_SIZE": "7",
+                "REPLAY_UI_MAX_SIGNALS": "25",
+            }
+
+            with patch.dict(os.environ, env, clear=False):
+                _reload_app_modules()
+
+                from datetime import datetime
+
+                from app.db import engine, init_db
+                from app.main import app
+                from app.models import Rule, Signal
+                from app.replay import CANDIDATE_RULE_ID, ReplayRule, load_replay_rules, run_replay
+                from app.security import encrypt_text
+
+                init_db()
+                with Session(engine) as session:
+                    rule = Rule(
+                        name="候选ETF",
+                        enabled=False,
+                        conditions_json=json.dumps(
+                            {"op": "and", "items": [{"type": "contains_text", "text": "ETF"}]}, ensure_ascii=False
+                        ),
+                        action_json=json.dumps(
+                            {
+                                "type": "forward_wecom_webhooks",
+                                "targets": [encrypt_text("https://qyapi.weixin.qq.com/cgi-bin/webhook/send?key=replay-demo")],
+                            }
+                        ),
+                    )
+                    session.add(rule)
+                    for index in range(40):
+                        text = "ETF动量" if index < 30 else "其他消息"
+                        session.add(
+                            Signal(
+                                received_at=datetime(2026, 2, 9, 17, 1, index % 60),
+                                raw_payload="{}",
+                                parsed_fields=json.dumps({"message_text": text}, ensure_ascii=False),
+                            )
+                        )
+                    session.commit()
+                    rule_id = rule.id
+                    replay_rules = load_replay_rules(session, [rule_id], include_enabled=False)
+
+                sent_targets = []
+
+                async def fake_post(self, url, json=None, **kwargs):
+                    sent_targets.append(url)
+                    return httpx.Response(status_code=200, text='{"errcode":0}')
+
+                inline = run_replay(replay_rules).to_dict(replay_rules)
+                pooled = run_replay(replay_rules, workers=2).to_dict(replay_rules)
+
+                with patch.object(httpx.AsyncClient, "post", new=fake_post):
+                    with TestClient(app) as client:
+                        client.post("/admin/login", data={"username": "admin", "password": "admin-pass"})
+                        page = client.get(f"/admin/rules/{rule_id}/replay")
+                        capped_page = client.get(
+                            f"/admin/rules/{rule_id}/replay", params={"since": "2026-02-09T00:00"}
+                        )
+
+                capped = run_replay(replay_rules, workers=2, max_signals=25).to_dict(replay_rules)
+                # An unsaved candidate that happens to share the saved rule's name keeps its own count.
+                with_candidate = replay_rules + [
+                    ReplayRule(CANDIDATE_RULE_ID, "候选ETF", {"op": "and", "items": [{"type": "always"}]}, [])
+                ]
+                side_by_side = run_replay(with_candidate).to_dict(with_candidate)
+                exact = run_replay(replay_rules, max_signals=40).to_dict(replay_rules)
+                self.assertEqual(inline, pooled)
+                self.assertEqual((capped["scanned"], capped["truncated"], capped["rules"][0]["matches"]), (25, True, 25))
+                self.assertEqual((exact["scanned"], exact["truncated"]), (40, False))
+                self.assertEqual([item["matches"] for item in side_by_side["rules"]], [30, 40])
+                self.assertEqual(inline["scanned"], 40)
+                self.assertEqual(inline["rules"], [{"id": rule_id, "name": "候选ETF", "matches": 30}])
+                target = inline["targets"][0]
+                self.assertEqual(target["deliveries"], 30)
+                self.assertEqual(target["busiest_minute"], 30)
+                self.assertEqual(target["rate_limit_overflow"], 10)
+                self.assertEqual(page.status_code, 200)
+                self.assertIn("候选ETF", page.text)
+                # Without a start time the page only covers the default window, not February's history.
+                self.assertNotIn("已达到单次试运行上限", page.text)
+                self.assertIn("已达到单次试运行上限 25 条信号", capped_page.text)
+                self.assertEqual(sent_targets, [])
+
+
+    def test_rule_cache_picks_up_rule_changes_and_startup_lock_is_exclusive(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            db_file = os.path.join(tmpdir, "test_workers.db")
+            env = {
+                "DATABASE_URL": f"sqlite:///{db_file}",
+                "INBOUND_TOKEN": "test-token",
+                "ADMIN_USERNAME": "admin",
+                "ADMIN_PASSWORD": "admin-pass",
+                "SESSION_SECRET": "test-session-secret",
+                "FERNET_KEY": "",
+            }
+
+            with patch.dict(os.environ, env, clear=False):
+                _reload_app_modules()
+
+                from app.db import engine, init_db, process_lock
+                from app.main import app
+                from app.models import Rule
+                from app.security import build_csrf_token, encrypt_text
+
+                init_db()
+                with Session(engine) as session:
+                    self.assertEqual(session.exec(text("PRAGMA journal_mode")).one()[0], "wal")
+                    rule = Rule(
+                        name="保底转发",
+                        conditions_json=json.dumps({"op": "and", "items": [{"type": "always"}]}),
+                        action_json=json.dumps(
+                            {
+                                "type": "forward_wecom_webhooks",
+                                "targets": [encrypt_text("https://qyapi.weixin.qq.com/cgi-bin/webhook/send?key=cache-demo")],
+                            }
+                        ),
+                    )
+                    session.add(rule)
+                    session.commit()
+                    rule_id = rule.id
+
+                async def fake_post(self, url, json=None, **kwargs):
+                    return httpx.Response(status_code=200, text='{"errcode":0}')
+
+                payload = {"msgtype": "text", "text": {"content": "hello"}}
+                with patch.object(httpx.AsyncClient, "post", new=fake_post):
+                    with TestClient(app) as client:
+                        first = client.post("/webhook/test-token", json=payload).json()
+                        second = client.post("/webhook/test-token", json=payload).json()
+                        client.post("/admin/login", data={"username": "admin", "password": "admin-pass"})
+                        client.post(
+                            f"/admin/rules/{rule_id}/toggle",
+                            data={"csrf_token": build_csrf_token("admin")},
+                            follow_redirects=False,
+                        )
+                        third = client.post("/webhook/test-token", json=payload).json()
+
+                self.assertEqual(first["matched_rule_ids"], [rule_id])
+                self.assertEqual(second["matched_rule_ids"], [rule_id])
+                self.assertEqual(third["matched_rule_ids"], [])
+
+                with process_lock("test") as acquired:
+                    self.assertTrue(acquired)
+                    with process_lock("test", blocking=False) as again:
+                        self.assertFalse(again)
+
+
+    def test_circuit_breaker_skips_failing_target_and_rules_page_shows_health(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            db_file = os.path.join(tmpdir, "test_breaker.db")
+            env = {
+                "DATABASE_URL": f"sqlite:///{db_file}",
+                "INBOUND_TOKEN": "test-token",
+                "ADMIN_USERNAME": "admin",
+                "ADMIN_PASSWORD": "admin-pass",
+                "SESSION_SECRET": "test-session-secret",
+                "FERNET_KEY": "",
+                "CIRCUIT_WINDOW": "4",
+                "CIRCUIT_MIN_REQUESTS": "2",
+                "CIRCUIT_COOLDOWN_SECONDS": "3600",
+            }
+
+            with patch.dict(os.environ, env, clear=False):
+                _reload_app_modules()
+
+                from app.db import engine, init_db
+                from app.main import app
+                from app.models import Delivery
+                from app.security import build_csrf_token
+
+                init_db()
+                revoked = "https://qyapi.weixin.qq.com/cgi-bin/webhook/send?key=revoked-demo"
+                healthy = "https://qyapi.weixin.qq.com/cgi-bin/webhook/send?key=healthy-demo"
+                sent = []
+
+                async def fake_post(self, url, json=None, **kwargs):
+                    sent.append((url, kwargs.get("timeout")))
+                    if url == revoked:
+                        return httpx.Response(status_code=200, text='{"errcode":93000,"errmsg":"invalid webhook url"}')
+                    return httpx.Response(status_code=200, text='{"errcode":0}')
+
+                payload = {"msgtype": "text", "text": {"content": "hello"}}
+                with patch.object(httpx.AsyncClient, "post", new=fake_post):
+                    with TestClient(app) as client:
+                        client.post("/admin/login", data={"username": "admin", "password": "admin-pass"})
+                        csrf_token = build_csrf_token("admin")
+                        bad_form = client.post(
+                            "/admin/rules",
+                            data={
+                                "csrf_token": csrf_token,
+                                "name": "熔断测试",
+                                "enabled": "on",
+                                "condition_type": "always",
+                                "target_urls": f"{revoked} 99",
+                            },
+                        )
+                        client.post(
+                            "/admin/rules",
+                            data={
+                                "csrf_token": csrf_token,
+                                "name": "熔断测试",
+                                "enabled": "on",
+                                "condition_type": "always",
+                                "target_urls": f"{revoked} 1.5\n{healthy}",
+                            },
+                            follow_redirects=False,
+                        )
+                        for _ in range(3):
+                            resp = client.post("/webhook/test-token", json=payload)
+                            self.assertEqual(resp.json()["delivery_count"], 2)
+                        rules_page = client.get("/admin/rules")
+                        edit_page = client.get("/admin/rules/1/edit")
+
+                self.assertEqual(bad_form.status_code, 400)
+                self.assertEqual(sent.count((revoked, 1.5)), 2)
+                self.assertEqual(sent.count((healthy, None)), 3)
+                self.assertIn("已熔断", rules_page.text)
+                self.assertIn(f"{revoked} 1.5", edit_page.text)
+
+                with Session(engine) as session:
+                    skipped = session.exec(
+                        select(Delivery).where(Delivery.error_message == "circuit open: target skipped")
+                    ).all()
+                self.assertEqual(len(skipped), 1)
+                self.assertFalse(skipped[0].success)
+
+
+    def test_breaker_probe_is_released_when_send_is_cancelled_or_rate_limited(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            db_file = os.path.join(tmpdir, "test_probe.db")
+            env = {
+                "DATABASE_URL": f"sqlite:///{db_file}",
+                "INBOUND_TOKEN": "test-token",
+                "FERNET_KEY": "",
+                "CIRCUIT_MIN_REQUESTS": "2",
+                "CIRCUIT_COOLDOWN_SECONDS": "0",
+                "WECOM_RATE_LIMIT_PER_MINUTE": "1",
+                "WECOM_RATE_MAX_WAIT_SECONDS": "0",
+                "URGENT_RATE_RESERVE": "0",
+            }
+
+            with patch.dict(os.environ, env, clear=False):
+                _reload_app_modules()
+
+                import asyncio
+
+                import app.main as main_module
+                from app.health import CLOSED, HALF_OPEN, OPEN, target_health
+                from app.tracing import UNSAMPLED
+
+                target = "https://qyapi.weixin.qq.com/cgi-bin/webhook/send?key=probe-demo"
+                payload = {"msgtype": "text", "text": {"content": "hi"}}
+                answers = []
+
+                class FakeClient:
+                    async def post(self, url, json=None, **kwargs):
+                        answer = answers.pop(0)
+                        if isinstance(answer, BaseException):
+                            raise answer
+                        return httpx.Response(status_code=200, text=answer)
+
+                def send():
+                    return asyncio.run(main_module._send_to_target(FakeClient(), target, payload, None, UNSAMPLED))
+
+                breaker = target_health.breaker(target, main_module.mask_webhook(target))
+                breaker.state, breaker.opened_at = OPEN, 0.0
+                answers.append(asyncio.CancelledError())
+                with self.assertRaises(asyncio.CancelledError):
+                    send()
+                self.assertEqual((breaker.state, breaker.probe_in_flight), (HALF_OPEN, False))
+
+                # The next probe is skipped by the rate budget (1/min, spent by the cancelled send)
+                # and still handed back; WeCom's 45009 answers leave the breaker as it was.
+                skipped = send()
+                self.assertEqual(skipped["error_message"].split(":")[0], "rate limited")
+                self.assertFalse(breaker.probe_in_flight)
+
+                main_module.rate_budget.per_minute = 0
+                answers.extend(['{"errcode":45009,"errmsg":"api freq out of limit"}'] * 3 + ['{"errcode":0}'])
+                for _ in range(3):
+                    send()
+                self.assertEqual(breaker.state, HALF_OPEN)
+                send()
+                self.assertEqual((breaker.state, list(breaker.outcomes)), (CLOSED, []))
+
+                # While half-open only the probe's own result counts: a late send that started
+                # before the circuit opened cannot close or re-open it.
+                breaker.state, breaker.probe_in_flight = HALF_OPEN, True
+                breaker.record(False, 0.1, "late failure")
+                breaker.record(True, 0.1)
+                self.assertEqual((breaker.state, breaker.probe_in_flight), (HALF_OPEN, True))
+                breaker.record(True, 0.1, probe=True)
+                self.assertEqual((breaker.state, breaker.probe_in_flight), (CLOSED, False))
+
+                # An open breaker skips before the rate budget, so skips do not spend it.
+                main_module.rate_budget.per_minute = 1
+                main_module.rate_budget._sent.clear()
+                breaker.state, breaker.opened_at = OPEN, time.monotonic()
+                with patch("app.health.settings.circuit_cooldown_seconds", 3600):
+                    self.assertEqual(send()["error_message"], "circuit open: target skipped")
+                self.assertEqual(main_module.rate_budget._sent.get(target, []), [])
+
+    def test_output_templates_render_once_per_signal_in_sandbox(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            db_file = os.path.join(tmpdir, "test_templates.db")
+            env = {
+                "DATABASE_URL": f"sqlite:///{db_file}",
+                "INBOUND_TOKEN": "test-token",
+                "ADMIN_USERNAME": "admin",
+                "ADMIN_PASSWORD": "admin-pass",
+                "SESSION_SECRET": "test-session-secret",
+                "FERNET_KEY": "",
+            }
+
+            with patch.dict(os.environ, env, clear=False):
+                _reload_app_modules()
+
+                from app import metrics
+                from app.db import engine, init_db
+                from app.main import app
+                from app.models import Delivery
+                from app.security import build_csrf_token
+
+                init_db()
+                summary = "**{{ symbol }}** {{ side }} @ {{ price }}\n来源: {{ source }}"
+                sent = []
+
+                async def fake_post(self, url, json=None, **kwargs):
+                    sent.append((url, json))
+                    return httpx.Response(status_code=200, text='{"errcode":0}')
+
+                def rule_form(name, key, template, msgtype="markdown"):
+                    return {
+                        "csrf_token": build_csrf_token("admin"),
+                        "name": name,
+                        "enabled": "on",
+                        "condition_type": "always",
+                        "target_urls": f"https://qyapi.weixin.qq.com/cgi-bin/webhook/send?key={key}",
+                        "output_template": template,
+                        "output_msgtype": msgtype,
+                    }
+
+                payload = {"msgtype": "text", "text": {"content": "symbol=BTCUSDT\nside=BUY\nprice=62000"}, "source": "tv"}
+                renders_before = metrics.template_render_seconds.count()
+                with patch.object(httpx.AsyncClient, "post", new=fake_post):
+                    with TestClient(app) as client:
+                        client.post("/admin/login", data={"username": "admin", "password": "admin-pass"})
+                        bad_syntax = client.post("/admin/rules", data=rule_form("坏模板", "bad", "{{ symbol "))
+                        for name, key, template in [
+                            ("摘要A", "summary-a", summary),
+                            ("摘要B", "summary-b", summary),
+                            ("越权", "escape", "{{ ''.__class__.__mro__[1].__subclasses__() }}"),
+                            ("原样", "raw", ""),
+                        ]:
+                            client.post("/admin/rules", data=rule_form(name, key, template), follow_redirects=False)
+                        resp = client.post("/webhook/test-token", json=payload)
+                        edit_page = client.get("/admin/rules/1/edit")
+
+                self.assertEqual(bad_syntax.status_code, 400)
+                self.assertEqual(resp.json()["delivery_count"], 4)
+                self.assertIn("{{ symbol }}", edit_page.text)
+                sent_by_key = {url.rsplit("=", 1)[1]: body for url, body in sent}
+                self.assertEqual(set(sent_by_key), {"summary-a", "summary-b", "raw"})
+                expected = {"msgtype": "markdown", "markdown": {"content": "**BTCUSDT** BUY @ 62000\n来源: tv"}}
+                self.assertEqual(sent_by_key["summary-a"], expected)
+                self.assertEqual(sent_by_key["summary-b"], expected)
+                self.assertEqual(sent_by_key["raw"], payload)
+                # The shared template renders once; the sandbox-rejected one is attempted once.
+                self.assertEqual(metrics.template_render_seconds.count() - renders_before, 2)
+
+                with Session(engine) as session:
+                    escaped = session.exec(select(Delivery).where(Delivery.success == False)).all()  # noqa: E712
+                self.assertEqual(len(escaped), 1)
+                self.assertTrue(escaped[0].error_message.startswith("template error"))
+
+
+    def test_startup_skips_current_schema_and_keeps_admin_modules_lazy(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            db_file = os.path.join(tmpdir, "test_startup.db")
+            env = {"DATABASE_URL": f"sqlite:///{db_file}", "INBOUND_TOKEN": "test-token", "FERNET_KEY": ""}
+
+            with patch.dict(os.environ, env, clear=False):
+                _reload_app_modules()
+
+                import app.main  # noqa: F401
+                from app.db import init_db
+
+                init_db()
+                with patch.object(SQLModel.metadata, "create_all") as create_all:
+                    init_db()
+                create_all.assert_not_called()
+
+                probe = (
+                    "import sys, app.main; "
+                    "print(','.join(m for m in ('jinja2', 'itsdangerous', 'app.replay', 'app.profiling', "
+                    "'concurrent.futures.process') if m in sys.modules))"
+                )
+                root_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+                result = subprocess.run(
+                    [sys.executable, "-c", probe], cwd=root_dir, env=dict(os.environ), capture_output=True, text=True
+                )
+                self.assertEqual(result.returncode, 0, result.stderr)
+                self.assertEqual(result.stdout.strip(), "")
+
+
+    def test_migrations_upgrade_legacy_database_with_online_indexes(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            db_file = os.path.join(tmpdir, "test_migrations.db")
+            env = {"DATABASE_URL": f"sqlite:///{db_file}", "INBOUND_TOKEN": "test-token", "FERNET_KEY": ""}
+
+            with patch.dict(os.environ, env, clear=False):
+                _reload_app_modules()
+
+                from sqlalchemy import inspect
+
+                from app.db import engine, init_db
+                from app.migrations import MIGRATIONS, applied_versions, backfill_in_batches, pending_migrations, upgrade
+
+                # Schema as created by create_all before migrations existed.
+                with engine.begin() as conn:
+                    conn.execute(
+                        text(
+                            "CREATE TABLE signal (id INTEGER PRIMARY KEY, received_at DATETIME NOT NULL, "
+                            "source VARCHAR(100), raw_payload VARCHAR NOT NULL, parsed_fields VARCHAR NOT NULL, "
+                            "match_count INTEGER NOT NULL, delivery_count INTEGER NOT NULL)"
+                        )
+                    )
+                    conn.execute(
+                        text(
+                            "CREATE TABLE rule (id INTEGER PRIMARY KEY, name VARCHAR(100) NOT NULL, "
+                            "enabled BOOLEAN NOT NULL, priority INTEGER NOT NULL, conditions_json VARCHAR NOT NULL, "
+                            "action_json VARCHAR NOT NULL, created_at DATETIME NOT NULL, updated_at DATETIME NOT NULL)"
+                        )
+                    )
+                    conn.execute(text("CREATE UNIQUE INDEX ix_rule_name ON rule (name)"))
+                    conn.execute(
+                        text(
+                            "CREATE TABLE delivery (id INTEGER PRIMARY KEY, signal_id INTEGER NOT NULL, "
+                            "rule_id INTEGER NOT NULL, target_masked VARCHAR(255) NOT NULL, "
+                            "target_encrypted VARCHAR NOT NULL, request_payload VARCHAR NOT NULL, "
+                            "response_status INTEGER, response_body VARCHAR, success BOOLEAN NOT NULL, "
+                            "error_message VARCHAR, created_at DATETIME NOT NULL)"
+                        )
+                    )
+                    for index in range(25):
+                        conn.execute(
+                            text(
+                                "INSERT INTO signal (received_at, source, raw_payload, parsed_fields, match_count, "
+                                "delivery_count) VALUES ('2026-02-01 00:00:00', NULL, '{}', '{}', 0, 0)"
+                            )
+                        )
+                    conn.execute(
+                        text(
+                            "INSERT INTO rule (name, enabled, priority, conditions_json, action_json, created_at, "
+                            "updated_at) VALUES ('legacy', 1, 0, '{}', '{}', '2026-02-01 00:00:00', '2026-02-01 00:00:00')"
+                        )
+                    )
+                    for created_at, success in [("00:10", 1), ("00:50", 0), ("01:05", 1)]:
+                        conn.execute(
+                            text(
+                                "INSERT INTO delivery (signal_id, rule_id, target_masked, target_encrypted, "
+                                "request_payload, success, created_at) "
+                                f"VALUES (1, 1, 'legacy***', '', '', {success}, '2026-02-01 {created_at}:00.000000')"
+                            )
+                        )
+
+                init_db()
+                # An old worker keeps routing after the migration, without rollups; the catch-up
+                # folds that row once, however often it runs.
+                from app.rollups import fold_pending_rollups
+
+                with engine.begin() as conn:
+                    conn.execute(
+                        text(
+                            "INSERT INTO delivery (signal_id, rule_id, target_masked, target_encrypted, "
+                            "request_payload, success, created_at) "
+                            "VALUES (1, 1, 'legacy***', '', '', 0, '2026-02-01 01:30:00.000000')"
+                        )
+                    )
+                self.assertEqual(fold_pending_rollups(engine), 1)
+                self.assertEqual(fold_pending_rollups(engine), 0)
+                with engine.connect() as conn:
+                    rollups = conn.execute(
+                        text("SELECT bucket_start, total, failure FROM deliveryrollup ORDER BY bucket_start")
+                    ).all()
+                self.assertEqual([(row.total, row.failure) for row in rollups], [(2, 1), (2, 1)])
+                inspector = inspect(engine)
+                self.assertIn("trace_json", {column["name"] for column in inspector.get_columns("signal")})
+                self.assertIn("duration_ms", {column["name"] for column in inspector.get_columns("delivery")})
+                self.assertNotIn("ix_signal_received_at", {index["name"] for index in inspector.get_indexes("signal")})
+                self.assertEqual([item.version for item in pending_migrations(engine)], [3, 4, 7, 12])
+
+                applied = upgrade()
+                self.assertEqual([item.version for item in applied], [3, 4, 7, 12])
+                self.assertEqual(applied_versions(engine), {item.version for item in MIGRATIONS})
+                signal_indexes = {index["name"] for index in inspect(engine).get_indexes("signal")}
+                self.assertTrue({"ix_signal_received_at", "ix_signal_source"} <= signal_indexes)
+                self.assertEqual(upgrade(), [])
+                with engine.connect() as conn:
+                    self.assertEqual(conn.execute(text("SELECT lane FROM rule")).scalar_one(), "normal")
+                rule_indexes = {index["name"]: index["unique"] for index in inspect(engine).get_indexes("rule")}
+                self.assertEqual((bool(rule_indexes["ix_rule_name"]), bool(rule_indexes["uq_rule_live_name"])), (False, True))
+
+                with patch("app.migrations.BACKFILL_PAUSE_SECONDS", 0):
+                    updated = backfill_in_batches(engine, "signal", "source = 'legacy'", "source IS NULL", batch_size=10)
+                self.assertEqual(updated, 25)
+
+    def test_admin_pages_use_cached_rule_views_and_conditional_get(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            db_file = os.path.join(tmpdir, "test_etag.db")
+            env = {
+                "DATABASE_URL": f"sqlite:///{db_file}",
+                "INBOUND_TOKEN": "test-token",
+                "ADMIN_USERNAME": "admin",
+                "ADMIN_PASSWORD": "admin-pass",
+                "SESSION_SECRET": "test-session-secret",
+                "FERNET_KEY": "",
+            }
+
+            with patch.dict(os.environ, env, clear=False):
+                _reload_app_modules()
+
+                from datetime import datetime
+
+                import app.main as main_module
+                from app.db import engine, init_db
+                from app.models import Rule, Signal
+                from app.security import build_csrf_token, decrypt_text, encrypt_text
+
+                init_db()
+                with Session(engine) as session:
+                    rule = Rule(
+                        name="保底转发",
+                        conditions_json=json.dumps({"op": "and", "items": [{"type": "always"}]}),
+                        action_json=json.dumps(
+                            {
+                                "type": "forward_wecom_webhooks",
+                                "targets": [encrypt_text("https://qyapi.weixin.qq.com/cgi-bin/webhook/send?key=etag-demo-key")],
+                            }
+                        ),
+                    )
+                    session.add(rule)
+                    session.commit()
+                    rule_id = rule.id
+
+                async def fake_post(self, url, json=None, **kwargs):
+                    return httpx.Response(status_code=200, text='{"errcode":0}')
+
+                decrypt_calls = []
+
+                def counting_decrypt(value):
+                    decrypt_calls.append(value)
+                    return decrypt_text(value)
+
+                with patch.object(httpx.AsyncClient, "post", new=fake_post), patch(
+                    "app.main.decrypt_text", side_effect=counting_decrypt
+                ):
+                    with TestClient(main_module.app) as client:
+                        client.post("/admin/login", data={"username": "admin", "password": "admin-pass"})
+                        first = client.get("/admin/rules")
+                        etag = first.headers["etag"]
+                        repeat = client.get("/admin/rules", headers={"If-None-Match": etag})
+                        edit_page = client.get(f"/admin/rules/{rule_id}/edit")
+                        decrypts_after_pages = len(decrypt_calls)
+                        client.post(
+                            f"/admin/rules/{rule_id}/toggle",
+                            data={"csrf_token": build_csrf_token("admin")},
+                            follow_redirects=False,
+                        )
+                        after_toggle = client.get("/admin/rules", headers={"If-None-Match": etag})
+
+                        signals_first = client.get("/admin/signals")
+                        signals_etag = signals_first.headers["etag"]
+                        signals_repeat = client.get("/admin/signals", headers={"If-None-Match": signals_etag})
+                        client.post("/webhook/test-token", json={"msgtype": "text", "text": {"content": "hi"}})
+                        signals_after = client.get("/admin/signals", headers={"If-None-Match": signals_etag})
+                        detail = client.get("/admin/signals/1")
+                        detail_repeat = client.get("/admin/signals/1", headers={"If-None-Match": detail.headers["etag"]})
+                        # A later routing result without any delivery row (e.g. a match whose
+                        # targets are all invalid) must still invalidate the history page.
+                        routed_etag = signals_after.headers["etag"]
+                        with Session(engine) as session:
+                            signal = session.get(Signal, 1)
+                            first_routed_at = signal.routed_at
+                            signal.match_count, signal.routed_at = 1, datetime.utcnow()
+                            session.add(signal)
+                            session.commit()
+                        rerouted = client.get("/admin/signals", headers={"If-None-Match": routed_etag})
+
+                self.assertEqual(first.status_code, 200)
+                self.assertNotIn("etag-demo-key", first.text)
+                self.assertEqual(repeat.status_code, 304)
+                self.assertEqual(repeat.content, b"")
+                self.assertEqual(edit_page.status_code, 200)
+                self.assertIn("key=etag-demo-key", edit_page.text)
+                # Rules page, 304 and edit page share one decryption of the single target.
+                self.assertEqual(decrypts_after_pages, 1)
+                self.assertEqual(after_toggle.status_code, 200)
+                self.assertNotEqual(after_toggle.headers["etag"], etag)
+                self.assertEqual(signals_repeat.status_code, 304)
+                self.assertEqual(signals_after.status_code, 200)
+                self.assertEqual(detail_repeat.status_code, 304)
+                self.assertIsNotNone(first_routed_at)
+                self.assertEqual(rerouted.status_code, 200)
+
+    def test_live_stream_publishes_committed_signals_and_drops_slow_viewers(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            db_file = os.path.join(tmpdir, "test_live.db")
+            env = {
+                "DATABASE_URL": f"sqlite:///{db_file}",
+                "INBOUND_TOKEN": "test-token",
+                "ADMIN_USERNAME": "admin",
+                "ADMIN_PASSWORD": "admin-pass",
+                "SESSION_SECRET": "test-session-secret",
+                "FERNET_KEY": "",
+                "LIVE_BUFFER_SIZE": "8",
+            }
+
+            with patch.dict(os.environ, env, clear=False):
+                _reload_app_modules()
+
+                import app.main as main_module
+                from app import metrics
+                from app.db import engine, init_db
+                from app.live import Broadcaster
+                from app.models import Rule
+                from app.security import encrypt_text
+
+                init_db()
+                with Session(engine) as session:
+                    session.add(
+                        Rule(
+                            name="保底转发",
+                            conditions_json=json.dumps({"op": "and", "items": [{"type": "always"}]}),
+                            action_json=json.dumps(
+                                {
+                                    "type": "forward_wecom_webhooks",
+                                    "targets": [encrypt_text("https://qyapi.weixin.qq.com/cgi-bin/webhook/send?key=live-demo")],
+                                }
+                            ),
+                        )
+                    )
+                    session.commit()
+
+                async def fake_post(self, url, json=None, **kwargs):
+                    return httpx.Response(status_code=200, text='{"errcode":0}')
+
+                def drain(subscriber):
+                    frames = []
+                    while not subscriber.queue.empty():
+                        frame = subscriber.queue.get_nowait()
+                        event_line, data_line = frame.strip().split("\n")
+                        frames.append((event_line[len("event: ") :], json.loads(data_line[len("data: ") :])))
+                    return frames
+
+                viewer = main_module.broadcaster.subscribe()
+                with patch.object(httpx.AsyncClient, "post", new=fake_post):
+                    with TestClient(main_module.app) as client:
+                        anonymous = client.get("/admin/signals/stream")
+                        client.post("/webhook/test-token", json={"msgtype": "text", "text": {"content": "one"}})
+                        client.post(
+                            "/webhook/test-token/batch",
+                            json=[{"msgtype": "text", "text": {"content": "two"}, "source": "batch"}],
+                        )
+                        client.post("/admin/login", data={"username": "admin", "password": "admin-pass"})
+                        page = client.get("/admin/signals")
+                main_module.broadcaster.unsubscribe(viewer)
+                events = drain(viewer)
+
+                broadcaster = Broadcaster()
+                fast = broadcaster.subscribe()
+                slow = broadcaster.subscribe()
+                dropped_before = metrics.live_dropped_total.value()
+                for signal_id in range(1, 11):
+                    broadcaster.publish({"type": "signal", "id": signal_id})
+                    broadcaster.publish({"type": "signal", "id": signal_id})
+                    drain(fast)
+
+            self.assertEqual(anonymous.status_code, 401)
+            self.assertIn('id="liveToggle"', page.text)
+            self.assertEqual(
+                [(name, data["id"]) for name, data in events],
+                [("signal", 1), ("routed", 1), ("signal", 2), ("routed", 2)],
+            )
+            self.assertEqual(events[2][1]["source"], "batch")
+            routed = events[1][1]
+            self.assertEqual((routed["match_count"], routed["delivery_count"]), (1, 1))
+            self.assertTrue(routed["deliveries"][0]["success"])
+            self.assertNotIn("live-demo", routed["deliveries"][0]["target"])
+            # Duplicates are sent once; the viewer that never reads is cut off at its buffer size.
+            self.assertFalse(fast.dropped)
+            self.assertTrue(slow.dropped)
+            self.assertEqual(broadcaster.subscriber_count, 1)
+            self.assertEqual(metrics.live_dropped_total.value() - dropped_before, 1)
+
+    def test_delivery_rollups_back_stats_and_are_purged_with_rule(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            db_file = os.path.join(tmpdir, "test_rollups.db")
+            env = {
+                "DATABASE_URL": f"sqlite:///{db_file}",
+                "INBOUND_TOKEN": "test-token",
+                "ADMIN_USERNAME": "admin",
+                "ADMIN_PASSWORD": "admin-pass",
+                "SESSION_SECRET": "test-session-secret",
+                "FERNET_KEY": "",
+            }
+
+            with patch.dict(os.environ, env, clear=False):
+                _reload_app_modules()
+
+                import app.main as main_module
+                from app.db import engine, init_db
+                from app.maintenance import purge_rule_deliveries
+                from app.models import DeliveryRollup, Rule
+                from app.rollups import fold_pending_rollups
+                from app.security import encrypt_text
+
+                init_db()
+                with Session(engine) as session:
+                    rule = Rule(
+                        name="保底转发",
+                        conditions_json=json.dumps({"op": "and", "items": [{"type": "always"}]}),
+                        action_json=json.dumps(
+                            {
+                                "type": "forward_wecom_webhooks",
+                                "targets": [
+                                    encrypt_text("https://qyapi.weixin.qq.com/cgi-bin/webhook/send?key=stats-ok"),
+                                    encrypt_text("https://qyapi.weixin.qq.com/cgi-bin/webhook/send?key=stats-bad"),
+                                ],
+                            }
+                        ),
+                    )
+                    session.add(rule)
+                    session.commit()
+                    rule_id = rule.id
+
+                async def fake_post(self, url, json=None, **kwargs):
+                    if url.endswith("stats-bad"):
+                        return httpx.Response(status_code=500, text="error")
+                    return httpx.Response(status_code=200, text='{"errcode":0}')
+
+                message = {"msgtype": "text", "text": {"content": "hi"}}
+                with patch.object(httpx.AsyncClient, "post", new=fake_post):
+                    with TestClient(main_module.app) as client:
+                        client.post("/webhook/test-token", json=message)
+                        client.post("/webhook/test-token/batch", json=[message, message])
+                        client.post("/admin/login", data={"username": "admin", "password": "admin-pass"})
+                        by_target = client.get("/admin/api/stats").json()
+                        by_rule = client.get("/admin/api/stats", params={"group": "rule"}).json()
+                        bad_group = client.get("/admin/api/stats", params={"group": "signal"})
+                        page = client.get("/admin/stats")
+
+                # Routed deliveries were rolled up in their own commit; the catch-up skips them.
+                self.assertEqual(fold_pending_rollups(engine, settle_seconds=0), 0)
+                with Session(engine) as session:
+                    rollup_rows = session.exec(select(DeliveryRollup)).all()
+                    rule = session.get(Rule, rule_id)
+                    rule.delete_mode = "purge"
+                    session.add(rule)
+                    session.commit()
+                with patch("app.maintenance.PURGE_CHUNK_PAUSE_SECONDS", 0):
+                    purge_rule_deliveries(rule_id)
+                with Session(engine) as session:
+                    remaining = session.exec(select(DeliveryRollup)).all()
+
+            # Three signals x two targets fold into one row per target for the hour.
+            self.assertEqual(len(rollup_rows), 2)
+            self.assertEqual(
+                sorted((item["total"], item["success"], item["failure"]) for item in by_target["items"]),
+                [(3, 0, 3), (3, 3, 0)],
+            )
+            self.assertNotIn("stats-bad", json.dumps(by_target))
+            self.assertEqual([sum(item["latency_histogram"].values()) for item in by_target["items"]], [3, 3])
+            self.assertEqual(by_rule["items"][0]["total"], 6)
+            self.assertEqual(by_rule["items"][0]["failure_rate"], 50.0)
+            self.assertEqual(bad_group.status_code, 400)
+            self.assertEqual(page.status_code, 200)
+            self.assertIn("保底转发", page.text)
+            self.assertEqual(remaining, [])
+
+    def test_lane_scheduler_prefers_urgent_and_shares_rest_by_weight(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            db_file = os.path.join(tmpdir, "test_lanes.db")
+            env = {
+                "DATABASE_URL": f"sqlite:///{db_file}",
+                "INBOUND_TOKEN": "test-token",
+                "ADMIN_USERNAME": "admin",
+                "ADMIN_PASSWORD": "admin-pass",
+                "SESSION_SECRET": "test-session-secret",
+                "FERNET_KEY": "",
+                "WECOM_RATE_LIMIT_PER_MINUTE": "20",
+                "WEB_CONCURRENCY": "4",
+            }
+
+            with patch.dict(os.environ, env, clear=False):
+                _reload_app_modules()
+
+                import asyncio
+
+                import app.main as main_module
+                from app import metrics
+                from app.db import engine, init_db
+                from app.lanes import LaneScheduler, RateBudget
+                from app.models import Rule
+                from app.security import build_csrf_token
+
+                async def scenario():
+                    scheduler = LaneScheduler(slots=2, reserved=1)
+                    order = []
+                    release = asyncio.Event()
+
+                    async def send(lane, name):
+                        async with scheduler.slot(lane):
+                            order.append(name)
+                            await release.wait()
+
+                    # One bulk send holds the only non-reserved slot; everything else queues.
+                    tasks = [asyncio.create_task(send("bulk", "bulk-0"))]
+                    await asyncio.sleep(0)
+                    tasks += [asyncio.create_task(send("bulk", f"bulk-{i}")) for i in range(1, 4)]
+                    tasks += [asyncio.create_task(send("normal", f"normal-{i}")) for i in range(4)]
+                    await asyncio.sleep(0)
+                    depth = metrics.lane_queue_depth.value("normal")
+                    tasks.append(asyncio.create_task(send("urgent", "urgent-0")))
+                    await asyncio.sleep(0)
+                    urgent_started = "urgent-0" in order
+                    release.set()
+                    await asyncio.gather(*tasks)
+                    return order, depth, urgent_started
+
+                order, depth, urgent_started = asyncio.run(scenario())
+
+                budget = RateBudget(per_minute=20, reserve=5)
+                normal_sent = sum(budget.try_acquire("robot", "normal", now=0.0) for _ in range(20))
+                urgent_sent = sum(budget.try_acquire("robot", "urgent", now=1.0) for _ in range(20))
+                after_window = budget.try_acquire("robot", "bulk", now=61.0)
+
+                async def deferred_sends():
+                    # Over budget, a normal send waits for the window instead of being dropped.
+                    short = RateBudget(per_minute=2, reserve=1, window=0.2)
+                    started = time.monotonic()
+                    results = [await short.acquire("robot", "normal", max_wait=1.0) for _ in range(2)]
+                    waited = time.monotonic() - started
+                    results.append(await short.acquire("robot", "normal", max_wait=0.05))
+                    return results, waited
+
+                deferred, waited = asyncio.run(deferred_sends())
+                worker_share = (main_module.rate_budget.per_minute, main_module.rate_budget.reserve)
+
+                init_db()
+                with TestClient(main_module.app) as client:
+                    client.post("/admin/login", data={"username": "admin", "password": "admin-pass"})
+                    form = {
+                        "name": "交易信号",
+                        "enabled": "on",
+                        "priority": "10",
+                        "condition_type": "always",
+                        "target_urls": "https://qyapi.weixin.qq.com/cgi-bin/webhook/send?key=lane-demo",
+                        "csrf_token": build_csrf_token("admin"),
+                    }
+                    created = client.post("/admin/rules", data={**form, "lane": "urgent"}, follow_redirects=False)
+                    invalid = client.post("/admin/rules", data={**form, "name": "x", "lane": "vip"})
+                    rules_page = client.get("/admin/rules")
+                with Session(engine) as session:
+                    stored_lane = session.exec(select(Rule.lane)).one()
+                    compiled = main_module._load_compiled_rules(session)
+
+            # The urgent send takes the reserved slot while lower lanes are still queued.
+            self.assertTrue(urgent_started)
+            self.assertEqual(depth, 4)
+            self.assertEqual(order[:2], ["bulk-0", "urgent-0"])
+            # Remaining normal:bulk sends are interleaved 3:1 instead of first come, first served.
+            self.assertEqual(order[2:6], ["normal-0", "normal-1", "bulk-1", "normal-2"])
+            self.assertEqual((normal_sent, urgent_sent, after_window), (15, 5, True))
+            self.assertEqual(deferred, [True, True, False])
+            self.assertGreaterEqual(waited, 0.15)
+            # Four workers split the robot's 20/minute (and the urgent reserve) between them.
+            self.assertEqual(worker_share, (5, 1))
+            self.assertEqual(created.status_code, 303)
+            self.assertEqual(invalid.status_code, 400)
+            self.assertIn("紧急", rules_page.text)
+            self.assertEqual(stored_lane, "urgent")
+            self.assertEqual(compiled[0].lane, "urgent")
+
+    def test_source_bound_tokens_scope_rules_through_partitioned_index(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            db_file = os.path.join(tmpdir, "test_sources.db")
+            env = {
+                "DATABASE_URL": f"sqlite:///{db_file}",
+                "INBOUND_TOKEN": "test-token",
+                "INBOUND_TOKENS": "strategy:strategy-token, news:news-token",
+                "ADMIN_USERNAME": "admin",
+                "ADMIN_PASSWORD": "admin-pass",
+                "SESSION_SECRET": "test-session-secret",
+                "FERNET_KEY": "",
+            }
+
+            with patch.dict(os.environ, env, clear=False):
+                _reload_app_modules()
+
+                import app.main as main_module
+                from app import metrics
+                from app.db import engine, init_db
+                from app.models import Rule, Signal
+                from app.security import build_csrf_token, encrypt_text
+
+                init_db()
+                with Session(engine) as session:
+                    for name, priority, sources in [("保底", 0, None), ("策略", 10, "strategy"), ("资讯", 5, "news,risk")]:
+                        session.add(
+                            Rule(
+                                name=name,
+                                priority=priority,
+                                sources=sources,
+                                conditions_json=json.dumps({"op": "and", "items": [{"type": "always"}]}),
+                                action_json=json.dumps(
+                                    {
+                                        "type": "forward_wecom_webhooks",
+                                        "targets": [encrypt_text("https://qyapi.weixin.qq.com/cgi-bin/webhook/send?key=src")],
+                                    }
+                                ),
+                            )
+                        )
+                    session.commit()
+                    rule_ids = {rule.name: rule.id for rule in session.exec(select(Rule)).all()}
+
+                async def fake_post(self, url, json=None, **kwargs):
+                    return httpx.Response(status_code=200, text='{"errcode":0}')
+
+                strategy_before = metrics.ingest_token_signals_total.value("strategy")
+                default_before = metrics.ingest_token_signals_total.value("default")
+                message = {"msgtype": "text", "text": {"content": "hi"}, "source": "news"}
+                with patch.object(httpx.AsyncClient, "post", new=fake_post):
+                    with TestClient(main_module.app) as client:
+                        strategy = client.post("/webhook/strategy-token", json=message).json()
+                        legacy = client.post("/webhook/test-token", json=message).json()
+                        batch = client.post("/webhook/news-token/batch", json=[message, {**message, "source": "x"}]).json()
+                        unknown = client.post("/webhook/strategy", json=message)
+                        client.post("/admin/login", data={"username": "admin", "password": "admin-pass"})
+                        client.post(
+                            "/admin/rules",
+                            data={
+                                "name": "风控",
+                                "enabled": "on",
+                                "sources": "risk，news  risk",
+                                "condition_type": "always",
+                                "target_urls": "https://qyapi.weixin.qq.com/cgi-bin/webhook/send?key=risk",
+                                "csrf_token": build_csrf_token("admin"),
+                            },
+                        )
+                    with Session(engine) as session:
+                        index = main_module.rule_cache.get(session, main_module._load_rule_index)
+                        stored_sources = session.exec(select(Rule.sources).where(Rule.name == "风控")).one()
+                        signal_sources = session.exec(select(Signal.source).order_by(Signal.id)).all()
+
+                with patch.dict(os.environ, {"INBOUND_TOKENS": "broken"}):
+                    _reload_app_modules()
+                    import app.main as broken_main
+
+                    with self.assertRaises(RuntimeError):
+                        broken_main.on_startup()
+
+            # The strategy token pins the source even though the payload claims "news".
+            self.assertEqual(strategy["matched_rule_ids"], [rule_ids["策略"], rule_ids["保底"]])
+            self.assertEqual(legacy["matched_rule_ids"], [rule_ids["资讯"], rule_ids["保底"]])
+            self.assertEqual([item["matched_rule_ids"] for item in batch["results"]], [[rule_ids["资讯"], rule_ids["保底"]]] * 2)
+            self.assertEqual(signal_sources, ["strategy", "news", "news", "news"])
+            self.assertEqual(unknown.status_code, 401)
+            self.assertEqual(metrics.ingest_token_signals_total.value("strategy") - strategy_before, 1)
+            self.assertEqual(metrics.ingest_token_signals_total.value("default") - default_before, 1)
+            self.assertEqual(sorted(index.partitions), ["news", "risk", "strategy"])
+            self.assertEqual([rule.id for rule in index.rules_for("unknown")], [rule_ids["保底"]])
+            self.assertEqual(stored_sources, "risk,news")
+
+    def test_large_payloads_are_prepared_off_loop_and_reuse_stored_ciphertext(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            db_file = os.path.join(tmpdir, "test_offload.db")
+            env = {
+                "DATABASE_URL": f"sqlite:///{db_file}",
+                "INBOUND_TOKEN": "test-token",
+                "FERNET_KEY": "",
+                "OFFLOAD_THREAD_MIN_BYTES": "2048",
+                "OFFLOAD_PROCESS_MIN_BYTES": "65536",
+                "OFFLOAD_WORKERS": "1",
+            }
+
+            with patch.dict(os.environ, env, clear=False):
+                _reload_app_modules()
+
+                import app.main as main_module
+                from app import metrics
+                from app.db import engine, init_db
+                from app.models import Delivery, Rule, Signal
+                from app.security import encrypt_text
+
+                init_db()
+                target_encrypted = encrypt_text("https://qyapi.weixin.qq.com/cgi-bin/webhook/send?key=offload")
+                with Session(engine) as session:
+                    session.add(
+                        Rule(
+                            name="图片",
+                            conditions_json=json.dumps({"op": "and", "items": [{"type": "contains_text", "text": "SYMBOL"}]}),
+                            action_json=json.dumps({"type": "forward_wecom_webhooks", "targets": [target_encrypted]}),
+                        )
+                    )
+                    session.commit()
+
+                async def fake_post(self, url, json=None, **kwargs):
+                    return httpx.Response(status_code=200, text='{"errcode":0}')
+
+                small = {"msgtype": "text", "text": {"content": "symbol=BTC"}}
+                medium = {"msgtype": "text", "text": {"content": "symbol=ETH\n" + "x" * 4096}}
+                large = {"msgtype": "image", "image": {"base64": "A" * 100000, "md5": "m"}, "note": "symbol"}
+                before = {kind: metrics.offload_total.value(kind) for kind in ("inline", "thread", "process")}
+                with patch.object(httpx.AsyncClient, "post", new=fake_post):
+                    with TestClient(main_module.app) as client:
+                        responses = [client.post("/webhook/test-token", json=item).json() for item in (small, medium, large)]
+                        batch = client.post("/webhook/test-token/batch", json=[medium, medium]).json()
+                        time.sleep(0.25)
+                        lag_count = metrics.event_loop_lag_seconds.count()
+                        after = {kind: metrics.offload_total.value(kind) - before[kind] for kind in before}
+                        ndjson = client.post(
+                            "/webhook/test-token/batch",
+                            content=(json.dumps(small) + "\n" + json.dumps(large) + "\n").encode("utf-8"),
+                            headers={"Content-Type": "application/x-ndjson"},
+                        ).json()
+                ndjson_offloads = {kind: metrics.offload_total.value(kind) - before[kind] - after[kind] for kind in before}
+
+                with Session(engine) as session:
+                    deliveries = session.exec(select(Delivery).order_by(Delivery.id)).all()
+                    signals = {signal.id: signal for signal in session.exec(select(Signal)).all()}
+
+            self.assertEqual([item["delivery_count"] for item in responses], [1, 1, 1])
+            self.assertEqual([item["delivery_count"] for item in batch["results"]], [1, 1])
+            # small: parse + match inline; medium: parse + match on a thread; large: parse in a
+            # process, match on a thread; batch: array decode, one parse job, one match per item.
+            self.assertEqual(after, {"inline": 2, "thread": 7, "process": 1})
+            # NDJSON: the large line is decoded in a process like the large single body, then
+            # parsed there too; text matching stays inline for the small item, threaded for the large.
+            self.assertEqual([item["delivery_count"] for item in ndjson["results"]], [1, 1])
+            self.assertEqual(ndjson_offloads, {"inline": 1, "thread": 1, "process": 2})
+            self.assertEqual({delivery.target_encrypted for delivery in deliveries}, {target_encrypted})
+            for delivery in deliveries:
+                self.assertEqual(delivery.request_payload, signals[delivery.signal_id].raw_payload)
+            self.assertEqual(json.loads(signals[responses[2]["signal_id"]].raw_payload), large)
+            self.assertEqual(json.loads(signals[responses[2]["signal_id"]].parsed_fields)["note"], "symbol")
+            self.assertGreaterEqual(lag_count, 1)
+
+    def test_admission_control_rate_limits_per_source_and_sheds_on_overload(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            db_file = os.path.join(tmpdir, "test_admission.db")
+            env = {
+                "DATABASE_URL": f"sqlite:///{db_file}",
+                "INBOUND_TOKEN": "test-token",
+                "INBOUND_TOKENS": "noisy:noisy-token,calm:calm-token",
+                "FERNET_KEY": "",
+                "INGEST_SOURCE_RATE_PER_SECOND": "0.5",
+                "INGEST_SOURCE_BURST": "2",
+                "INGEST_RATE_PER_SECOND": "100",
+                "INGEST_BURST": "3",
+                "INGEST_MAX_IN_FLIGHT": "2",
+                "INGEST_SHED_LOOP_LAG_MS": "500",
+                "INGEST_SHED_QUEUE_DEPTH": "1",
+            }
+
+            with patch.dict(os.environ, env, clear=False):
+                _reload_app_modules()
+
+                import app.main as main_module
+                from app import metrics
+                from app.admission import Admission
+                from app.lanes import scheduler as lane_scheduler
+                from app.offload import loop_lag_monitor
+
+                message = {"msgtype": "text", "text": {"content": "hi"}}
+                shed_before = {
+                    reason: metrics.ingest_shed_total.value(reason)
+                    for reason in ("source_rate", "global_rate", "in_flight", "loop_lag", "queue_depth")
+                }
+                with TestClient(main_module.app) as client:
+                    noisy = [client.post("/webhook/noisy-token", json=message) for _ in range(4)]
+                    calm = client.post("/webhook/calm-token/batch", json=[message, message])
+                    loop_lag_monitor.last = 0.8
+                    lagging = client.post("/webhook/calm-token", json=message)
+                    loop_lag_monitor.last = 0.0
+                shed = {reason: metrics.ingest_shed_total.value(reason) - before for reason, before in shed_before.items()}
+                in_flight_after = metrics.ingest_in_flight.value()
+
+                gate = Admission()
+                admitted = [gate.try_enter("calm", now=100.0) for _ in range(2)]
+                in_flight = gate.try_enter("calm", now=100.0)
+                gate.leave()
+                gate.leave()
+                lane_scheduler.waiters["bulk"].append(object())
+                queue_depth = gate.try_enter("calm", now=100.0)
+                lane_scheduler.waiters["bulk"].clear()
+                # Burst 3 globally: two calm sends above, then one noisy, then the global bucket is empty.
+                global_ok = gate.try_enter("noisy", now=100.0)
+                gate.leave()
+                global_limited = gate.try_enter("noisy", now=100.0)
+                refilled = gate.try_enter("noisy", now=100.02)
+
+            self.assertEqual([response.status_code for response in noisy], [200, 200, 429, 429])
+            self.assertEqual(noisy[2].headers["retry-after"], "2")
+            self.assertEqual(calm.status_code, 200)
+            self.assertEqual(lagging.status_code, 503)
+            self.assertEqual(lagging.headers["retry-after"], "1")
+            self.assertEqual(shed["source_rate"], 2)
+            self.assertEqual(shed["loop_lag"], 1)
+            self.assertEqual(in_flight_after, 0)
+
+            self.assertEqual(admitted, [None, None])
+            self.assertEqual((in_flight.status_code, in_flight.reason), (503, "in_flight"))
+            self.assertEqual((queue_depth.status_code, queue_depth.reason), (503, "queue_depth"))
+            self.assertIsNone(global_ok)
+            self.assertEqual((global_limited.status_code, global_limited.reason), (429, "global_rate"))
+            self.assertIsNone(refilled)
+
 
 if __name__ == "__main__":
     unittest.main()